@@ -0,0 +1,176 @@
+# aggregates.py (trigger-maintained sales aggregates behind the reports tab)
+from datetime import datetime
+
+# Per item totals over all history, per day and item (for "last N days" reports),
+# and per weekday/hour of the sale time (for the heatmap). Money in minor units.
+AGGREGATE_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS item_sales_agg (
+        item_id INTEGER PRIMARY KEY,
+        lines INTEGER NOT NULL DEFAULT 0,
+        units REAL NOT NULL DEFAULT 0,
+        revenue INTEGER NOT NULL DEFAULT 0,
+        cost INTEGER NOT NULL DEFAULT 0,
+        last_sold TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS daily_item_sales (
+        day TEXT NOT NULL,
+        item_id INTEGER NOT NULL,
+        lines INTEGER NOT NULL DEFAULT 0,
+        units REAL NOT NULL DEFAULT 0,
+        revenue INTEGER NOT NULL DEFAULT 0,
+        cost INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, item_id)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS hourly_sales (
+        weekday INTEGER NOT NULL,
+        hour INTEGER NOT NULL,
+        sales INTEGER NOT NULL DEFAULT 0,
+        revenue INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (weekday, hour)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS aggregate_state (
+        name TEXT PRIMARY KEY,
+        built_at TEXT
+    )
+    """,
+]
+
+_COST = "CAST(ROUND({r}.quantity * {r}.purchase_price_each) AS INTEGER)"
+_WEEKDAY = "CAST(strftime('%w', {dt}) AS INTEGER)"  # 0 = Sunday
+_HOUR = "CAST(strftime('%H', {dt}) AS INTEGER)"
+
+def _line_effect(r, sign, moved="1"):
+    """
+    Trigger statements adding (sign=1) or removing (sign=-1) sale line r (NEW/OLD).
+    On removal, last_sold is only looked up again when the line was the item's latest
+    sale and the SQL condition moved holds (the line left its item or sale).
+    """
+    cost = _COST.format(r=r)
+    statements = [
+        f"""
+        INSERT INTO item_sales_agg(item_id, lines, units, revenue, cost, last_sold)
+        SELECT {r}.item_id, {sign}, {sign} * {r}.quantity, {sign} * {r}.subtotal, {sign} * {cost}, s.datetime
+        FROM sales s WHERE s.id = {r}.sale_id AND {r}.item_id IS NOT NULL
+        ON CONFLICT(item_id) DO UPDATE SET
+            lines = lines + excluded.lines, units = units + excluded.units,
+            revenue = revenue + excluded.revenue, cost = cost + excluded.cost,
+            last_sold = MAX(COALESCE(last_sold, ''), excluded.last_sold)
+        """,
+        f"""
+        INSERT INTO daily_item_sales(day, item_id, lines, units, revenue, cost)
+        SELECT date(s.datetime), {r}.item_id, {sign}, {sign} * {r}.quantity, {sign} * {r}.subtotal, {sign} * {cost}
+        FROM sales s WHERE s.id = {r}.sale_id AND {r}.item_id IS NOT NULL
+        ON CONFLICT(day, item_id) DO UPDATE SET
+            lines = lines + excluded.lines, units = units + excluded.units,
+            revenue = revenue + excluded.revenue, cost = cost + excluded.cost
+        """,
+        f"""
+        INSERT INTO hourly_sales(weekday, hour, sales, revenue)
+        SELECT {_WEEKDAY.format(dt="s.datetime")}, {_HOUR.format(dt="s.datetime")}, 0, {sign} * {r}.subtotal
+        FROM sales s WHERE s.id = {r}.sale_id
+        ON CONFLICT(weekday, hour) DO UPDATE SET revenue = revenue + excluded.revenue
+        """,
+    ]
+    if sign < 0:
+        statements += [
+            f"DELETE FROM item_sales_agg WHERE item_id = {r}.item_id AND lines <= 0",
+            f"""
+            DELETE FROM daily_item_sales
+            WHERE item_id = {r}.item_id AND lines <= 0
+              AND day = (SELECT date(datetime) FROM sales WHERE id = {r}.sale_id)
+            """,
+            f"""
+            UPDATE item_sales_agg SET last_sold = (
+                SELECT MAX(s.datetime) FROM sale_details sd JOIN sales s ON s.id = sd.sale_id
+                WHERE sd.item_id = {r}.item_id
+            ) WHERE item_id = {r}.item_id AND ({moved})
+              AND last_sold = (SELECT datetime FROM sales WHERE id = {r}.sale_id)
+            """,
+        ]
+    return ";\n".join(statements) + ";"
+
+def _sale_effect(r, sign):
+    """Trigger statement counting (sign=1) or uncounting (sign=-1) sale r in its hour"""
+    return f"""
+        INSERT INTO hourly_sales(weekday, hour, sales, revenue)
+        VALUES ({_WEEKDAY.format(dt=r + ".datetime")}, {_HOUR.format(dt=r + ".datetime")}, {sign}, 0)
+        ON CONFLICT(weekday, hour) DO UPDATE SET sales = sales + excluded.sales;
+    """
+
+TRIGGERS = {
+    "trg_sale_details_agg_insert": f"AFTER INSERT ON sale_details BEGIN {_line_effect('NEW', 1)} END",
+    "trg_sale_details_agg_delete": f"AFTER DELETE ON sale_details BEGIN {_line_effect('OLD', -1)} END",
+    "trg_sale_details_agg_update": (
+        "AFTER UPDATE OF sale_id, item_id, quantity, subtotal, purchase_price_each ON sale_details "
+        f"BEGIN {_line_effect('OLD', -1, 'OLD.item_id IS NOT NEW.item_id OR OLD.sale_id IS NOT NEW.sale_id')} "
+        f"{_line_effect('NEW', 1)} END"
+    ),
+    # Lines are removed while their sale still exists, so the triggers above can read its
+    # time; the ON DELETE CASCADE from sales then finds nothing left to delete
+    "trg_sales_agg_delete_lines": "BEFORE DELETE ON sales BEGIN DELETE FROM sale_details WHERE sale_id = OLD.id; END",
+    "trg_sales_agg_insert": f"AFTER INSERT ON sales BEGIN {_sale_effect('NEW', 1)} END",
+    "trg_sales_agg_delete": f"AFTER DELETE ON sales BEGIN {_sale_effect('OLD', -1)} END",
+}
+
+def install_aggregates(conn):
+    """
+    Create the aggregate tables and their triggers. The triggers are rebuilt on every
+    start so they follow TRIGGERS; aggregates are rebuilt from sale_details only when
+    they were never built, or were reset by a migration.
+    """
+    cur = conn.cursor()
+    for sql in AGGREGATE_SCHEMA:
+        cur.execute(sql)
+    for name, body in TRIGGERS.items():
+        cur.execute(f"DROP TRIGGER IF EXISTS {name}")
+        cur.execute(f"CREATE TRIGGER {name} {body}")
+    cur.execute("SELECT 1 FROM aggregate_state WHERE name = 'sales'")
+    if cur.fetchone() is None:
+        rebuild_aggregates(conn)
+    conn.commit()
+
+def rebuild_aggregates(conn):
+    """Recompute every aggregate table from sale_details and sales in one pass each"""
+    cur = conn.cursor()
+    for table in ("item_sales_agg", "daily_item_sales", "hourly_sales"):
+        cur.execute(f"DELETE FROM {table}")
+    cost = _COST.format(r="sd")
+    cur.execute(f"""
+        INSERT INTO item_sales_agg(item_id, lines, units, revenue, cost, last_sold)
+        SELECT sd.item_id, COUNT(*), TOTAL(sd.quantity), SUM(sd.subtotal), SUM({cost}), MAX(s.datetime)
+        FROM sale_details sd JOIN sales s ON s.id = sd.sale_id
+        WHERE sd.item_id IS NOT NULL
+        GROUP BY sd.item_id
+    """)
+    cur.execute(f"""
+        INSERT INTO daily_item_sales(day, item_id, lines, units, revenue, cost)
+        SELECT date(s.datetime), sd.item_id, COUNT(*), TOTAL(sd.quantity), SUM(sd.subtotal), SUM({cost})
+        FROM sale_details sd JOIN sales s ON s.id = sd.sale_id
+        WHERE sd.item_id IS NOT NULL
+        GROUP BY date(s.datetime), sd.item_id
+    """)
+    cur.execute(f"""
+        INSERT INTO hourly_sales(weekday, hour, sales, revenue)
+        SELECT {_WEEKDAY.format(dt="s.datetime")}, {_HOUR.format(dt="s.datetime")}, COUNT(*),
+               CAST(TOTAL((SELECT TOTAL(subtotal) FROM sale_details WHERE sale_id = s.id)) AS INTEGER)
+        FROM sales s
+        GROUP BY 1, 2
+    """)
+    cur.execute(
+        "INSERT OR REPLACE INTO aggregate_state(name, built_at) VALUES ('sales', ?)",
+        (datetime.now().isoformat(),)
+    )
+
+def reset_aggregates(conn):
+    """Mark the aggregates stale after sales/sale_details were rebuilt; install_aggregates rebuilds them."""
+    cur = conn.cursor()
+    cur.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='aggregate_state'")
+    if cur.fetchone():
+        cur.execute("DELETE FROM aggregate_state WHERE name = 'sales'")
@@ -0,0 +1,79 @@
+# amendments.py (corrections to committed sales: an audit trail of every edited, removed or added line)
+from datetime import datetime
+
+ACTIONS = ("edit", "remove", "add")
+
+# sale_id is a plain reference: the trail outlives a sale that is later deleted or archived.
+# Quantities and prices are the line's values before and after (NULL for an added / removed
+# line); subtotal_delta and cost_delta are what the amendment moved on the sale's totals.
+AMENDMENT_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS sale_amendments (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        sale_id INTEGER NOT NULL,
+        at TEXT NOT NULL,
+        note TEXT,
+        total_delta INTEGER NOT NULL DEFAULT 0,
+        cost_delta INTEGER NOT NULL DEFAULT 0
+    )
+    """,
+    f"""
+    CREATE TABLE IF NOT EXISTS sale_amendment_lines (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        amendment_id INTEGER NOT NULL REFERENCES sale_amendments(id) ON DELETE CASCADE,
+        action TEXT NOT NULL CHECK (action IN ({", ".join(f"'{a}'" for a in ACTIONS)})),
+        detail_id INTEGER,
+        item_id INTEGER,
+        item_name TEXT,
+        old_quantity REAL,
+        new_quantity REAL,
+        old_price_each INTEGER,
+        new_price_each INTEGER,
+        subtotal_delta INTEGER NOT NULL DEFAULT 0,
+        cost_delta INTEGER NOT NULL DEFAULT 0
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_sale_amendments_sale ON sale_amendments(sale_id)",
+    "CREATE INDEX IF NOT EXISTS idx_sale_amendment_lines_amendment ON sale_amendment_lines(amendment_id)",
+]
+
+LINE_FIELDS = ("action", "detail_id", "item_id", "item_name", "old_quantity", "new_quantity",
+               "old_price_each", "new_price_each", "subtotal_delta", "cost_delta")
+
+def install_amendments(conn):
+    for sql in AMENDMENT_SCHEMA:
+        conn.execute(sql)
+    conn.commit()
+
+def open_amendment(cur, sale_id, note=None):
+    """Add an amendment header (totals filled by close_amendment); runs in the caller's transaction"""
+    cur.execute("INSERT INTO sale_amendments(sale_id, at, note) VALUES (?, ?, ?)",
+                (sale_id, datetime.now().isoformat(), note))
+    return cur.lastrowid
+
+def close_amendment(cur, amendment_id, lines):
+    """Write the amendment's lines (dicts with LINE_FIELDS) and their totals; runs in the caller's transaction"""
+    cur.executemany(
+        f"INSERT INTO sale_amendment_lines(amendment_id, {', '.join(LINE_FIELDS)}) "
+        f"VALUES (?, {', '.join('?' for _ in LINE_FIELDS)})",
+        [(amendment_id, *(line[field] for field in LINE_FIELDS)) for line in lines]
+    )
+    cur.execute("UPDATE sale_amendments SET total_delta = ?, cost_delta = ? WHERE id = ?",
+                (sum(line["subtotal_delta"] for line in lines), sum(line["cost_delta"] for line in lines),
+                 amendment_id))
+
+def get_amendments(conn, sale_id):
+    """A sale's amendments (dicts, each with its "lines"), oldest first"""
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT id, sale_id, at, note, total_delta, cost_delta FROM sale_amendments
+        WHERE sale_id = ? ORDER BY id
+    """, (sale_id,))
+    result = [dict(row) for row in cur.fetchall()]
+    for amendment in result:
+        cur.execute(f"""
+            SELECT {', '.join(LINE_FIELDS)} FROM sale_amendment_lines
+            WHERE amendment_id = ? ORDER BY id
+        """, (amendment["id"],))
+        amendment["lines"] = [dict(row) for row in cur.fetchall()]
+    return result
@@ -0,0 +1,323 @@
+# analytics.py (columnar NumPy analytics over sale lines: grouped revenue, margins, ABC, moving averages)
+import argparse
+import json
+import os
+import shutil
+from datetime import datetime
+
+import archive
+import models
+from money import fmt_money
+
+try:
+    import numpy as np
+except Exception:
+    np = None
+
+ANALYTICS_CACHE_DIR = "analytics_cache"
+LOAD_CHUNK_SIZE = 50000
+CACHE_VERSION = 3
+
+# (column, dtype) of the on-disk cache; one raw little-endian file per column.
+# ts is sales.datetime as seconds since 1970-01-01 in the till's local time, revenue
+# and cost are minor units, and item_id is -1 when unknown. An item's category is not
+# cached: it can change at any time, so it is looked up from items on every load.
+COLUMNS = [
+    ("line_id", "<i8"),
+    ("ts", "<i8"),
+    ("item_id", "<i8"),
+    ("qty", "<f8"),
+    ("revenue", "<i8"),
+    ("cost", "<i8"),
+]
+FIELDS = tuple(name for name, _ in COLUMNS) + ("category_id",)
+
+# Per schema ({db}: store.db or an archive partition); lines keep their ids when archived
+_LINES_SQL = """
+    SELECT sd.id, CAST(strftime('%s', s.datetime) AS INTEGER), COALESCE(sd.item_id, -1),
+           sd.quantity, sd.subtotal, CAST(ROUND(sd.quantity * sd.purchase_price_each) AS INTEGER)
+    FROM {db}.sale_details sd
+    JOIN {db}.sales s ON s.id = sd.sale_id
+    WHERE sd.id > ?
+"""
+
+# Lines newer than the cache, counted over a rowid range
+_TAIL_SQL = "SELECT COUNT(*) AS n FROM {db}.sale_details WHERE id > ?"
+
+def _fingerprint(conn, schemas, last_line_id):
+    """
+    [lines with id <= last_line_id, last amendment id] from maintained values only: the
+    table_counts and archive_partitions line counts less the tail. Line ids are never
+    reused and archiving moves lines without changing the total, so a mismatch means
+    cached lines were deleted or amended and the cache is rebuilt from scratch.
+    """
+    sql, params = archive.union_all(_TAIL_SQL, schemas, (last_line_id,))
+    tail = conn.execute(f"SELECT TOTAL(n) FROM ({sql})", params).fetchone()[0]
+    lines = conn.execute("""
+        SELECT (SELECT row_count FROM table_counts WHERE table_name = 'sale_details')
+             + (SELECT TOTAL(lines) FROM archive_partitions)
+    """).fetchone()[0]
+    amendment = conn.execute("SELECT COALESCE(MAX(id), 0) FROM sale_amendments").fetchone()[0]
+    return [int(lines - tail), amendment]
+
+def _require_numpy():
+    if np is None:
+        raise RuntimeError("numpy غير مثبت: التحليلات غير متاحة.")
+
+class SalesColumns:
+    """
+    Sale lines as parallel NumPy arrays (see COLUMNS), memory-mapped read-only from
+    the cache, plus each line's current category_id (-1 when unknown). where() returns
+    a filtered in-memory copy.
+    """
+    __slots__ = FIELDS
+
+    def __init__(self, **arrays):
+        for name in FIELDS:
+            setattr(self, name, arrays[name])
+
+    def __len__(self):
+        return len(self.line_id)
+
+    @property
+    def day(self):
+        """Days since 1970-01-01"""
+        return self.ts // 86400
+
+    @property
+    def hour(self):
+        return (self.ts % 86400) // 3600
+
+    @property
+    def profit(self):
+        return self.revenue - self.cost
+
+    def where(self, mask):
+        return SalesColumns(**{name: getattr(self, name)[mask] for name in FIELDS})
+
+    def between(self, date_from=None, date_to=None):
+        """Lines with date_from <= sale time < date_to (date, datetime or ISO text)"""
+        mask = np.ones(len(self), dtype=bool)
+        if date_from is not None:
+            mask &= self.ts >= _epoch_seconds(date_from)
+        if date_to is not None:
+            mask &= self.ts < _epoch_seconds(date_to)
+        return self.where(mask)
+
+def _epoch_seconds(value):
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if not isinstance(value, datetime):
+        value = datetime.combine(value, datetime.min.time())
+    return int((value - datetime(1970, 1, 1)).total_seconds())
+
+def _read_meta(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return meta if meta.get("version") == CACHE_VERSION else None
+
+def _write_meta(cache_dir, meta):
+    path = os.path.join(cache_dir, "meta.json")
+    with open(path + ".part", "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(path + ".part", path)
+
+def _column_path(cache_dir, name):
+    return os.path.join(cache_dir, f"{name}.bin")
+
+def _append_lines(conn, schemas, cache_dir, meta):
+    """Append sale lines newer than meta["last_line_id"] to the column files; returns rows added"""
+    files = {}
+    try:
+        for name, dtype in COLUMNS:
+            f = open(_column_path(cache_dir, name), "ab")
+            # Drop rows written by an interrupted update that never reached meta.json
+            f.truncate(meta["rows"] * np.dtype(dtype).itemsize)
+            files[name] = f
+        c = conn.cursor()
+        c.row_factory = None
+        sql, params = archive.union_all(_LINES_SQL, schemas, (meta["last_line_id"],))
+        c.execute(sql + " ORDER BY 1", params)
+        added = 0
+        while True:
+            rows = c.fetchmany(LOAD_CHUNK_SIZE)
+            if not rows:
+                break
+            for (name, dtype), values in zip(COLUMNS, zip(*rows)):
+                np.asarray(values, dtype=dtype).tofile(files[name])
+            added += len(rows)
+            meta["last_line_id"] = rows[-1][0]
+    finally:
+        for f in files.values():
+            f.close()
+    if added:
+        meta["rows"] += added
+        meta["fingerprint"] = _fingerprint(conn, schemas, meta["last_line_id"])
+        _write_meta(cache_dir, meta)
+    return added
+
+def refresh_cache(cache_dir=ANALYTICS_CACHE_DIR, rebuild=False):
+    """
+    Bring the column cache up to date: append new sale lines, or rebuild everything when
+    cached lines were changed or deleted since the last refresh. Returns rows appended.
+    """
+    _require_numpy()
+    with models.get_db() as conn, archive.attached(conn) as schemas:
+        meta = None if rebuild else _read_meta(cache_dir)
+        if meta is not None:
+            fingerprint = _fingerprint(conn, schemas, meta["last_line_id"])
+            if fingerprint != meta["fingerprint"]:
+                meta = None
+        if meta is None:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+            os.makedirs(cache_dir, exist_ok=True)
+            meta = {"version": CACHE_VERSION, "rows": 0, "last_line_id": 0,
+                    "fingerprint": _fingerprint(conn, schemas, 0)}
+            _write_meta(cache_dir, meta)
+        return _append_lines(conn, schemas, cache_dir, meta)
+
+def _current_categories(item_id):
+    """category_id of each item id as of now, -1 for unknown or deleted items and no category"""
+    with models.get_db() as conn:
+        c = conn.cursor()
+        c.row_factory = None
+        c.execute("SELECT id, COALESCE(category_id, -1) FROM items")
+        rows = np.array(c.fetchall(), dtype=np.int64).reshape(-1, 2)
+    lookup = np.full(max(rows[:, 0].max(initial=0), item_id.max(initial=0)) + 2, -1, dtype=np.int64)
+    lookup[rows[:, 0]] = rows[:, 1]
+    return lookup[item_id]  # Unknown items are -1, which also indexes the trailing -1
+
+def load(cache_dir=ANALYTICS_CACHE_DIR, refresh=True):
+    """Return SalesColumns memory-mapped from the cache, refreshing it first by default"""
+    _require_numpy()
+    if refresh:
+        refresh_cache(cache_dir)
+    meta = _read_meta(cache_dir) or {"rows": 0}
+    arrays = {}
+    for name, dtype in COLUMNS:
+        if meta["rows"]:
+            arrays[name] = np.memmap(_column_path(cache_dir, name), dtype=dtype, mode="r",
+                                     shape=(meta["rows"],))
+        else:
+            arrays[name] = np.empty(0, dtype=dtype)
+    arrays["category_id"] = _current_categories(arrays["item_id"])
+    return SalesColumns(**arrays)
+
+GROUP_KEYS = ("item", "category", "day", "month", "hour")
+
+def _group_key(cols, by):
+    if by == "item":
+        return cols.item_id
+    if by == "category":
+        return cols.category_id
+    if by == "day":
+        return cols.day
+    if by == "month":
+        return cols.ts.astype("datetime64[s]").astype("datetime64[M]").astype(np.int64)
+    if by == "hour":
+        return cols.hour
+    raise ValueError(f"unknown grouping: {by}")
+
+def grouped_revenue(cols, by="category"):
+    """
+    Sum qty, revenue, cost and profit per group (one of GROUP_KEYS).
+    Returns a dict of equal-length arrays: key, lines, qty, revenue, cost, profit, margin
+    (profit / revenue in percent), sorted by revenue, highest first.
+    """
+    keys, inverse = np.unique(_group_key(cols, by), return_inverse=True)
+    n = len(keys)
+    revenue = np.rint(np.bincount(inverse, weights=cols.revenue, minlength=n)).astype(np.int64)
+    cost = np.rint(np.bincount(inverse, weights=cols.cost, minlength=n)).astype(np.int64)
+    result = {
+        "key": keys,
+        "lines": np.bincount(inverse, minlength=n),
+        "qty": np.bincount(inverse, weights=cols.qty, minlength=n),
+        "revenue": revenue,
+        "cost": cost,
+        "profit": revenue - cost,
+        "margin": margin(revenue, cost),
+    }
+    order = np.argsort(-revenue, kind="stable")
+    return {name: values[order] for name, values in result.items()}
+
+def margin(revenue, cost):
+    """Profit margin in percent of revenue (0 where revenue is 0)"""
+    revenue = np.asarray(revenue, dtype=np.float64)
+    profit = revenue - np.asarray(cost, dtype=np.float64)
+    return np.divide(profit * 100.0, revenue, out=np.zeros_like(revenue), where=revenue != 0)
+
+def abc_classification(cols, a_share=0.8, b_share=0.95):
+    """
+    Pareto ABC classes by item revenue: items making up the first a_share of revenue
+    are "A", up to b_share "B", the rest "C". Returns item_id, revenue, cumulative
+    share and class arrays, highest revenue first.
+    """
+    groups = grouped_revenue(cols.where(cols.item_id >= 0), by="item")
+    revenue = groups["revenue"]
+    total = revenue.sum()
+    cumulative = np.cumsum(revenue) / total if total else np.zeros(len(revenue))
+    # An item belongs to the class its cumulative share starts in
+    starts = cumulative - (revenue / total if total else 0)
+    classes = np.where(starts < a_share, "A", np.where(starts < b_share, "B", "C"))
+    return {"item_id": groups["key"], "revenue": revenue, "cumulative_share": cumulative, "class": classes}
+
+def daily_revenue(cols):
+    """Revenue per calendar day, with days without sales filled in as 0. Returns (days, revenue)."""
+    if not len(cols):
+        return np.empty(0, dtype="datetime64[D]"), np.empty(0, dtype=np.int64)
+    day = cols.day
+    first = day.min()
+    revenue = np.bincount(day - first, weights=cols.revenue)
+    days = np.arange(first, first + len(revenue)).astype("datetime64[D]")
+    return days, np.rint(revenue).astype(np.int64)
+
+def moving_average(values, window=7):
+    """Trailing moving average; the first window-1 entries average what is available"""
+    values = np.asarray(values, dtype=np.float64)
+    cumsum = np.cumsum(np.concatenate(([0.0], values)))
+    counts = np.minimum(np.arange(1, len(values) + 1), window)
+    upper = np.arange(1, len(values) + 1)
+    return (cumsum[upper] - cumsum[upper - counts]) / counts
+
+def _label(by, key):
+    if by == "day":
+        return str(np.datetime64(int(key), "D"))
+    if by == "month":
+        return str(np.datetime64(int(key), "M"))
+    return str(key)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sales analytics from the columnar cache")
+    parser.add_argument("--by", choices=GROUP_KEYS, default="category")
+    parser.add_argument("--from", dest="date_from", help="inclusive start (YYYY-MM-DD)")
+    parser.add_argument("--to", dest="date_to", help="exclusive end (YYYY-MM-DD)")
+    parser.add_argument("--abc", action="store_true", help="print the ABC class counts")
+    parser.add_argument("--ma", type=int, metavar="DAYS", help="print the last days of a DAYS moving average")
+    parser.add_argument("--rebuild", action="store_true", help="rebuild the cache from scratch")
+    parser.add_argument("--top", type=int, default=20)
+    args = parser.parse_args()
+
+    started = datetime.now()
+    added = refresh_cache(rebuild=args.rebuild)
+    cols = load(refresh=False).between(args.date_from, args.date_to)
+    print(f"{len(cols)} lines ({added} new) in {(datetime.now() - started).total_seconds():.3f}s")
+
+    groups = grouped_revenue(cols, by=args.by)
+    print(f"{args.by:<14}{'lines':>8}{'revenue':>14}{'profit':>14}{'margin':>9}")
+    for i in range(min(args.top, len(groups["key"]))):
+        print(f"{_label(args.by, groups['key'][i]):<14}{groups['lines'][i]:>8}"
+              f"{fmt_money(groups['revenue'][i]):>14}{fmt_money(groups['profit'][i]):>14}"
+              f"{groups['margin'][i]:>8.1f}%")
+
+    if args.abc:
+        classes = abc_classification(cols)["class"]
+        print(" ".join(f"{c}={int((classes == c).sum())}" for c in "ABC"))
+
+    if args.ma:
+        days, revenue = daily_revenue(cols)
+        averages = moving_average(revenue, args.ma)
+        for d, r, avg in list(zip(days, revenue, averages))[-args.ma:]:
+            print(f"{d}  {fmt_money(r):>12}  {fmt_money(round(avg)):>12}")
@@ -0,0 +1,286 @@
+# archive.py (archival of closed years of sales into store_YYYY.db partitions, queried through ATTACH)
+import argparse
+import logging
+import os
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+
+import aggregates
+import cdc
+import database
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_GRACE_DAYS = 31      # A year is closed (archivable) this many days after it ends
+PARTITION_NAME = "store_{year}.db"
+MOVE_ATTEMPTS = 3            # Copy/verify rounds before giving up on a month that keeps changing
+
+# One row per partition file. Totals let all-time figures skip the partitions entirely;
+# the id and datetime ranges decide which partitions a query has to attach.
+ARCHIVE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS archive_partitions (
+    year INTEGER PRIMARY KEY,
+    path TEXT NOT NULL,
+    first_sale_id INTEGER,
+    last_sale_id INTEGER,
+    first_datetime TEXT,
+    last_datetime TEXT,
+    sales INTEGER NOT NULL DEFAULT 0,
+    lines INTEGER NOT NULL DEFAULT 0,
+    revenue INTEGER NOT NULL DEFAULT 0,
+    cost INTEGER NOT NULL DEFAULT 0,
+    archived_at TEXT
+)
+"""
+
+# Archived rows keep their ids. item_id is a plain reference: the catalog stays in store.db.
+PARTITION_SCHEMA = [
+    database.SALES_SCHEMA.format(table="{db}.sales"),
+    """
+    CREATE TABLE IF NOT EXISTS {db}.sale_details (
+        id INTEGER PRIMARY KEY,
+        sale_id INTEGER NOT NULL REFERENCES sales(id),
+        item_id INTEGER,
+        quantity REAL NOT NULL,
+        price_each INTEGER NOT NULL,
+        subtotal INTEGER NOT NULL DEFAULT 0,
+        purchase_price_each INTEGER NOT NULL DEFAULT 0,
+        item_name TEXT NOT NULL DEFAULT '',
+        item_barcode TEXT,
+        created_at TEXT
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS {db}.idx_sales_datetime ON sales(datetime)",
+    "CREATE INDEX IF NOT EXISTS {db}.idx_sale_details_receipt ON sale_details("
+    "sale_id, item_name, item_barcode, item_id, quantity, price_each, purchase_price_each, subtotal)",
+]
+
+SALE_FIELDS = "id, datetime, total_price, total_purchase_price, created_at"
+LINE_FIELDS = ("id, sale_id, item_id, quantity, price_each, subtotal, purchase_price_each, "
+               "item_name, item_barcode, created_at")
+
+# Delete triggers bypassed while rows move: the aggregates keep counting archived sales
+# (reports cover all history) and the change feed does not see a move as a delete
+_BYPASSED_TRIGGERS = ("trg_sale_details_agg_delete", "trg_sales_agg_delete_lines", "trg_sales_agg_delete")
+
+def install_archive(conn):
+    conn.execute(ARCHIVE_SCHEMA)
+    conn.commit()
+
+def partition_path(year, db_path=database.DB_NAME):
+    """Partitions live next to the hot database"""
+    return os.path.join(os.path.dirname(os.path.abspath(db_path)), PARTITION_NAME.format(year=year))
+
+def get_partitions(conn):
+    """Registry rows (dicts), oldest year first"""
+    c = conn.cursor()
+    c.row_factory = None
+    c.execute("""
+        SELECT year, path, first_sale_id, last_sale_id, first_datetime, last_datetime,
+               sales, lines, revenue, cost, archived_at
+        FROM archive_partitions ORDER BY year
+    """)
+    names = [d[0] for d in c.description]
+    return [dict(zip(names, row)) for row in c.fetchall()]
+
+def archived_totals(conn):
+    """(revenue, cost) of every archived sale, from the registry"""
+    return tuple(conn.execute(
+        "SELECT COALESCE(SUM(revenue), 0), COALESCE(SUM(cost), 0) FROM archive_partitions"
+    ).fetchone())
+
+def _overlaps(partition, date_from, date_to, sale_ids):
+    if sale_ids is not None:
+        return any(partition["first_sale_id"] <= i <= partition["last_sale_id"] for i in sale_ids)
+    if date_from is not None and partition["last_datetime"] < str(date_from):
+        return False
+    if date_to is not None and partition["first_datetime"] >= str(date_to):
+        return False
+    return True
+
+@contextmanager
+def attached(conn, date_from=None, date_to=None, sale_ids=None, enabled=True):
+    """
+    Attach the partitions that can hold sales with date_from <= datetime < date_to (ISO
+    text; either may be None), or any of sale_ids when given, for the duration of the
+    block. Yields the schema names to query, "main" first. Must not be used inside a
+    transaction; SQLite attaches at most 10 databases by default.
+    """
+    schemas = ["main"]
+    try:
+        if enabled:
+            for partition in get_partitions(conn):
+                if not partition["sales"] or not _overlaps(partition, date_from, date_to, sale_ids):
+                    continue
+                path = partition_path(partition["year"])
+                if not os.path.exists(path):
+                    logger.warning("Archive partition %s is missing; year %s left out", path, partition["year"])
+                    continue
+                schema = f"archive_{partition['year']}"
+                conn.execute("ATTACH DATABASE ? AS " + schema, (path,))
+                schemas.append(schema)
+        yield schemas
+    finally:
+        for schema in schemas[1:]:
+            conn.execute("DETACH DATABASE " + schema)
+
+def union_all(template, schemas, params=()):
+    """template ({db} for the schema) repeated over schemas as one UNION ALL, with its params"""
+    sql = "\nUNION ALL\n".join(template.format(db=schema) for schema in schemas)
+    return sql, tuple(params) * len(schemas)
+
+def _months(year):
+    for month in range(1, 13):
+        end = f"{year + 1}-01-01" if month == 12 else f"{year}-{month + 1:02d}-01"
+        yield f"{year}-{month:02d}-01", end
+
+def _copy(conn, start, end):
+    """Copy the sales with start <= datetime < end (and their lines) into the attached partition"""
+    c = conn.cursor()
+    in_range = "SELECT id FROM main.sales WHERE datetime >= ? AND datetime < ?"
+    c.execute("BEGIN IMMEDIATE")
+    try:
+        # OR REPLACE: refreshes rows copied by an earlier run that were amended since
+        c.execute(f"""
+            INSERT OR REPLACE INTO part.sales({SALE_FIELDS})
+            SELECT {SALE_FIELDS} FROM main.sales WHERE datetime >= ? AND datetime < ?
+        """, (start, end))
+        c.execute(f"""
+            INSERT OR REPLACE INTO part.sale_details({LINE_FIELDS})
+            SELECT {LINE_FIELDS} FROM main.sale_details WHERE sale_id IN ({in_range})
+        """, (start, end))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+def _delete_copied(conn, start, end):
+    """
+    Delete the sales with start <= datetime < end from the hot database, provided every one
+    of them and of their lines is in the partition as it is in main; returns the sales
+    deleted, or None when the copy is missing or stale (the caller copies again).
+    """
+    c = conn.cursor()
+    in_range = "SELECT id FROM main.sales WHERE datetime >= ? AND datetime < ?"
+    c.execute("BEGIN IMMEDIATE")
+    try:
+        c.execute("""
+            SELECT COUNT(*), MIN(id), MAX(id), MIN(datetime), MAX(datetime),
+                   COALESCE(SUM(total_price), 0), COALESCE(SUM(total_purchase_price), 0)
+            FROM main.sales WHERE datetime >= ? AND datetime < ?
+        """, (start, end))
+        sales, first_id, last_id, first_dt, last_dt, revenue, cost = c.fetchone()
+        if not sales:
+            conn.rollback()
+            return 0
+        c.execute(f"""
+            SELECT EXISTS (
+                SELECT {SALE_FIELDS} FROM main.sales WHERE datetime >= ? AND datetime < ?
+                EXCEPT SELECT {SALE_FIELDS} FROM part.sales
+            ) OR EXISTS (
+                SELECT {LINE_FIELDS} FROM main.sale_details WHERE sale_id IN ({in_range})
+                EXCEPT SELECT {LINE_FIELDS} FROM part.sale_details
+            )
+        """, (start, end, start, end))
+        if c.fetchone()[0]:
+            conn.rollback()
+            return None
+        for name in _BYPASSED_TRIGGERS:
+            c.execute(f"DROP TRIGGER IF EXISTS main.{name}")
+        c.execute("DROP TRIGGER IF EXISTS main.trg_sales_cdc_delete")
+        c.execute("DROP TRIGGER IF EXISTS main.trg_sale_details_cdc_delete")
+        c.execute(f"DELETE FROM main.sale_details WHERE sale_id IN ({in_range})", (start, end))
+        lines = c.rowcount
+        c.execute("DELETE FROM main.sales WHERE datetime >= ? AND datetime < ?", (start, end))
+        # Schema changes are transactional: other connections never see the triggers missing
+        for name in _BYPASSED_TRIGGERS:
+            c.execute(f"CREATE TRIGGER main.{name} {aggregates.TRIGGERS[name]}")
+        cdc.create_triggers(conn, ops=("delete",))
+        year = int(start[:4])
+        c.execute("""
+            INSERT INTO main.archive_partitions(year, path, first_sale_id, last_sale_id, first_datetime,
+                                                last_datetime, sales, lines, revenue, cost, archived_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(year) DO UPDATE SET
+                first_sale_id = MIN(first_sale_id, excluded.first_sale_id),
+                last_sale_id = MAX(last_sale_id, excluded.last_sale_id),
+                first_datetime = MIN(first_datetime, excluded.first_datetime),
+                last_datetime = MAX(last_datetime, excluded.last_datetime),
+                sales = sales + excluded.sales, lines = lines + excluded.lines,
+                revenue = revenue + excluded.revenue, cost = cost + excluded.cost,
+                archived_at = excluded.archived_at
+        """, (year, PARTITION_NAME.format(year=year), first_id, last_id, first_dt, last_dt,
+              sales, lines, revenue, cost, datetime.now().isoformat()))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return sales
+
+def _move(conn, start, end, attempts=MOVE_ATTEMPTS):
+    """
+    Move the sales with start <= datetime < end into the attached partition; returns sales
+    moved. A transaction spanning two WAL databases is not atomic across the files, so the
+    copy is committed first and the delete second, after checking the copy: a crash in
+    between leaves the rows in both files, which the next run resolves.
+    """
+    for _ in range(attempts):
+        _copy(conn, start, end)
+        moved = _delete_copied(conn, start, end)
+        if moved is not None:
+            return moved
+    raise RuntimeError(f"Sales of {start[:7]} kept changing while being archived; try again later")
+
+def archive_year(conn, year):
+    """
+    Move every sale of year (and its lines) from the hot database into its partition,
+    one month per transaction so tills are never blocked for long. Safe to re-run.
+    Returns the number of sales moved.
+    """
+    path = partition_path(year)
+    conn.execute("ATTACH DATABASE ? AS part", (path,))
+    try:
+        for sql in PARTITION_SCHEMA:
+            conn.execute(sql.format(db="part"))
+        conn.commit()
+        moved = sum(_move(conn, start, end) for start, end in _months(year))
+    finally:
+        conn.execute("DETACH DATABASE part")
+    if moved:
+        logger.info("Archived %d sales of %d into %s", moved, year, path)
+    return moved
+
+def closed_years(conn, grace_days=ARCHIVE_GRACE_DAYS, today=None):
+    """Years with sales still in the hot database that ended more than grace_days ago"""
+    first = conn.execute("SELECT MIN(datetime) FROM sales").fetchone()[0]
+    if not first:
+        return []
+    last_closed = ((today or date.today()) - timedelta(days=grace_days)).year - 1
+    return list(range(int(first[:4]), last_closed + 1))
+
+def archive_closed_years(conn, grace_days=ARCHIVE_GRACE_DAYS):
+    """Archive every closed year; returns {year: sales moved}"""
+    return {year: archive_year(conn, year) for year in closed_years(conn, grace_days)}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move closed years of sales out of store.db into store_YYYY.db")
+    parser.add_argument("--year", type=int, action="append", help="archive this year (repeatable)")
+    parser.add_argument("--closed", action="store_true", help="archive every closed year")
+    parser.add_argument("--grace-days", type=int, default=ARCHIVE_GRACE_DAYS,
+                        help="days after a year ends before --closed archives it")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    conn = database.get_connection()
+    try:
+        install_archive(conn)
+        if args.year:
+            for year in args.year:
+                archive_year(conn, year)
+        elif args.closed:
+            archive_closed_years(conn, args.grace_days)
+        for p in get_partitions(conn):
+            print(f"{p['year']}  {p['path']}  {p['sales']} sales  {p['lines']} lines  "
+                  f"{p['first_datetime']} .. {p['last_datetime']}")
+    finally:
+        conn.close()
@@ -0,0 +1,200 @@
+# backup.py (online backups through the SQLite backup API, with rotation and a background scheduler)
+import gzip
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+from datetime import datetime
+
+import archive
+import database
+
+logger = logging.getLogger(__name__)
+
+BACKUP_DIR = "backups"
+BACKUP_PREFIX = "store_backup_"
+ARCHIVE_BACKUP_PREFIX = "archive_backup_"   # One copy per archived year, outside the rotation
+BACKUP_PAGES_PER_STEP = 256     # Pages copied per step; the source is only locked during a step
+BACKUP_STEP_SLEEP = 0.02        # Seconds to yield to the till between steps
+BACKUP_MAX_RESTARTS = 3         # Paced copies restarted by writes before copying in one step
+BACKUP_KEEP = 7                 # Rotated snapshots kept in BACKUP_DIR
+BACKUP_INTERVAL = 6 * 3600      # Seconds between scheduled backups
+
+def verify_backup(path):
+    """Run PRAGMA integrity_check on a backup (plain or .gz); returns True when it reports ok."""
+    tmp_path = None
+    try:
+        if path.endswith(".gz"):
+            fd, tmp_path = tempfile.mkstemp(suffix=".db")
+            with os.fdopen(fd, "wb") as out, gzip.open(path, "rb") as src:
+                shutil.copyfileobj(src, out)
+            path = tmp_path
+        conn = sqlite3.connect(path)
+        try:
+            result = conn.execute("PRAGMA integrity_check").fetchall()
+        finally:
+            conn.close()
+        return result == [("ok",)]
+    except sqlite3.DatabaseError:
+        return False
+    finally:
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+class _TooManyRestarts(Exception):
+    pass
+
+def _paced_backup(src, dst, pages, sleep, progress, max_restarts):
+    """
+    src.backup in steps of `pages`. A write to the source from another connection starts
+    the copy over; after max_restarts of those the rest is copied in a single step, which
+    only holds a read transaction (writers carry on in the WAL) and cannot be restarted.
+    Returns the number of restarts.
+    """
+    state = {"remaining": None, "restarts": 0}
+
+    def track(status, remaining, total):
+        if state["remaining"] is not None and remaining > state["remaining"]:
+            state["restarts"] += 1
+            if state["restarts"] > max_restarts:
+                raise _TooManyRestarts()
+        state["remaining"] = remaining
+        if progress is not None:
+            progress(status, remaining, total)
+
+    try:
+        src.backup(dst, pages=pages, sleep=sleep, progress=track)
+    except _TooManyRestarts:
+        logger.info("Backup restarted %d times by writes; copying in one step", max_restarts)
+        src.backup(dst, pages=-1, progress=progress)
+    return state["restarts"]
+
+def online_backup(dest_path, src_path=None, compress=False, verify=True,
+                  pages=BACKUP_PAGES_PER_STEP, sleep=BACKUP_STEP_SLEEP, progress=None,
+                  max_restarts=BACKUP_MAX_RESTARTS):
+    """
+    Copy the live database into dest_path with sqlite3.Connection.backup.
+    Unlike a file copy this includes committed WAL content and yields between page
+    batches, so sales keep committing during the backup; a copy kept restarting by
+    those writes is finished in one step (see _paced_backup). The copy is integrity-checked
+    before it is moved into place; with compress=True it is gzipped to dest_path + ".gz".
+    Returns the final path.
+    """
+    src_path = src_path or database.DB_NAME
+    dest_dir = os.path.dirname(os.path.abspath(dest_path))
+    os.makedirs(dest_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(suffix=".part", dir=dest_dir)
+    os.close(fd)
+    try:
+        src = sqlite3.connect(src_path, timeout=30)
+        dst = sqlite3.connect(tmp_path)
+        try:
+            _paced_backup(src, dst, pages, sleep, progress, max_restarts)
+            # The copy is a standalone file; don't leave it in WAL mode
+            dst.execute("PRAGMA journal_mode = DELETE")
+        finally:
+            dst.close()
+            src.close()
+
+        if verify and not verify_backup(tmp_path):
+            raise sqlite3.DatabaseError(f"Backup of {src_path} failed integrity check")
+
+        if compress:
+            final_path = dest_path if dest_path.endswith(".gz") else dest_path + ".gz"
+            gz_tmp = tmp_path + ".gz"
+            with open(tmp_path, "rb") as f_in, gzip.open(gz_tmp, "wb", compresslevel=6) as f_out:
+                shutil.copyfileobj(f_in, f_out, 1024 * 1024)
+            os.replace(gz_tmp, final_path)
+        else:
+            final_path = dest_path
+            os.replace(tmp_path, final_path)
+        return final_path
+    finally:
+        for leftover in (tmp_path, tmp_path + ".gz"):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+
+def rotate_backups(backup_dir=BACKUP_DIR, keep=BACKUP_KEEP):
+    """Delete the oldest snapshots in backup_dir so that at most `keep` remain; returns removed paths."""
+    if not os.path.isdir(backup_dir):
+        return []
+    snapshots = sorted(
+        name for name in os.listdir(backup_dir)
+        if name.startswith(BACKUP_PREFIX) and (name.endswith(".db") or name.endswith(".db.gz"))
+    )
+    removed = []
+    for name in snapshots[:max(0, len(snapshots) - keep)]:
+        path = os.path.join(backup_dir, name)
+        os.remove(path)
+        removed.append(path)
+    return removed
+
+def backup_partitions(backup_dir=BACKUP_DIR, compress=True):
+    """
+    Back up every archive partition (see archive) into backup_dir, as archive_backup_YYYY.db.
+    Partitions only change when a year is archived, so a copy is only taken again when its
+    registry row was updated after the existing copy was written. Returns the paths written.
+    """
+    conn = database.get_connection()
+    try:
+        partitions = archive.get_partitions(conn)
+    finally:
+        conn.close()
+    written = []
+    for partition in partitions:
+        src_path = archive.partition_path(partition["year"])
+        if not os.path.exists(src_path):
+            logger.warning("Archive partition %s is missing; not backed up", src_path)
+            continue
+        dest_path = os.path.join(backup_dir, f"{ARCHIVE_BACKUP_PREFIX}{partition['year']}.db")
+        existing = dest_path + ".gz" if compress else dest_path
+        archived_at = datetime.fromisoformat(partition["archived_at"]).timestamp() if partition["archived_at"] else None
+        if os.path.exists(existing) and archived_at is not None and os.path.getmtime(existing) > archived_at:
+            continue
+        written.append(online_backup(dest_path, src_path=src_path, compress=compress))
+    return written
+
+def snapshot(backup_dir=BACKUP_DIR, keep=BACKUP_KEEP, compress=True):
+    """
+    Take one timestamped backup into backup_dir and rotate old ones, then bring the
+    archive partition copies up to date; returns the path of the store backup.
+    """
+    name = f"{BACKUP_PREFIX}{datetime.now().strftime('%Y%m%d_%H%M%S')}.db"
+    path = online_backup(os.path.join(backup_dir, name), compress=compress)
+    rotate_backups(backup_dir, keep)
+    backup_partitions(backup_dir, compress)
+    return path
+
+class BackupScheduler(threading.Thread):
+    """Background thread taking a snapshot() every `interval` seconds until stop() is called."""
+
+    def __init__(self, interval=BACKUP_INTERVAL, backup_dir=BACKUP_DIR, keep=BACKUP_KEEP, compress=True):
+        super().__init__(name="BackupScheduler", daemon=True)
+        self.interval = interval
+        self.backup_dir = backup_dir
+        self.keep = keep
+        self.compress = compress
+        self.last_backup = None
+        self.last_error = None
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.run_once()
+
+    def run_once(self):
+        started = datetime.now()
+        try:
+            self.last_backup = snapshot(self.backup_dir, self.keep, self.compress)
+            self.last_error = None
+            logger.info("Backup written to %s in %.1fs", self.last_backup,
+                        (datetime.now() - started).total_seconds())
+        except Exception as e:
+            self.last_error = e
+            logger.exception("Scheduled backup failed")
+        return self.last_backup
+
+    def stop(self):
+        self._stop_event.set()
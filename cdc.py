@@ -0,0 +1,166 @@
+# cdc.py (change-data-capture feed: trigger-populated change log of items, sales and sale_details)
+import argparse
+import json
+import os
+import sys
+import time
+
+import database
+
+CAPTURED_TABLES = ("items", "sales", "sale_details")
+RETENTION_DAYS = 30          # Changes older than this are pruned by maintenance
+DEFAULT_LIMIT = 500
+
+# AUTOINCREMENT keeps seq strictly increasing even after old changes are pruned, so a
+# consumer's cursor never skips or repeats a change. data is the row after an insert
+# or update and the row before a delete, as a JSON object.
+CHANGE_LOG_SCHEMA = """
+CREATE TABLE IF NOT EXISTS change_log (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    table_name TEXT NOT NULL,
+    op TEXT NOT NULL CHECK (op IN ('insert', 'update', 'delete')),
+    row_id INTEGER NOT NULL,
+    at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%f', 'now', 'localtime')),
+    data TEXT
+)
+"""
+CHANGE_LOG_AT_INDEX = "CREATE INDEX IF NOT EXISTS idx_change_log_at ON change_log(at)"
+
+class CursorExpired(Exception):
+    """Changes right after a consumer's cursor were pruned; it has to resync from the tables."""
+
+    def __init__(self, seq, oldest):
+        super().__init__(f"cursor {seq} expired: the oldest change kept is {oldest}")
+        self.seq = seq
+        self.oldest = oldest
+
+_OPS = (("insert", "INSERT", "NEW"), ("update", "UPDATE", "NEW"), ("delete", "DELETE", "OLD"))
+
+def _columns(conn, table):
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+def install_cdc(conn):
+    """
+    Create change_log and one trigger per captured table and operation. The triggers
+    are rebuilt on every start so the JSON they write follows the current columns.
+    """
+    cur = conn.cursor()
+    cur.execute(CHANGE_LOG_SCHEMA)
+    cur.execute(CHANGE_LOG_AT_INDEX)
+    create_triggers(conn)
+    conn.commit()
+
+def create_triggers(conn, tables=CAPTURED_TABLES, ops=("insert", "update", "delete")):
+    """(Re)create the capture triggers of these tables and operations; does not commit."""
+    cur = conn.cursor()
+    for table in tables:
+        columns = _columns(conn, table)
+        for op, event, ref in _OPS:
+            if op not in ops:
+                continue
+            row = ", ".join(f"'{col}', {ref}.{col}" for col in columns)
+            cur.execute(f"DROP TRIGGER IF EXISTS trg_{table}_cdc_{op}")
+            cur.execute(f"""
+                CREATE TRIGGER trg_{table}_cdc_{op} AFTER {event} ON {table}
+                BEGIN
+                    INSERT INTO change_log(table_name, op, row_id, data)
+                    VALUES ('{table}', '{op}', {ref}.id, json_object({row}));
+                END
+            """)
+
+def _change(row):
+    seq, table_name, op, row_id, at, data = row
+    return {"seq": seq, "table": table_name, "op": op, "id": row_id, "at": at,
+            "data": json.loads(data) if data else None}
+
+def changes_since(conn, seq=0, limit=DEFAULT_LIMIT, tables=None):
+    """
+    Up to limit changes with a sequence number above seq, oldest first. Pass the last
+    seq received as the next cursor. tables restricts the feed to some captured tables.
+    Raises CursorExpired when changes after seq were already pruned (see prune_changes).
+    """
+    sql = "SELECT seq, table_name, op, row_id, at, data FROM change_log WHERE seq > ?"
+    params = [seq]
+    if tables:
+        sql += f" AND table_name IN ({', '.join('?' * len(tables))})"
+        params += list(tables)
+    sql += " ORDER BY seq LIMIT ?"
+    params.append(limit)
+    c = conn.cursor()
+    c.row_factory = None
+    c.execute(sql, params)
+    changes = [_change(row) for row in c.fetchall()]
+    # Checked after the read: a prune in between can only make it report expiry too early
+    oldest = oldest_seq(conn)
+    if seq + 1 < oldest:
+        raise CursorExpired(seq, oldest)
+    return changes
+
+def latest_seq(conn):
+    """Sequence number of the newest change (0 when there is none); a consumer can start here."""
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'change_log'").fetchone()
+    return row[0] if row else 0
+
+def oldest_seq(conn):
+    """Sequence number of the oldest change still kept (latest_seq + 1 once all were pruned)"""
+    oldest = conn.execute("SELECT MIN(seq) FROM change_log").fetchone()[0]
+    return latest_seq(conn) + 1 if oldest is None else oldest
+
+def prune_changes(conn, older_than_days=RETENTION_DAYS):
+    """Delete changes older than the retention window; returns the number of rows removed."""
+    cur = conn.cursor()
+    cur.execute(
+        "DELETE FROM change_log WHERE at < strftime('%Y-%m-%dT%H:%M:%f', 'now', 'localtime', ?)",
+        (f"-{int(older_than_days)} days",)
+    )
+    conn.commit()
+    return cur.rowcount
+
+def _read_cursor(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return int(f.read().strip() or 0)
+    except (OSError, ValueError):
+        return 0
+
+def _write_cursor(path, seq):
+    with open(path + ".part", "w", encoding="utf-8") as f:
+        f.write(str(seq))
+    os.replace(path + ".part", path)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Print changes to items, sales and sale_details as JSON lines")
+    parser.add_argument("--since", type=int, help="print changes after this sequence number (default: 0, or the cursor file)")
+    parser.add_argument("--cursor-file", help="read the start position from this file and save it after each batch")
+    parser.add_argument("--table", action="append", choices=CAPTURED_TABLES, help="only these tables (repeatable)")
+    parser.add_argument("--limit", type=int, default=DEFAULT_LIMIT, help="changes fetched per query")
+    parser.add_argument("--follow", action="store_true", help="keep polling for new changes")
+    parser.add_argument("--interval", type=float, default=1.0, help="seconds between polls with --follow")
+    args = parser.parse_args()
+
+    seq = args.since
+    if seq is None:
+        seq = _read_cursor(args.cursor_file) if args.cursor_file else 0
+    conn = database.get_connection()
+    try:
+        while True:
+            try:
+                batch = changes_since(conn, seq, args.limit, args.table)
+            except CursorExpired as e:
+                print(f"{e}; changes {e.seq + 1} to {e.oldest - 1} were pruned. Re-read the tables, "
+                      f"then resume with --since {latest_seq(conn)}", file=sys.stderr)
+                sys.exit(2)
+            for change in batch:
+                print(json.dumps(change, ensure_ascii=False), flush=True)
+            if batch:
+                seq = batch[-1]["seq"]
+                if args.cursor_file:
+                    _write_cursor(args.cursor_file, seq)
+            if len(batch) < args.limit:
+                if not args.follow:
+                    break
+                time.sleep(args.interval)
+    except (KeyboardInterrupt, BrokenPipeError):
+        pass
+    finally:
+        conn.close()
@@ -1,17 +1,29 @@
 # controllers.py (fixed syntax error and QPrinter typo)
+import logging
 import os
+import threading
+import time
+import uuid
 from datetime import datetime
 from PyQt5.QtWidgets import (QFileDialog, QTableWidgetItem, QMessageBox, 
                              QInputDialog, QCompleter, QDialog, QVBoxLayout,
-                             QHBoxLayout, QLabel, QPushButton, QTextEdit)
-from PyQt5.QtCore import Qt, QSize
-from PyQt5.QtGui import QFont, QPixmap
+                             QHBoxLayout, QLabel, QPushButton, QTextEdit, QApplication)
+from PyQt5.QtCore import Qt, QSize, QTimer, pyqtSignal
+from PyQt5.QtGui import QFont, QPixmap, QColor
 from PyQt5.QtPrintSupport import QPrinter, QPrintDialog
 from PyQt5.QtGui import QTextDocument
 from PyQt5.QtCore import QSizeF  # Added import for QSizeF
 
-from ui_main import MainUI, ItemScanDialog
+from ui_main import MainUI, ItemScanDialog, SaleAmendDialog
 import models
+import importer
+import purchases
+import maintenance
+import instrumentation
+import qss
+from models import ALLOWED_BARCODE_LENGTHS, is_valid_barcode
+from money import fmt_money, to_minor, to_major, line_total
+from records import BillLine, ReceiptLine
 
 try:
     import cv2
@@ -23,55 +35,58 @@ try:
 except Exception:
     zbar_decode = None
 
+logger = logging.getLogger(__name__)
+
 ASSETS_PHOTOS_DIR = os.path.join("assets", "photos")
 os.makedirs(ASSETS_PHOTOS_DIR, exist_ok=True)
 
-ALLOWED_BARCODE_LENGTHS = {8, 12, 13}
-
-def is_valid_barcode(code: str) -> bool:
-    return code.isdigit() and (len(code) in ALLOWED_BARCODE_LENGTHS)
-
 def fmt_qty(val):
     return f"{val:.0f}" if val == int(val) else f"{val:.1f}"
 
-def fmt_money(val):
-    return f"{val:.0f}" if val == int(val) else f"{val:.2f}"
-
 class SaleDetailsDialog(QDialog):
-    def __init__(self, sale_id, currency, parent=None):
+    def __init__(self, sale_id, currency, parent=None, store=None):
         super().__init__(parent)
-        self.sale_id = sale_id
         self.currency = currency
-        self.setWindowTitle(f"تفاصيل الفاتورة #{sale_id}")
+        self.store = store or models
         self.setModal(True)
         self.resize(800, 600)
         self.setup_ui()
+        self.show_sale(sale_id)
 
     def setup_ui(self):
         layout = QVBoxLayout(self)
         
-        # Sale details
-        details = models.get_sale_details(self.sale_id)
-        sale_info = models.get_sale_by_id(self.sale_id)
-        
         # Create a scrollable text area for the sale details
-        text_edit = QTextEdit()
-        text_edit.setReadOnly(True)
-        
-        # Format the sale details as HTML
-        html_content = self.format_sale_details(details, sale_info)
-        text_edit.setHtml(html_content)
-        
-        layout.addWidget(text_edit)
+        self.text_edit = QTextEdit()
+        self.text_edit.setReadOnly(True)
+        layout.addWidget(self.text_edit)
         
         # Close button
         close_btn = QPushButton("إغلاق")
         close_btn.clicked.connect(self.accept)
         layout.addWidget(close_btn)
 
+    def show_sale(self, sale_id, currency=None):
+        """Load another sale into the dialog; the dialog is reused between opens."""
+        self.sale_id = sale_id
+        if currency:
+            self.currency = currency
+        self.setWindowTitle(f"تفاصيل الفاتورة #{sale_id}")
+        
+        # Header and lines come from one (cached) query
+        sale_info = self.store.get_sale_with_details(sale_id).get(sale_id)
+        details = sale_info.details if sale_info else []
+        
+        # Format the sale details as HTML, with the corrections made to the sale if any
+        html = self.format_sale_details(details, sale_info)
+        amendments = self.store.get_sale_amendments(sale_id)
+        if amendments:
+            html = html.replace("</body>", self.format_amendments(amendments) + "</body>")
+        self.text_edit.setHtml(html)
+
     def format_sale_details(self, details, sale_info):
-        total_revenue = sale_info["total_price"] if sale_info else 0
-        total_purchase = sale_info["total_purchase_price"] if sale_info else 0
+        total_revenue = sale_info.total_price if sale_info else 0
+        total_purchase = sale_info.total_purchase_price if sale_info else 0
         total_profit = total_revenue - total_purchase
         profit_margin = (total_profit / total_revenue * 100) if total_revenue > 0 else 0
         
@@ -93,7 +108,7 @@ class SaleDetailsDialog(QDialog):
         <body>
             <div class="header">
                 <div class="shop-name">تفاصيل الفاتورة #{self.sale_id}</div>
-                <div class="sale-info">التاريخ: {sale_info['datetime'] if sale_info else 'غير معروف'}</div>
+                <div class="sale-info">التاريخ: {sale_info.datetime if sale_info else 'غير معروف'}</div>
             </div>
             
             <table class="items-table">
@@ -111,15 +126,15 @@ class SaleDetailsDialog(QDialog):
         """
         
         for item in details:
-            purchase_price = item.get("purchase_price_each", 0) or 0
-            profit = (item["price_each"] - purchase_price) * item["quantity"]
+            purchase_price = item.purchase_price_each or 0
+            profit = item.subtotal - line_total(purchase_price, item.quantity)
             
             html += f"""
                     <tr>
-                        <td>{item['item_name']}</td>
-                        <td>{fmt_qty(item['quantity'])}</td>
-                        <td>{fmt_money(item['price_each'])}</td>
-                        <td>{fmt_money(item['subtotal'])}</td>
+                        <td>{item.item_name}</td>
+                        <td>{fmt_qty(item.quantity)}</td>
+                        <td>{fmt_money(item.price_each)}</td>
+                        <td>{fmt_money(item.subtotal)}</td>
                         <td>{fmt_money(purchase_price)}</td>
                         <td>{fmt_money(profit)}</td>
                     </tr>
@@ -133,7 +148,7 @@ class SaleDetailsDialog(QDialog):
                 <div>إجمالي الإيرادات: {fmt_money(total_revenue)} {self.currency}</div>
                 <div>إجمالي تكلفة الشراء: {fmt_money(total_purchase)} {self.currency}</div>
                 <div>إجمالي الربح: {fmt_money(total_profit)} {self.currency}</div>
-                <div>هامش الربح: {fmt_money(profit_margin)}%</div>
+                <div>هامش الربح: {profit_margin:.1f}%</div>
             </div>
         </body>
         </html>
@@ -141,21 +156,91 @@ class SaleDetailsDialog(QDialog):
         
         return html
 
+    def format_amendments(self, amendments):
+        actions = {"edit": "تعديل", "remove": "حذف", "add": "إضافة"}
+        html = f"""
+            <h3>سجل التعديلات</h3>
+            <table class="items-table">
+                <thead>
+                    <tr>
+                        <th>التاريخ</th>
+                        <th>الإجراء</th>
+                        <th>الصنف</th>
+                        <th>الكمية</th>
+                        <th>سعر الوحدة ({self.currency})</th>
+                        <th>فرق المجموع ({self.currency})</th>
+                    </tr>
+                </thead>
+                <tbody>
+        """
+        for amendment in amendments:
+            for line in amendment["lines"]:
+                quantity = " ← ".join(fmt_qty(q) for q in (line["old_quantity"], line["new_quantity"]) if q is not None)
+                price = " ← ".join(fmt_money(p) for p in (line["old_price_each"], line["new_price_each"]) if p is not None)
+                html += f"""
+                    <tr>
+                        <td>{amendment["at"][:16].replace("T", " ")}</td>
+                        <td>{actions[line["action"]]}</td>
+                        <td>{line["item_name"]}</td>
+                        <td>{quantity}</td>
+                        <td>{price}</td>
+                        <td>{fmt_money(line["subtotal_delta"])}</td>
+                    </tr>
+                """
+            if amendment["note"]:
+                html += f"""
+                    <tr><td colspan="6">ملاحظة: {amendment["note"]}</td></tr>
+                """
+        html += """
+                </tbody>
+            </table>
+        """
+        return html
+
 class Controller(MainUI):
-    def __init__(self):
+    # Item ids (None: the whole catalog) changed by another till; emitted from the client's thread
+    catalog_changed = pyqtSignal(object)
+    # Sale ids written to the database by the sales journal; emitted from its thread
+    bills_applied = pyqtSignal(object)
+    # (uid, sale id, error) of a bill sent to the multi-register server; emitted from the commit thread
+    bill_committed = pyqtSignal(object)
+    # (generation, item names) for the name completer; emitted from the loader thread
+    autocomplete_loaded = pyqtSignal(object)
+    # New settings dict / category list from the models registry; emitted from the writer's thread
+    settings_changed = pyqtSignal(object)
+    categories_changed = pyqtSignal(object)
+
+    def __init__(self, store=None, journal=None):
         super().__init__()
+        instrumentation.startup.mark("main_window")
+
+        # Checkout lookups and bill commits: models, or a register_client.RegisterClient
+        # when the till runs against a multi-register server
+        self.store = store or models
+        # Tills of a multi-register server only sell: the catalog, receipts and the sales
+        # history are edited on the server's machine, which owns store.db
+        self.multi_register = hasattr(self.store, "notify_catalog")
+        # With a journal.SalesJournal, saved bills are journaled and written to the database in the background
+        self.journal = journal
+        self._stock_table_stale = False
 
         self.currency = "د.ج"
         self.current_bill_items = []
+        self._bill_uid = None  # Kept until the bill on screen is saved, so saving it again is idempotent
+        self._bill_committing = False
+        self.current_receipt_lines = []
+        self._stock_form_loaded = None  # (item_id, stock_count, qty shown) when the form was filled from the table
+        self._sale_details_dialog = None
+        self._settings = None
+        self._autocomplete_generation = 0
 
         # Load settings
         self._load_settings_or_first_run()
-
-        # Initialize tabs
-        self._load_categories()
-        self._load_stock_table()
-        self._load_sales_tab()
         self._apply_currency_to_inputs()
+        instrumentation.startup.mark("settings")
+
+        # Only the bill tab is ready at startup; the other tabs are wired and loaded the
+        # first time they are opened (on_tab_built)
 
         # Bill signals
         self.btn_bill_find.clicked.connect(self._bill_find_and_add_item_dialog)
@@ -165,9 +250,10 @@ class Controller(MainUI):
         self.btn_print_bill.clicked.connect(self._bill_print)
         self.btn_scanner_info.clicked.connect(self._show_scanner_info)
 
-        # Autocomplete feature for manual entry
+        # Autocomplete feature for manual entry, loaded in the background once the window is up
         self.in_name.textChanged.connect(self._on_name_text_changed)
-        self._setup_autocomplete()
+        self.autocomplete_loaded.connect(self._set_autocomplete)
+        QTimer.singleShot(0, self._setup_autocomplete)
 
         # Barcode return pressed
         self.in_barcode.returnPressed.connect(self._handle_scanned_barcode)
@@ -175,29 +261,88 @@ class Controller(MainUI):
         # Set focus to barcode field for scanner input
         self.in_barcode.setFocus()
 
-        # Stock signals
-        self.btn_stk_browse.clicked.connect(self._browse_photo)
-        self.btn_stk_camera.clicked.connect(self._capture_photo)
-        self.btn_stk_new_cat.clicked.connect(self._add_new_category)
-        self.btn_stk_add.clicked.connect(self._stock_add)
-        self.btn_stk_update.clicked.connect(self._stock_update)
-        self.btn_stk_delete.clicked.connect(self._stock_delete)
-        self.btn_stk_refresh.clicked.connect(self._load_stock_table)
-        self.tbl_stock.clicked.connect(self._stock_fill_form_from_selection)
-
-        # Sales signals
-        self.btn_sale_refresh.clicked.connect(self._load_sales_tab)
-        self.btn_sale_view.clicked.connect(self._sales_view_selected)
-        self.btn_sale_delete.clicked.connect(self._sales_delete_selected)
-        self.btn_sale_print.clicked.connect(self._sales_print_selected)
-        self.tbl_sales.itemSelectionChanged.connect(self._on_sale_selection_changed)
-
-        # Settings
-        self.btn_settings_save.clicked.connect(self._save_settings_from_tab)
+        # Reports are loaded when the tab is opened
+        self.tabs.currentChanged.connect(self._on_tab_changed)
+
+        # Catalog changes pushed by the multi-register server
+        self.catalog_changed.connect(self._on_catalog_changed)
+        if hasattr(self.store, "catalog_listeners"):
+            self.store.catalog_listeners.append(self.catalog_changed.emit)
+        self.bills_applied.connect(self._on_bills_applied)
+        self.bill_committed.connect(self._on_bill_committed)
+
+        # Settings and categories are kept in memory by models; the UI follows their changes
+        self.settings_changed.connect(self._on_settings_changed)
+        self.categories_changed.connect(self._load_categories)
+        models.settings_listeners.append(self.settings_changed.emit)
+        models.categories_listeners.append(self.categories_changed.emit)
+        instrumentation.startup.mark("bill_tab")
+
+    def on_tab_built(self, page):
+        started = time.perf_counter()
+        if page is self.stock_tab:
+            self.btn_stk_browse.clicked.connect(self._browse_photo)
+            self.btn_stk_camera.clicked.connect(self._capture_photo)
+            self.btn_stk_new_cat.clicked.connect(self._add_new_category)
+            self.btn_stk_add.clicked.connect(self._stock_add)
+            self.btn_stk_update.clicked.connect(self._stock_update)
+            self.btn_stk_delete.clicked.connect(self._stock_delete)
+            self.btn_stk_refresh.clicked.connect(self._load_stock_table)
+            self.btn_stk_import.clicked.connect(self._stock_import_csv)
+            self.tbl_stock.clicked.connect(self._stock_fill_form_from_selection)
+            self._apply_currency_to_stock_form()
+            self._disable_server_edits(self.btn_stk_new_cat, self.btn_stk_add, self.btn_stk_update,
+                                       self.btn_stk_delete, self.btn_stk_import)
+            self._load_categories()
+            self._load_stock_table()
+        elif page is self.receipt_tab:
+            self.rcv_barcode.returnPressed.connect(self._receipt_scan)
+            self.btn_rcv_remove.clicked.connect(self._receipt_remove_selected)
+            self.btn_rcv_clear.clicked.connect(self._receipt_clear)
+            self.btn_rcv_save.clicked.connect(self._receipt_save)
+            self._disable_server_edits(self.btn_rcv_save)
+            self._load_suppliers()
+        elif page is self.sales_tab:
+            self.btn_sale_refresh.clicked.connect(self._load_sales_tab)
+            self.btn_sale_view.clicked.connect(self._sales_view_selected)
+            self.btn_sale_delete.clicked.connect(self._sales_delete_selected)
+            self.btn_sale_print.clicked.connect(self._sales_print_selected)
+            self.btn_sale_amend.clicked.connect(self._sales_amend_selected)
+            self.chk_sales_archive.toggled.connect(self._load_sales_tab)
+            self.tbl_sales.itemSelectionChanged.connect(self._on_sale_selection_changed)
+            self._load_sales_tab()
+        elif page is self.reports_tab:
+            self.btn_rep_refresh.clicked.connect(self._load_reports_tab)
+        elif page is self.settings_tab:
+            self.btn_settings_save.clicked.connect(self._save_settings_from_tab)
+            self.btn_settings_perf.clicked.connect(self._show_performance_summary)
+            self.btn_settings_perf_reset.clicked.connect(self._reset_performance_summary)
+            self._fill_settings_tab()
+            self.sett_theme.currentIndexChanged.connect(self._on_theme_selected)
+        logger.info("Built the %s tab in %.0fms", self.tabs.tabText(self.tabs.indexOf(page)),
+                    (time.perf_counter() - started) * 1000)
 
     def _setup_autocomplete(self):
-        all_items = models.get_items()
-        suggestions = [item['name'] for item in all_items if item['name']]
+        """Reload the name completer from the catalog on a background thread"""
+        self._autocomplete_generation += 1
+        threading.Thread(target=self._fetch_autocomplete, args=(self._autocomplete_generation,),
+                         name="AutocompleteLoader", daemon=True).start()
+
+    def _fetch_autocomplete(self, generation):
+        started = time.perf_counter()
+        try:
+            names = [item.name for item in self.store.get_items() if item.name]
+        except Exception:
+            logger.exception("Loading item names for autocomplete failed")
+            return
+        logger.info("Loaded %d item names for autocomplete in %.0fms (background)",
+                    len(names), (time.perf_counter() - started) * 1000)
+        self.autocomplete_loaded.emit((generation, names))
+
+    def _set_autocomplete(self, loaded):
+        generation, suggestions = loaded
+        if generation != self._autocomplete_generation:
+            return  # A newer reload is on its way
         completer = QCompleter(suggestions)
         completer.setCaseSensitivity(Qt.CaseInsensitive)
         completer.setFilterMode(Qt.MatchContains)
@@ -222,47 +367,96 @@ class Controller(MainUI):
         self._apply_settings_to_ui(s)
 
     def _apply_settings_to_ui(self, s):
+        self._settings = s
         self.lbl_title.setText(s["shop_name"])
         self.setWindowTitle(s["shop_name"])
+        self.currency = s["currency"]
+        self._fill_settings_tab()
+
+    def _fill_settings_tab(self):
+        if not self.is_tab_built(self.settings_tab):
+            return
+        s = self._settings
         self.sett_shop_name.setText(s["shop_name"])
         self.sett_contact.setText(s["contact"] or "")
         self.sett_location.setText(s["location"] or "")
         self.sett_currency.setText(s["currency"])
-        self.currency = s["currency"]
+        self.sett_theme.setCurrentIndex(max(self.sett_theme.findData(qss.current_theme()), 0))
+
+    def _on_theme_selected(self, index):
+        theme = self.sett_theme.itemData(index)
+        started = time.perf_counter()
+        qss.apply_theme(QApplication.instance(), theme)
+        logger.info("Switched to the %s theme in %.0fms", theme, (time.perf_counter() - started) * 1000)
+        models.save_theme(theme)
 
     def _save_settings_from_tab(self):
         shop_name = self.sett_shop_name.text().strip() or "متجري"
         contact = self.sett_contact.text().strip()
         location = self.sett_location.text().strip()
         currency = self.sett_currency.text().strip() or "د.ج"
-        models.save_settings(shop_name, contact, location, currency)
-        s = models.get_settings()
+        models.save_settings(shop_name, contact, location, currency)  # Applied by _on_settings_changed
+        self.msg("تم", "تم حفظ الإعدادات.")
+
+    def _on_settings_changed(self, s):
         self._apply_settings_to_ui(s)
         self._apply_currency_to_inputs()
-        self.msg("تم", "تم حفظ الإعدادات.")
+
+    def _show_performance_summary(self):
+        dialog = QDialog(self)
+        dialog.setWindowTitle("إحصاءات الاستعلامات")
+        dialog.resize(1000, 600)
+        layout = QVBoxLayout(dialog)
+        text_edit = QTextEdit()
+        text_edit.setReadOnly(True)
+        text_edit.setLineWrapMode(QTextEdit.NoWrap)
+        text_edit.setFont(QFont("Consolas", 9))
+        text_edit.setLayoutDirection(Qt.LeftToRight)
+        text_edit.setPlainText(instrumentation.format_summary(top=30))
+        layout.addWidget(text_edit)
+        close_btn = QPushButton("إغلاق")
+        close_btn.clicked.connect(dialog.accept)
+        layout.addWidget(close_btn)
+        dialog.exec_()
+
+    def _reset_performance_summary(self):
+        instrumentation.reset()
+        self.msg("تم", "تم تصفير إحصاءات الاستعلامات.")
 
     def _apply_currency_to_inputs(self):
         self.in_price.setPrefix(f"السعر ({self.currency}): ")
-        self.stk_price.setPrefix(f"السعر ({self.currency}): ")
-        self.stk_purchase_price.setPrefix(f"سعر الشراء ({self.currency}): ")
-        self.stk_qty.setPrefix("المخزون: ")
         self.in_qty.setPrefix("الكمية: ")
+        self._apply_currency_to_stock_form()
         self._bill_recalc_total()
         self._load_sales_tab()
 
+    def _apply_currency_to_stock_form(self):
+        if not self.is_tab_built(self.stock_tab):
+            return
+        self.stk_price.setPrefix(f"السعر ({self.currency}): ")
+        self.stk_purchase_price.setPrefix(f"سعر الشراء ({self.currency}): ")
+        self.stk_qty.setPrefix("المخزون: ")
+
     # Categories
-    def _load_categories(self):
-        cats = models.get_categories()
+    def _load_categories(self, cats=None):
+        if not self.is_tab_built(self.stock_tab):
+            return  # Loaded when the tab is first opened
+        if cats is None:
+            cats = models.get_categories()
+        selected = self.stk_cat.currentData()
         self.stk_cat.clear()
         for c in cats:
             self.stk_cat.addItem(c["name"], c["id"])
+        if selected is not None:
+            self.stk_cat.setCurrentIndex(max(self.stk_cat.findData(selected), 0))
 
     def _add_new_category(self):
+        if self._edited_on_server():
+            return
         name, ok = QInputDialog.getText(self, "تصنيف جديد", "اسم التصنيف:")
         if ok and name.strip():
             try:
-                models.add_category(name.strip())
-                self._load_categories()
+                models.add_category(name.strip())  # The list follows through categories_changed
                 self.msg("تم", "تم إضافة التصنيف.")
             except Exception as e:
                 QMessageBox.warning(self, "خطأ", f"تعذر إضافة التصنيف:\n{e}")
@@ -305,6 +499,8 @@ class Controller(MainUI):
             self.msg("تم", f"تم حفظ الصورة: {path_saved}")
 
     def _stock_add(self):
+        if self._edited_on_server():
+            return
         try:
             name = self.stk_name.text().strip()
             if not name:
@@ -315,8 +511,8 @@ class Controller(MainUI):
                 self.msg("خطأ", "الباركود غير صالح")
                 return
             cat_id = self.stk_cat.currentData()
-            price = float(self.stk_price.value())
-            purchase_price = float(self.stk_purchase_price.value())
+            price = to_minor(self.stk_price.value())
+            purchase_price = to_minor(self.stk_purchase_price.value())
             qty = float(self.stk_qty.value())
             
             if qty < 0:
@@ -325,6 +521,7 @@ class Controller(MainUI):
                 
             photo = self.stk_photo.text().strip() or None
             models.add_item(name, cat_id, barcode or None, price, qty, photo, purchase_price=purchase_price)
+            self._notify_catalog()
             self._load_stock_table()
             self.msg("تم", "تمت إضافة الصنف.")
             self._clear_stock_form()
@@ -333,6 +530,8 @@ class Controller(MainUI):
             QMessageBox.warning(self, "خطأ", f"تعذر إضافة الصنف:\n{e}")
 
     def _stock_update(self):
+        if self._edited_on_server():
+            return
         row = self._selected_row(self.tbl_stock)
         if row is None:
             self.msg("تنبيه", "اختر صفًا للتعديل.")
@@ -349,8 +548,8 @@ class Controller(MainUI):
                 self.msg("خطأ", "الباركود غير صالح")
                 return
             cat_id = self.stk_cat.currentData()
-            price = float(self.stk_price.value())
-            purchase_price = float(self.stk_purchase_price.value())
+            price = to_minor(self.stk_price.value())
+            purchase_price = to_minor(self.stk_purchase_price.value())
             qty = float(self.stk_qty.value())
             
             if qty < 0:
@@ -358,7 +557,17 @@ class Controller(MainUI):
                 return
                 
             photo = self.stk_photo.text().strip() or None
-            models.update_item(item_id, name, cat_id, barcode or None, price, qty, photo, purchase_price=purchase_price)
+            # Save the change made in the form, not an absolute count, so sales made since it was loaded are kept
+            expected_stock = None
+            if self._stock_form_loaded and self._stock_form_loaded[0] == item_id:
+                _, loaded_stock, shown_qty = self._stock_form_loaded
+                # An untouched quantity leaves the stock alone, even one the form cannot show
+                # (negative, or with more decimals than the spin box)
+                expected_stock = qty if qty == shown_qty else loaded_stock
+            models.update_item(item_id, name, cat_id, barcode or None, price, qty, photo,
+                               purchase_price=purchase_price, expected_stock=expected_stock)
+            self._stock_form_loaded = (item_id, qty, qty)
+            self._notify_catalog([item_id])
             self._load_stock_table()
             self.msg("تم", "تم تعديل الصنف.")
             self._setup_autocomplete()
@@ -366,15 +575,18 @@ class Controller(MainUI):
             QMessageBox.warning(self, "خطأ", f"تعذر تعديل الصنف:\n{e}")
 
     def _stock_delete(self):
+        if self._edited_on_server():
+            return
         row = self._selected_row(self.tbl_stock)
         if row is None:
             self.msg("تنبيه", "اختر صفًا للحذف.")
             return
         item_id = int(self.tbl_stock.item(row, 0).text())
-        confirm = QMessageBox.question(self, "تأكيد", "سيتم حذف الصنف وجميع تفاصيل البيع المرتبطة به.\nهل أنت متأكد؟", QMessageBox.Yes | QMessageBox.No)
+        confirm = QMessageBox.question(self, "تأكيد", "سيتم حذف الصنف من المخزون (تبقى الفواتير السابقة كما هي).\nهل أنت متأكد؟", QMessageBox.Yes | QMessageBox.No)
         if confirm == QMessageBox.Yes:
             try:
                 models.delete_item(item_id)
+                self._notify_catalog([item_id])
                 self._load_stock_table()
                 self.msg("تم", "تم حذف الصنف.")
                 self._setup_autocomplete()
@@ -382,6 +594,27 @@ class Controller(MainUI):
             except Exception as e:
                 QMessageBox.warning(self, "خطأ", f"تعذر حذف الصنف:\n{e}")
 
+    def _stock_import_csv(self):
+        if self._edited_on_server():
+            return
+        path, _ = QFileDialog.getOpenFileName(self, "استيراد أصناف", "", "CSV (*.csv)")
+        if not path:
+            return
+        try:
+            report = importer.import_items_csv(path)
+        except Exception as e:
+            QMessageBox.warning(self, "خطأ", f"تعذر استيراد الملف:\n{e}")
+            return
+        self._notify_catalog()
+        self._load_stock_table()
+        self._setup_autocomplete()
+        text = report.summary()
+        if report.errors:
+            errors_path = os.path.splitext(path)[0] + "_errors.csv"
+            report.write_errors_csv(errors_path)
+            text += f"\nتم حفظ الأسطر المرفوضة في:\n{errors_path}"
+        self.msg("استيراد", text)
+
     def _clear_stock_form(self):
         self.stk_name.clear()
         self.stk_barcode.clear()
@@ -401,8 +634,13 @@ class Controller(MainUI):
         if idx >= 0:
             self.stk_cat.setCurrentIndex(idx)
         self.stk_barcode.setText(self.tbl_stock.item(row, 3).text())
-        self.stk_price.setValue(float(self.tbl_stock.item(row, 4).text()))
-        self.stk_qty.setValue(float(self.tbl_stock.item(row, 5).text()))
+        self.stk_price.setValue(float(self.tbl_stock.item(row, 4).text() or "0"))
+        item_id = int(self.tbl_stock.item(row, 0).text())
+        # The table shows max(0, stock) rounded; the baseline is the stored stock_count
+        item = self.store.get_item(item_id)
+        stock_count = (item.stock_count or 0) if item else float(self.tbl_stock.item(row, 5).text())
+        self.stk_qty.setValue(stock_count)
+        self._stock_form_loaded = (item_id, stock_count, self.stk_qty.value())
         if self.tbl_stock.columnCount() > 10:
             purchase_price = float(self.tbl_stock.item(row, 10).text() or "0")
             self.stk_purchase_price.setValue(purchase_price)
@@ -410,20 +648,23 @@ class Controller(MainUI):
         self.set_preview_image(self.tbl_stock.item(row, 7).text())
 
     def _load_stock_table(self):
-        items = models.get_items()
+        if not self.is_tab_built(self.stock_tab):
+            return  # Loaded when the tab is first opened
+        self._stock_table_stale = False
+        items = self.store.get_items()
         self.tbl_stock.setRowCount(0)
         for r in items:
             row = self.tbl_stock.rowCount()
             self.tbl_stock.insertRow(row)
-            self.tbl_stock.setItem(row, 0, QTableWidgetItem(str(r["id"])))
-            name_item = QTableWidgetItem(r["name"])
+            self.tbl_stock.setItem(row, 0, QTableWidgetItem(str(r.id)))
+            name_item = QTableWidgetItem(r.name)
             name_item.setFont(QFont("Arial", 11, QFont.Bold))
             self.tbl_stock.setItem(row, 1, name_item)
-            self.tbl_stock.setItem(row, 2, QTableWidgetItem(r.get("category_name", "غير مصنّف") or "غير مصنّف"))
-            self.tbl_stock.setItem(row, 3, QTableWidgetItem(r["barcode"] or ""))
-            self.tbl_stock.setItem(row, 4, QTableWidgetItem(fmt_money(r['price'])))
+            self.tbl_stock.setItem(row, 2, QTableWidgetItem(r.category_name or "غير مصنّف"))
+            self.tbl_stock.setItem(row, 3, QTableWidgetItem(r.barcode or ""))
+            self.tbl_stock.setItem(row, 4, QTableWidgetItem(fmt_money(r.price)))
             
-            stock_count = max(0, r['stock_count'] or 0)
+            stock_count = max(0, r.stock_count or 0)
             stock_item = QTableWidgetItem(fmt_qty(stock_count))
             if stock_count <= 0:
                 stock_item.setForeground(Qt.red)
@@ -434,25 +675,24 @@ class Controller(MainUI):
             if stock_count <= 0:
                 status_item.setForeground(Qt.red)
             self.tbl_stock.setItem(row, 6, status_item)
-            self.tbl_stock.setItem(row, 7, QTableWidgetItem(r["photo_path"] or ""))
-            self.tbl_stock.setItem(row, 8, QTableWidgetItem(r["add_date"] or ""))
-            self.tbl_stock.setItem(row, 9, QTableWidgetItem(str(r["category_id"] or "")))
-            self.tbl_stock.setItem(row, 10, QTableWidgetItem(str(r["purchase_price"] or "0")))
+            self.tbl_stock.setItem(row, 7, QTableWidgetItem(r.photo_path or ""))
+            self.tbl_stock.setItem(row, 8, QTableWidgetItem(r.add_date or ""))
+            self.tbl_stock.setItem(row, 9, QTableWidgetItem(str(r.category_id or "")))
+            self.tbl_stock.setItem(row, 10, QTableWidgetItem(fmt_money(r.purchase_price)))
 
     # Bill Methods
     def _handle_scanned_barcode(self):
+        maintenance.note_activity()
         barcode = self.in_barcode.text().strip()
         self.in_barcode.clear()
         
         if not barcode:
             return
         
-        item_row = models.get_item_by_barcode(barcode)
-        item_data_dict = dict(item_row) if item_row else None
-
-        dialog = ItemScanDialog(self, item_data=item_data_dict, currency=self.currency)
+        item_row = self.store.get_item_by_barcode(barcode)
+        dialog = ItemScanDialog(self, item_data=item_row, currency=self.currency)
         
-        if item_data_dict is None:
+        if item_row is None:
             dialog.in_barcode.setText(barcode)
             # For new items, default to saving to database
             dialog.chk_save_to_db.setChecked(True)
@@ -484,23 +724,24 @@ class Controller(MainUI):
                 return False
 
             try:
-                default_cat = models.get_category_by_name("غير مصنّف")
+                # Category ids are those of the local database, which a server does not share
+                default_cat = None if self.multi_register else models.get_category_by_name("غير مصنّف")
                 cat_id = default_cat["id"] if default_cat else None
                 
-                models.add_item(name, cat_id, barcode_to_save or None, price, qty, None, purchase_price=price)
+                # Saved by the server in multi-register mode, which then tells every till
+                item_id = self.store.add_item(name, cat_id, barcode_to_save or None, price, qty, None, purchase_price=price)
                 self.msg("تم", f"تم حفظ المنتج '{name}' في قاعدة البيانات.")
                 self._load_stock_table()
                 self._setup_autocomplete()
                 
-                # Get the newly created item from database
-                item_from_db = models.get_item_by_barcode(barcode_to_save) or models.search_items_by_name(name)[0]
+                item_from_db = self.store.get_item(item_id)
                 return self._add_item_to_current_bill(
-                    item_from_db["id"], 
-                    item_from_db["name"], 
-                    item_from_db["barcode"], 
-                    item_from_db["price"],
+                    item_from_db.id, 
+                    item_from_db.name, 
+                    item_from_db.barcode, 
+                    item_from_db.price,
                     item_details["qty"], 
-                    item_from_db["purchase_price"]
+                    item_from_db.purchase_price
                 )
             except Exception as e:
                 QMessageBox.warning(self, "خطأ", f"تعذر حفظ المنتج:\n{e}")
@@ -509,9 +750,9 @@ class Controller(MainUI):
             # For existing items or custom items that shouldn't be saved to DB
             item = None
             if item_details["id"] != -1:
-                item = models.get_item(item_details["id"])
+                item = self.store.get_item(item_details["id"])
 
-            purchase_price = item["purchase_price"] if item else item_details["price"]
+            purchase_price = item.purchase_price if item else item_details["price"]
 
             return self._add_item_to_current_bill(
                 item_details["id"], 
@@ -524,33 +765,32 @@ class Controller(MainUI):
             )
 
     def _bill_find_and_add_item_dialog(self):
+        maintenance.note_activity()
         barcode = self.in_barcode.text().strip()
         name = self.in_name.text().strip()
 
         item_row = None
         if barcode:
-            item_row = models.get_item_by_barcode(barcode)
+            item_row = self.store.get_item_by_barcode(barcode)
         elif name:
-            items_found = models.search_items_by_name(name)
+            items_found = self.store.search_items_by_name(name)
             if items_found:
                 item_row = items_found[0]
         
-        item_data_dict = dict(item_row) if item_row else None
+        dialog = ItemScanDialog(self, item_data=item_row, currency=self.currency)
 
-        dialog = ItemScanDialog(self, item_data=item_data_dict, currency=self.currency)
-
-        if not item_data_dict and barcode:
+        if not item_row and barcode:
             dialog.in_barcode.setText(barcode)
             # For new items, default to saving to database
             dialog.chk_save_to_db.setChecked(True)
-        elif not item_data_dict and name:
+        elif not item_row and name:
             dialog.in_item_name.setText(name)
             dialog.in_item_name.setReadOnly(False)
             dialog.chk_manual_price.setChecked(True)
             dialog.in_price.setEnabled(True)
             # For new items, default to saving to database
             dialog.chk_save_to_db.setChecked(True)
-        elif not item_data_dict and not barcode and not name:
+        elif not item_row and not barcode and not name:
             dialog = ItemScanDialog(self, item_data=None, currency=self.currency)
             # For new items, default to saving to database
             dialog.chk_save_to_db.setChecked(True)
@@ -571,11 +811,11 @@ class Controller(MainUI):
         self.in_barcode.setFocus()
 
     def _on_autocomplete_selected(self, text):
-        items_found = models.search_items_by_name(text)
+        items_found = self.store.search_items_by_name(text)
         if items_found:
-            item = dict(items_found[0])
-            self.in_barcode.setText(item["barcode"] or "")
-            self.in_price.setValue(float(item["price"]))
+            item = items_found[0]
+            self.in_barcode.setText(item.barcode or "")
+            self.in_price.setValue(to_major(item.price))
             self.in_qty.setValue(1.0)
             self.chk_manual.setChecked(False) 
             self.in_price.setEnabled(False) 
@@ -585,11 +825,13 @@ class Controller(MainUI):
         pass
         
     def _add_item_to_current_bill(self, item_id, name, barcode, price, qty, purchase_price, is_custom=False):
+        if self._bill_busy():
+            return False
         if not is_custom and item_id != -1:
-            db_item = models.get_item(item_id)
+            db_item = self.store.get_item(item_id)
             
             if db_item:
-                available_stock = max(0, db_item["stock_count"] or 0)
+                available_stock = max(0, db_item.stock_count or 0)
                 if qty > available_stock:
                     self.msg("خطأ", f"الكمية المطلوبة ({qty}) أكبر من المخزون المتاح ({available_stock}) للصنف {name}.")
                     return False
@@ -600,7 +842,7 @@ class Controller(MainUI):
         row = self.tbl_bill.rowCount()
         self.tbl_bill.insertRow(row)
         
-        total = price * qty
+        total = line_total(price, qty)
         
         self.tbl_bill.setItem(row, 0, QTableWidgetItem(barcode or ""))
         name_item = QTableWidgetItem(name)
@@ -611,21 +853,15 @@ class Controller(MainUI):
         self.tbl_bill.setItem(row, 4, QTableWidgetItem(fmt_money(total)))
         self.tbl_bill.setItem(row, 5, QTableWidgetItem(str(item_id if not is_custom else "CUSTOM")))
         
-        self.current_bill_items.append({
-            "id": item_id,
-            "name": name,
-            "barcode": barcode,
-            "price": price,
-            "qty": qty,
-            "total": total,
-            "purchase_price": purchase_price,
-            "is_custom": is_custom
-        })
+        self.current_bill_items.append(BillLine(item_id, name, barcode, price, qty, total, purchase_price, is_custom))
+        self._bill_uid = None
         
         self._bill_recalc_total()
         return True
 
     def _bill_remove_selected(self):
+        if self._bill_busy():
+            return
         row = self._selected_row(self.tbl_bill)
         if row is None:
             self.msg("تنبيه", "اختر صفًا للحذف.")
@@ -633,60 +869,95 @@ class Controller(MainUI):
         self.tbl_bill.removeRow(row)
         if row < len(self.current_bill_items):
             self.current_bill_items.pop(row)
+        self._bill_uid = None
         self._bill_recalc_total()
 
     def _bill_recalc_total(self):
         total_price = 0
         total_purchase_price = 0
         for item_data in self.current_bill_items:
-            total_price += item_data["total"]
-            total_purchase_price += item_data["qty"] * item_data["purchase_price"]
+            total_price += item_data.total
+            total_purchase_price += line_total(item_data.purchase_price, item_data.qty)
         
         self.lbl_total.setText(f"الإجمالي: {fmt_money(total_price)} {self.currency}")
         self._current_bill_total_purchase_price = total_purchase_price
 
     def _bill_save(self):
+        maintenance.note_activity()
+        if self._bill_busy():
+            return
         if not self.current_bill_items:
             self.msg("تنبيه", "لا توجد أصناف في الفاتورة.")
             return
         try:
-            total_sale_price = 0
-            total_sale_purchase_price = 0
-            items_to_save_details = []
-
-            for item_data in self.current_bill_items:
-                if not item_data["is_custom"]:
-                    total_sale_price += item_data["total"]
-                    total_sale_purchase_price += item_data["qty"] * item_data["purchase_price"]
-                    items_to_save_details.append(item_data)
+            items_to_save_details = [item_data for item_data in self.current_bill_items if not item_data.is_custom]
             
             if not items_to_save_details:
                 self.msg("تنبيه", "لا توجد أصناف قابلة للحفظ في الفاتورة (جميعها منتجات مخصصة وغير محفوظة).")
                 return
 
-            sale_id = models.add_sale(total_sale_price, total_sale_purchase_price)
-            
-            for item_data in items_to_save_details:
-                models.add_sale_detail(
-                    sale_id, 
-                    item_data["id"], 
-                    item_data["qty"], 
-                    item_data["price"], 
-                    item_data["purchase_price"]
-                )
-            
-            self.tbl_bill.setRowCount(0)
-            self.current_bill_items.clear()
-            self._bill_recalc_total()
-            
-            self.msg("تم", f"تم حفظ الفاتورة رقم {sale_id}.")
-            
-            self._load_sales_tab()
-            self._load_stock_table()
-            
+            if self.journal is not None:
+                # Safe on disk once journaled; the sales and stock tabs refresh when it is applied
+                self.journal.append(items_to_save_details)
+                saved_text = "تم حفظ الفاتورة."
+            elif self.multi_register:
+                self._commit_bill_in_background(items_to_save_details)
+                return
+            else:
+                # The sale and all its lines in one transaction
+                sale_id = self.store.commit_bill(items_to_save_details)
+                saved_text = f"تم حفظ الفاتورة رقم {sale_id}."
+            self._bill_saved(saved_text)
         except Exception as e:
             QMessageBox.warning(self, "خطأ", f"تعذر حفظ الفاتورة:\n{e}")
 
+    def _bill_saved(self, saved_text):
+        self._bill_uid = None
+        self.tbl_bill.setRowCount(0)
+        self.current_bill_items.clear()
+        self._bill_recalc_total()
+        
+        self.msg("تم", saved_text)
+        
+        if self.journal is None:
+            self._load_sales_tab()
+            self._load_stock_table()
+
+    def _bill_busy(self):
+        """True (after telling the cashier) while the bill on screen is being sent to the server"""
+        if self._bill_committing:
+            self.msg("تنبيه", "جارٍ حفظ الفاتورة، يرجى الانتظار.")
+        return self._bill_committing
+
+    def _commit_bill_in_background(self, lines):
+        """Send the bill to the multi-register server off the GUI thread; the answer arrives through bill_committed"""
+        if self._bill_uid is None:
+            self._bill_uid = uuid.uuid4().hex
+        uid = self._bill_uid
+        self._bill_committing = True
+        self.btn_bill_save.setEnabled(False)
+
+        def commit():
+            try:
+                result = (uid, self.store.commit_bill(lines, uid=uid), None)
+            except Exception as e:
+                result = (uid, None, e)
+            self.bill_committed.emit(result)
+
+        threading.Thread(target=commit, name="BillCommit", daemon=True).start()
+
+    def _on_bill_committed(self, result):
+        uid, sale_id, error = result
+        self._bill_committing = False
+        self.btn_bill_save.setEnabled(True)
+        if error is not None:
+            # The server may still write it: the bill keeps its uid, so saving again cannot duplicate it
+            QMessageBox.warning(self, "خطأ", f"تعذر التأكد من حفظ الفاتورة:\n{error}\n"
+                                             "يمكنك إعادة الحفظ دون خطر تسجيل الفاتورة مرتين.")
+            return
+        if uid == self._bill_uid:
+            self._bill_saved(f"تم حفظ الفاتورة رقم {sale_id}.")
+
     def _bill_print(self):
         if not self.current_bill_items:
             self.msg("تنبيه", "لا توجد أصناف في الفاتورة للطباعة.")
@@ -775,14 +1046,14 @@ class Controller(MainUI):
         for item in self.current_bill_items:
             html += f"""
                     <tr>
-                        <td>{item['name']}</td>
-                        <td>{fmt_money(item['price'])}</td>
-                        <td>{fmt_qty(item['qty'])}</td>
-                        <td>{fmt_money(item['total'])}</td>
+                        <td>{item.name}</td>
+                        <td>{fmt_money(item.price)}</td>
+                        <td>{fmt_qty(item.qty)}</td>
+                        <td>{fmt_money(item.total)}</td>
                     </tr>
             """
         
-        total = sum(item["total"] for item in self.current_bill_items)
+        total = sum(item.total for item in self.current_bill_items)
         html += f"""
                 </tbody>
             </table>
@@ -842,14 +1113,14 @@ class Controller(MainUI):
         for item in self.current_bill_items:
             html += f"""
                     <tr>
-                        <td>{item['name'][:20] + ('...' if len(item['name']) > 20 else '')}</td>
-                        <td>{fmt_money(item['price'])}</td>
-                        <td>{fmt_qty(item['qty'])}</td>
-                        <td>{fmt_money(item['total'])}</td>
+                        <td>{item.name[:20] + ('...' if len(item.name) > 20 else '')}</td>
+                        <td>{fmt_money(item.price)}</td>
+                        <td>{fmt_qty(item.qty)}</td>
+                        <td>{fmt_money(item.total)}</td>
                     </tr>
             """
         
-        total = sum(item["total"] for item in self.current_bill_items)
+        total = sum(item.total for item in self.current_bill_items)
         html += f"""
                 </tbody>
             </table>
@@ -865,25 +1136,204 @@ class Controller(MainUI):
         """
         return html
 
+    # Goods Receipt Methods
+    def _load_suppliers(self):
+        if not self.is_tab_built(self.receipt_tab):
+            return  # Loaded when the tab is first opened
+        current = self.rcv_supplier.currentText()
+        self.rcv_supplier.clear()
+        self.rcv_supplier.addItem("")
+        for s in purchases.get_suppliers():
+            self.rcv_supplier.addItem(s["name"])
+        self.rcv_supplier.setCurrentText(current)
+
+    def _receipt_scan(self):
+        maintenance.note_activity()
+        barcode = self.rcv_barcode.text().strip()
+        self.rcv_barcode.clear()
+        if not barcode:
+            return
+        item = models.get_item_by_barcode(barcode)
+        if item is None:
+            self.msg("تنبيه", f"الباركود {barcode} غير موجود في المخزون. أضف الصنف أولاً من تبويب المخزون.")
+            self.rcv_barcode.setFocus()
+            return
+        qty = self.rcv_qty.value()
+        cost = to_minor(self.rcv_cost.value()) or item.purchase_price or 0
+        # Scanning the same item again adds to its line instead of adding a row
+        for line in self.current_receipt_lines:
+            if line.item_id == item.id:
+                line.quantity += qty
+                line.cost_each = cost
+                break
+        else:
+            self.current_receipt_lines.append(ReceiptLine(item.id, item.name, item.barcode, qty, cost))
+        self._receipt_refresh_table()
+        self.rcv_barcode.setFocus()
+
+    def _receipt_refresh_table(self):
+        self._fill_table(self.tbl_receipt, [
+            (line.barcode or "", line.name, fmt_qty(line.quantity), fmt_money(line.cost_each),
+             fmt_money(line_total(line.cost_each, line.quantity)))
+            for line in self.current_receipt_lines
+        ])
+        total = sum(line_total(line.cost_each, line.quantity) for line in self.current_receipt_lines)
+        self.lbl_receipt_total.setText(f"الإجمالي: {fmt_money(total)} {self.currency}")
+
+    def _receipt_remove_selected(self):
+        row = self._selected_row(self.tbl_receipt)
+        if row is None:
+            self.msg("تنبيه", "اختر صفًا للحذف.")
+            return
+        if row < len(self.current_receipt_lines):
+            self.current_receipt_lines.pop(row)
+        self._receipt_refresh_table()
+
+    def _receipt_clear(self):
+        self.current_receipt_lines.clear()
+        self.rcv_reference.clear()
+        self._receipt_refresh_table()
+        self.rcv_barcode.setFocus()
+
+    def _receipt_save(self):
+        maintenance.note_activity()
+        if self._edited_on_server():
+            return
+        if not self.current_receipt_lines:
+            self.msg("تنبيه", "لا توجد أصناف في الاستلام.")
+            return
+        try:
+            supplier_name = self.rcv_supplier.currentText().strip()
+            supplier_id = purchases.get_or_create_supplier(supplier_name) if supplier_name else None
+            receipt_id = purchases.commit_receipt(
+                self.current_receipt_lines,
+                supplier_id=supplier_id,
+                reference=self.rcv_reference.text().strip() or None
+            )
+        except Exception as e:
+            QMessageBox.warning(self, "خطأ", f"تعذر حفظ الاستلام:\n{e}")
+            return
+        self._notify_catalog([line.item_id for line in self.current_receipt_lines])
+        self._receipt_clear()
+        self._load_suppliers()
+        self._load_stock_table()
+        self.msg("تم", f"تم حفظ الاستلام رقم {receipt_id}.")
+
     # Sales Methods
     def _load_sales_tab(self):
-        sales = models.get_sales()
-        self.tbl_sales.setRowCount(0)
+        if not self.is_tab_built(self.sales_tab):
+            return  # Loaded when the tab is first opened
+        # Archived years (see archive) only on request: they can hold most of the history
+        sales = self.store.get_sales(include_archive=self.chk_sales_archive.isChecked())
+        self._fill_table(self.tbl_sales, [
+            (str(r.id), r.datetime, f"{fmt_money(r.total_price)} {self.currency}",
+             f"{fmt_money(r.total_price - r.total_purchase_price)} {self.currency}")
+            for r in sales
+        ])
+
+    # Multi-register Methods
+    def _edited_on_server(self):
+        """True (after telling the user) when this till runs against a multi-register server"""
+        if self.multi_register:
+            self.msg("تنبيه", "هذا الصندوق متصل بخادم الصناديق: تتم إدارة المخزون والفواتير من جهاز الخادم.")
+        return self.multi_register
+
+    def _disable_server_edits(self, *buttons):
+        if not self.multi_register:
+            return
+        for button in buttons:
+            button.setEnabled(False)
+            button.setToolTip("تتم إدارة المخزون والفواتير من جهاز الخادم")
+
+    def _notify_catalog(self, item_ids=None):
+        """Tell the other tills about a catalog edit made on this one (multi-register mode only)"""
+        if hasattr(self.store, "notify_catalog"):
+            try:
+                self.store.notify_catalog(item_ids)
+            except Exception as e:
+                QMessageBox.warning(self, "خطأ", f"تعذر إبلاغ الصناديق الأخرى بالتعديل:\n{e}")
+
+    def _on_catalog_changed(self, item_ids):
+        if item_ids is None:
+            self._setup_autocomplete()
+        # Stock moves with every bill on every till, so the table is only reloaded when visible
+        if self.tabs.currentWidget() is self.stock_tab:
+            self._load_stock_table()
+        else:
+            self._stock_table_stale = True
+
+    def _on_bills_applied(self, sale_ids):
+        self._load_sales_tab()
+        self._on_catalog_changed([])
+
+    # Reports Methods
+    def _on_tab_changed(self, index):
+        if self.tabs.widget(index) is self.reports_tab:
+            self._load_reports_tab()
+        elif self.tabs.widget(index) is self.stock_tab and self._stock_table_stale:
+            self._load_stock_table()
+
+    def _fill_table(self, table, rows):
+        # Sorting and repaints are held off while the rows go in, which matters for large tables
+        sorting = table.isSortingEnabled()
+        table.setSortingEnabled(False)
+        table.setUpdatesEnabled(False)
+        try:
+            table.setRowCount(len(rows))
+            for row, values in enumerate(rows):
+                for col, value in enumerate(values):
+                    table.setItem(row, col, QTableWidgetItem(value))
+        finally:
+            table.setUpdatesEnabled(True)
+            table.setSortingEnabled(sorting)
+
+    def _load_reports_tab(self):
+        days = self.rep_days.value() or None
+        
+        top = self.store.get_top_items(self.rep_metric.currentData(), self.rep_top_n.value(), days)
+        self._fill_table(self.tbl_rep_top, [
+            (r["name"], r["barcode"] or "", fmt_qty(r["units"]), fmt_money(r["revenue"]), fmt_money(r["profit"]))
+            for r in top
+        ])
+        
+        dead = self.store.get_dead_stock(self.rep_dead_days.value())
+        self._fill_table(self.tbl_rep_dead, [
+            (r["name"], r["barcode"] or "", fmt_qty(r["stock_count"]),
+             (r["last_sold"] or "لم يُبع")[:10], fmt_money(r["stock_value"]))
+            for r in dead
+        ])
         
-        # Load sales table
-        for r in sales:
-            row = self.tbl_sales.rowCount()
-            self.tbl_sales.insertRow(row)
-            self.tbl_sales.setItem(row, 0, QTableWidgetItem(str(r["id"])))
-            self.tbl_sales.setItem(row, 1, QTableWidgetItem(r["datetime"]))
-            self.tbl_sales.setItem(row, 2, QTableWidgetItem(f"{fmt_money(r['total_price'])} {self.currency}"))
-            self.tbl_sales.setItem(row, 3, QTableWidgetItem(f"{fmt_money(r['total_price'] - r['total_purchase_price'])} {self.currency}"))
+        reorder_list = self.store.get_reorder_list()
+        self._fill_table(self.tbl_rep_reorder, [
+            (r["name"], r["barcode"] or "", fmt_qty(r["stock_count"]), f"{r['velocity']:.2f}",
+             f"{r['days_of_cover']:.1f}", fmt_qty(r["suggested_qty"]))
+            for r in reorder_list
+        ])
+        
+        margins = self.store.get_margin_by_category(days)
+        self._fill_table(self.tbl_rep_margin, [
+            (r["category"], fmt_qty(r["units"]), fmt_money(r["revenue"]), fmt_money(r["cost"]),
+             fmt_money(r["profit"]), f"{r['margin']:.1f}%")
+            for r in margins
+        ])
+        
+        grid = self.store.get_hourly_heatmap()
+        top_revenue = max((cell["revenue"] for day in grid for cell in day), default=0) or 1
+        for weekday, hours in enumerate(grid):
+            for hour, cell in enumerate(hours):
+                item = QTableWidgetItem(str(cell["sales"]) if cell["sales"] else "")
+                item.setTextAlignment(Qt.AlignCenter)
+                item.setToolTip(f"{fmt_money(cell['revenue'])} {self.currency}")
+                shade = max(0, cell["revenue"]) / top_revenue
+                item.setBackground(QColor(255 - int(255 * shade), 255 - int(132 * shade), 255))
+                self.tbl_rep_heatmap.setItem(weekday, hour, item)
 
     def _on_sale_selection_changed(self):
         selected = self.tbl_sales.selectionModel().hasSelection()
         self.btn_sale_view.setEnabled(selected)
-        self.btn_sale_delete.setEnabled(selected)
+        self.btn_sale_delete.setEnabled(selected and not self.multi_register)
         self.btn_sale_print.setEnabled(selected)
+        self.btn_sale_amend.setEnabled(selected and not self.multi_register)
 
     def _sales_view_selected(self):
         row = self._selected_row(self.tbl_sales)
@@ -892,16 +1342,24 @@ class Controller(MainUI):
             return
         sale_id = int(self.tbl_sales.item(row, 0).text())
         
-        # Show the sale details in a popup dialog
-        dialog = SaleDetailsDialog(sale_id, self.currency, self)
-        dialog.exec_()
+        # Show the sale details in a popup dialog, reusing the previous one if any
+        if self._sale_details_dialog is None:
+            self._sale_details_dialog = SaleDetailsDialog(sale_id, self.currency, self, store=self.store)
+        else:
+            self._sale_details_dialog.show_sale(sale_id, self.currency)
+        self._sale_details_dialog.exec_()
 
     def _sales_delete_selected(self):
+        if self._edited_on_server():
+            return
         row = self._selected_row(self.tbl_sales)
         if row is None:
             self.msg("تنبيه", "اختر فاتورة للحذف.")
             return
         sale_id = int(self.tbl_sales.item(row, 0).text())
+        if models.get_sale_by_id(sale_id) is None:
+            self.msg("تنبيه", f"الفاتورة رقم {sale_id} مؤرشفة ولا يمكن حذفها.")
+            return
         confirm = QMessageBox.question(self, "تأكيد", f"سيتم حذف الفاتورة رقم {sale_id}.\nهل أنت متأكد؟", QMessageBox.Yes | QMessageBox.No)
         if confirm == QMessageBox.Yes:
             try:
@@ -911,6 +1369,37 @@ class Controller(MainUI):
             except Exception as e:
                 QMessageBox.warning(self, "خطأ", f"تعذر حذف الفاتورة:\n{e}")
 
+    def _sales_amend_selected(self):
+        if self._edited_on_server():
+            return
+        row = self._selected_row(self.tbl_sales)
+        if row is None:
+            self.msg("تنبيه", "اختر فاتورة للتعديل.")
+            return
+        sale_id = int(self.tbl_sales.item(row, 0).text())
+        sale = models.get_sale_with_details(sale_id).get(sale_id)
+        if not sale:
+            self.msg("خطأ", "تعذر العثور على الفاتورة.")
+            return
+        dialog = SaleAmendDialog(sale, self.currency, self.store.get_item_by_barcode, self)
+        if dialog.exec_() != QDialog.Accepted or not dialog.changes:
+            return
+        try:
+            amendment_id = models.amend_sale(sale_id, **dialog.changes)
+        except Exception as e:
+            QMessageBox.warning(self, "خطأ", f"تعذر تعديل الفاتورة:\n{e}")
+            return
+        if amendment_id is None:
+            self.msg("تنبيه", "لم يتم تغيير أي شيء.")
+            return
+        # Only this row changed: no need to reload the whole list
+        sale = models.get_sale_by_id(sale_id)
+        self.tbl_sales.item(row, 2).setText(f"{fmt_money(sale.total_price)} {self.currency}")
+        self.tbl_sales.item(row, 3).setText(
+            f"{fmt_money(sale.total_price - sale.total_purchase_price)} {self.currency}")
+        self._on_catalog_changed([])
+        self.msg("تم", f"تم تعديل الفاتورة رقم {sale_id}.")
+
     def _sales_print_selected(self):
         row = self._selected_row(self.tbl_sales)
         if row is None:
@@ -918,12 +1407,12 @@ class Controller(MainUI):
             return
         
         sale_id = int(self.tbl_sales.item(row, 0).text())
-        sale_info = models.get_sale_by_id(sale_id)
-        sale_details = models.get_sale_details(sale_id)
+        sale_info = self.store.get_sale_with_details(sale_id).get(sale_id)
         
         if not sale_info:
             self.msg("خطأ", "تعذر العثور على الفاتورة.")
             return
+        sale_details = sale_info.details
         
         # Ask for print format
         format_choice = QMessageBox.question(self, "تنسيق الطباعة", 
@@ -990,7 +1479,7 @@ class Controller(MainUI):
             </div>
             
             <div class="receipt-info">
-                <div class="info-line">التاريخ: {sale_info['datetime']}</div>
+                <div class="info-line">التاريخ: {sale_info.datetime}</div>
                 <div class="info-line">رقم الفاتورة: {sale_id}</div>
             </div>
             
@@ -1009,14 +1498,14 @@ class Controller(MainUI):
         for item in sale_details:
             html += f"""
                     <tr>
-                        <td>{item['item_name']}</td>
-                        <td>{fmt_money(item['price_each'])}</td>
-                        <td>{fmt_qty(item['quantity'])}</td>
-                        <td>{fmt_money(item['subtotal'])}</td>
+                        <td>{item.item_name}</td>
+                        <td>{fmt_money(item.price_each)}</td>
+                        <td>{fmt_qty(item.quantity)}</td>
+                        <td>{fmt_money(item.subtotal)}</td>
                     </tr>
             """
         
-        total = sale_info['total_price']
+        total = sale_info.total_price
         html += f"""
                 </tbody>
             </table>
@@ -1058,7 +1547,7 @@ class Controller(MainUI):
             </div>
             
             <div class="receipt-info">
-                <div class="info-line">التاريخ: {sale_info['datetime'][:16]}</div>
+                <div class="info-line">التاريخ: {sale_info.datetime[:16]}</div>
                 <div class="info-line">الفاتورة: #{sale_id}</div>
             </div>
             
@@ -1077,14 +1566,14 @@ class Controller(MainUI):
         for item in sale_details:
             html += f"""
                     <tr>
-                        <td>{item['item_name'][:20] + ('...' if len(item['item_name']) > 20 else '')}</td>
-                        <td>{fmt_money(item['price_each'])}</td>
-                        <td>{fmt_qty(item['quantity'])}</td>
-                        <td>{fmt_money(item['subtotal'])}</td>
+                        <td>{item.item_name[:20] + ('...' if len(item.item_name) > 20 else '')}</td>
+                        <td>{fmt_money(item.price_each)}</td>
+                        <td>{fmt_qty(item.quantity)}</td>
+                        <td>{fmt_money(item.subtotal)}</td>
                     </tr>
         """
         
-        total = sale_info['total_price']
+        total = sale_info.total_price
         html += f"""
                 </tbody>
             </table>
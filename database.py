@@ -22,15 +22,16 @@ def get_connection():
     conn.execute("PRAGMA temp_store = MEMORY;")      # Store temp tables in memory
     return conn
 
-def _table_has_item_fk_cascade_on_sale_details(conn):
-    """Check if sale_details table has CASCADE foreign key for items"""
+DELETED_ITEM_NAME = "صنف محذوف"
+
+def _sale_details_item_fk_on_delete(conn):
+    """Return the ON DELETE action of sale_details.item_id (e.g. 'CASCADE'), or None"""
     cur = conn.cursor()
     cur.execute("PRAGMA foreign_key_list(sale_details)")
-    fks = cur.fetchall()
-    for fk in fks:
-        if fk["table"] == "items" and fk["from"] == "item_id" and fk["on_delete"].lower() == "cascade":
-            return True
-    return False
+    for fk in cur.fetchall():
+        if fk["table"] == "items" and fk["from"] == "item_id":
+            return fk["on_delete"].upper()
+    return None
 
 def _table_has_column(conn, table_name, column_name):
     """Check if a table has a specific column"""
@@ -45,11 +46,240 @@ def _table_has_column(conn, table_name, column_name):
     except:
         return False
 
+# Money columns are INTEGER minor units (see money.py). Existing REAL tables are
+# converted by the migrate_* functions below.
+ITEMS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS {table} (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    category_id INTEGER,
+    barcode TEXT UNIQUE,
+    price INTEGER NOT NULL DEFAULT 0,
+    stock_count REAL NOT NULL DEFAULT 0,
+    photo_path TEXT,
+    add_date TEXT,
+    updated_at TEXT,
+    purchase_price INTEGER NOT NULL DEFAULT 0,
+    FOREIGN KEY (category_id) REFERENCES categories(id) ON DELETE SET NULL
+);
+"""
+
+SALES_SCHEMA = """
+CREATE TABLE IF NOT EXISTS {table} (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    datetime TEXT NOT NULL,
+    total_price INTEGER NOT NULL DEFAULT 0,
+    total_purchase_price INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT
+);
+"""
+
+# Sale lines snapshot the item name and barcode at commit time, so receipts read
+# one table and history stays intact when a catalog item is deleted (item_id -> NULL).
+SALE_DETAILS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS {table} (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    sale_id INTEGER NOT NULL,
+    item_id INTEGER,
+    quantity REAL NOT NULL,
+    price_each INTEGER NOT NULL,
+    subtotal INTEGER NOT NULL DEFAULT 0,
+    purchase_price_each INTEGER NOT NULL DEFAULT 0,
+    item_name TEXT NOT NULL DEFAULT '',
+    item_barcode TEXT,
+    created_at TEXT,
+    FOREIGN KEY (sale_id) REFERENCES sales(id) ON DELETE CASCADE,
+    FOREIGN KEY (item_id) REFERENCES items(id) ON DELETE SET NULL
+);
+"""
+
+# Covers receipt rendering (lines of one sale ordered by name) without touching the table
+SALE_DETAILS_RECEIPT_INDEX = """
+CREATE INDEX IF NOT EXISTS idx_sale_details_receipt ON sale_details(
+    sale_id, item_name, item_barcode, item_id, quantity, price_each, purchase_price_each, subtotal
+);
+"""
+
+# Goods receipts: stock delivered by a supplier, with the cost paid per unit (minor units)
+PURCHASE_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS suppliers (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL UNIQUE,
+        contact TEXT,
+        created_at TEXT
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS purchase_receipts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        supplier_id INTEGER,
+        datetime TEXT NOT NULL,
+        reference TEXT,
+        total_cost INTEGER NOT NULL DEFAULT 0,
+        FOREIGN KEY (supplier_id) REFERENCES suppliers(id) ON DELETE SET NULL
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS purchase_receipt_lines (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        receipt_id INTEGER NOT NULL,
+        item_id INTEGER,
+        quantity REAL NOT NULL,
+        cost_each INTEGER NOT NULL,
+        subtotal INTEGER NOT NULL,
+        FOREIGN KEY (receipt_id) REFERENCES purchase_receipts(id) ON DELETE CASCADE,
+        FOREIGN KEY (item_id) REFERENCES items(id) ON DELETE SET NULL
+    );
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_purchase_receipts_datetime ON purchase_receipts(datetime);",
+    "CREATE INDEX IF NOT EXISTS idx_purchase_receipt_lines_receipt ON purchase_receipt_lines(receipt_id);",
+    "CREATE INDEX IF NOT EXISTS idx_purchase_receipt_lines_item ON purchase_receipt_lines(item_id);",
+]
+
+def _column_type(conn, table_name, column_name):
+    """Declared type of a column (upper case), or None if the column doesn't exist"""
+    for column in conn.execute(f"PRAGMA table_info({table_name})").fetchall():
+        if column[1] == column_name:
+            return (column[2] or "").upper()
+    return None
+
+def _table_exists(conn, table_name):
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (table_name,)
+    ).fetchone() is not None
+
+def _col(conn, table, column, fallback, alias="old"):
+    """Expression reading an old column, or the fallback when the column doesn't exist"""
+    if _table_has_column(conn, table, column):
+        return f"COALESCE({alias}.{column}, {fallback})"
+    return fallback
+
+def _money(conn, table, column, alias="old"):
+    """Expression reading an old money column as integer minor units"""
+    from money import MINOR_UNITS
+    if not _table_has_column(conn, table, column):
+        return "0"
+    if _column_type(conn, table, column) == "INTEGER":
+        return f"COALESCE({alias}.{column}, 0)"
+    return f"CAST(ROUND(COALESCE({alias}.{column}, 0) * {MINOR_UNITS}) AS INTEGER)"
+
+def _rebuild_table(conn, table, schema, columns, source=None, params=()):
+    """
+    Rebuild `table` into `schema` by copying rows into a new table and renaming it.
+    columns maps each new column to an SQL expression over `source` (default: the old
+    table aliased as old). Indexes and triggers go with the old table: the callers'
+    index lists recreate them, and row counters and sales aggregates are rebuilt by
+    dbstats.install_counters and aggregates.install_aggregates.
+    """
+    import aggregates
+    import dbstats
+    cur = conn.cursor()
+    conn.commit()
+    cur.execute("PRAGMA foreign_keys = OFF;")
+    cur.execute(f"DROP TABLE IF EXISTS _{table}_new;")
+    cur.execute(schema.format(table=f"_{table}_new"))
+    cur.execute(
+        f"INSERT INTO _{table}_new ({', '.join(columns)}) "
+        f"SELECT {', '.join(columns.values())} {source or f'FROM {table} old'}",
+        params
+    )
+    cur.execute(f"DROP TABLE {table};")
+    cur.execute(f"ALTER TABLE _{table}_new RENAME TO {table};")
+    dbstats.reset_counter(conn, table)
+    aggregates.reset_aggregates(conn)
+    conn.commit()
+    cur.execute("PRAGMA foreign_keys = ON;")
+
+def migrate_items(conn):
+    """Convert items.price/purchase_price from REAL to integer minor units"""
+    if not _table_exists(conn, "items") or _column_type(conn, "items", "price") == "INTEGER":
+        return False
+    print("Migrating items prices to integer minor units...")
+    _rebuild_table(conn, "items", ITEMS_SCHEMA, {
+        "id": "old.id",
+        "name": "old.name",
+        "category_id": "old.category_id",
+        "barcode": "old.barcode",
+        "price": _money(conn, "items", "price"),
+        "stock_count": _col(conn, "items", "stock_count", "0"),
+        "photo_path": _col(conn, "items", "photo_path", "NULL"),
+        "add_date": _col(conn, "items", "add_date", "NULL"),
+        "updated_at": _col(conn, "items", "updated_at", "NULL"),
+        "purchase_price": _money(conn, "items", "purchase_price"),
+    })
+    return True
+
+def migrate_sales(conn):
+    """Convert sales totals from REAL to integer minor units"""
+    if not _table_exists(conn, "sales") or _column_type(conn, "sales", "total_price") == "INTEGER":
+        return False
+    print("Migrating sales totals to integer minor units...")
+    _rebuild_table(conn, "sales", SALES_SCHEMA, {
+        "id": "old.id",
+        "datetime": "old.datetime",
+        "total_price": _money(conn, "sales", "total_price"),
+        "total_purchase_price": _money(conn, "sales", "total_purchase_price"),
+        "created_at": _col(conn, "sales", "created_at", "NULL"),
+    })
+    return True
+
+def migrate_sale_details(conn):
+    """
+    Rebuild an older sale_details table into SALE_DETAILS_SCHEMA.
+    Older tables cascade item deletions onto sale lines, lack the item_name/item_barcode
+    snapshot, or store money as REAL; the snapshot is filled from items (or
+    DELETED_ITEM_NAME when the item is already gone) and money converted to minor units.
+    Lines of sales that no longer exist are dropped.
+    """
+    if not _table_exists(conn, "sale_details"):
+        return False
+    if (_table_has_column(conn, 'sale_details', 'item_name')
+            and _sale_details_item_fk_on_delete(conn) == "SET NULL"
+            and _column_type(conn, 'sale_details', 'price_each') == "INTEGER"):
+        return False
+
+    print("Migrating sale_details table (item snapshot, minor units)...")
+    _rebuild_table(conn, "sale_details", SALE_DETAILS_SCHEMA, {
+        "id": "old.id",
+        "sale_id": "old.sale_id",
+        "item_id": "i.id",
+        "quantity": "old.quantity",
+        "price_each": _money(conn, "sale_details", "price_each"),
+        "subtotal": (_money(conn, "sale_details", "subtotal")
+                     if _table_has_column(conn, "sale_details", "subtotal")
+                     else _money(conn, "sale_details", "price_each") + " * old.quantity"),
+        "purchase_price_each": _money(conn, "sale_details", "purchase_price_each"),
+        "item_name": _col(conn, "sale_details", "item_name", "COALESCE(i.name, ?)"),
+        "item_barcode": _col(conn, "sale_details", "item_barcode", "i.barcode"),
+        "created_at": _col(conn, "sale_details", "created_at", "datetime('now')"),
+    }, source="""
+        FROM sale_details old
+        LEFT JOIN items i ON i.id = old.item_id
+        WHERE old.sale_id IN (SELECT id FROM sales)
+    """, params=(DELETED_ITEM_NAME,))
+    return True
+
+def migrate_settings(conn):
+    """Add the theme column (see qss) to settings tables created before it existed"""
+    if not _table_has_column(conn, 'settings', 'theme'):
+        conn.execute("ALTER TABLE settings ADD COLUMN theme TEXT")
+        conn.commit()
+
+def migrate_schema(conn):
+    """Bring settings, items, sales and sale_details up to the current schemas (idempotent)"""
+    migrate_settings(conn)
+    migrate_items(conn)
+    migrate_sales(conn)
+    migrate_sale_details(conn)
+
 def setup_database():
     """Setup database with all required tables and indexes"""
     must_seed = not os.path.exists(DB_NAME)
     conn = get_connection()
     cur = conn.cursor()
+    # Only takes effect on a new, empty file; existing ones are converted by maintenance
+    cur.execute("PRAGMA auto_vacuum = INCREMENTAL;")
 
     # Settings table
     cur.execute("""
@@ -58,7 +288,8 @@ def setup_database():
         shop_name TEXT NOT NULL,
         contact TEXT,
         location TEXT,
-        currency TEXT NOT NULL
+        currency TEXT NOT NULL,
+        theme TEXT
     );
     """)
 
@@ -71,49 +302,14 @@ def setup_database():
     );
     """)
 
-    # Items table with purchase_price
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS items (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT NOT NULL,
-        category_id INTEGER,
-        barcode TEXT UNIQUE,
-        price REAL NOT NULL DEFAULT 0,
-        stock_count REAL NOT NULL DEFAULT 0,
-        photo_path TEXT,
-        add_date TEXT,
-        updated_at TEXT,
-        purchase_price REAL NOT NULL DEFAULT 0,
-        FOREIGN KEY (category_id) REFERENCES categories(id) ON DELETE SET NULL
-    );
-    """)
+    # Items table with purchase_price (money in minor units)
+    cur.execute(ITEMS_SCHEMA.format(table="items"))
 
-    # Sales table - Updated with total_purchase_price
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS sales (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        datetime TEXT NOT NULL,
-        total_price REAL NOT NULL DEFAULT 0,
-        total_purchase_price REAL NOT NULL DEFAULT 0, -- NEW: Added for profit calculation
-        created_at TEXT
-    );
-    """)
+    # Sales table - Updated with total_purchase_price (money in minor units)
+    cur.execute(SALES_SCHEMA.format(table="sales"))
 
     # Sale details table - FIXED: Added subtotal column, NEW: purchase_price_each
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS sale_details (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        sale_id INTEGER NOT NULL,
-        item_id INTEGER NOT NULL,
-        quantity REAL NOT NULL,
-        price_each REAL NOT NULL,
-        subtotal REAL NOT NULL DEFAULT 0,
-        purchase_price_each REAL NOT NULL DEFAULT 0, -- NEW: Added to record purchase price at sale time
-        created_at TEXT,
-        FOREIGN KEY (sale_id) REFERENCES sales(id) ON DELETE CASCADE,
-        FOREIGN KEY (item_id) REFERENCES items(id) -- Will migrate to CASCADE
-    );
-    """)
+    cur.execute(SALE_DETAILS_SCHEMA.format(table="sale_details"))
 
     conn.commit()
 
@@ -191,63 +387,12 @@ def setup_database():
         cur.execute("UPDATE items SET updated_at = ? WHERE updated_at IS NULL", (current_time,))
         conn.commit()
 
-    # Ensure CASCADE for item_id in sale_details
-    # This migration step is a bit more involved due to SQLite's ALTER TABLE limitations.
-    # We will create a new table, copy data, drop the old, and rename the new.
-    # This step is critical for proper deletion cascades.
-    cur.execute("PRAGMA foreign_keys = OFF;")
-    conn.commit()
-
-    cur.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name='sale_details';")
-    current_sale_details_schema = cur.fetchone()
-    
-    # Check if the existing sale_details table already has ON DELETE CASCADE for item_id
-    needs_rebuild = True
-    if current_sale_details_schema:
-        if "FOREIGN KEY (item_id) REFERENCES items(id) ON DELETE CASCADE" in current_sale_details_schema['sql']:
-            needs_rebuild = False
-
-    if needs_rebuild:
-        print("Migrating sale_details table to add CASCADE foreign key for items...")
-        cur.execute("""
-        CREATE TABLE IF NOT EXISTS _sale_details_new (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            sale_id INTEGER NOT NULL,
-            item_id INTEGER NOT NULL,
-            quantity REAL NOT NULL,
-            price_each REAL NOT NULL,
-            subtotal REAL NOT NULL DEFAULT 0,
-            purchase_price_each REAL NOT NULL DEFAULT 0,
-            created_at TEXT,
-            FOREIGN KEY (sale_id) REFERENCES sales(id) ON DELETE CASCADE,
-            FOREIGN KEY (item_id) REFERENCES items(id) ON DELETE CASCADE
-        );
-        """)
-
-        # Copy data, including existing subtotal and purchase_price_each (if they exist)
-        # Use COALESCE for created_at and default values for new columns
-        cur.execute("""
-        INSERT INTO _sale_details_new (id, sale_id, item_id, quantity, price_each, subtotal, purchase_price_each, created_at)
-        SELECT 
-            id, 
-            sale_id, 
-            item_id, 
-            quantity, 
-            price_each, 
-            COALESCE(subtotal, quantity * price_each), 
-            COALESCE(purchase_price_each, 0), -- Default to 0 if column didn't exist
-            COALESCE(created_at, datetime('now'))
-        FROM sale_details;
-        """)
-
-        cur.execute("DROP TABLE sale_details;")
-        cur.execute("ALTER TABLE _sale_details_new RENAME TO sale_details;")
-        conn.commit()
-        print("Migration completed successfully.")
-
-    cur.execute("PRAGMA foreign_keys = ON;")
-    conn.commit()
+    # Money in minor units; sale lines keep a snapshot of the item and survive item deletion
+    migrate_schema(conn)
 
+    # Suppliers and goods receipts
+    for sql in PURCHASE_SCHEMA:
+        cur.execute(sql)
 
     # Create indexes for performance
     indexes = [
@@ -255,7 +400,8 @@ def setup_database():
         "CREATE INDEX IF NOT EXISTS idx_items_category ON items(category_id);",
         "CREATE INDEX IF NOT EXISTS idx_items_stock ON items(stock_count);",
         "CREATE INDEX IF NOT EXISTS idx_sales_datetime ON sales(datetime);",
-        "CREATE INDEX IF NOT EXISTS idx_sale_details_sale_id ON sale_details(sale_id);",
+        "DROP INDEX IF EXISTS idx_sale_details_sale_id;",  # Superseded by idx_sale_details_receipt
+        SALE_DETAILS_RECEIPT_INDEX,
         "CREATE INDEX IF NOT EXISTS idx_sale_details_item_id ON sale_details(item_id);",
         "CREATE INDEX IF NOT EXISTS idx_items_name ON items(name);",
         "CREATE INDEX IF NOT EXISTS idx_sales_created_at ON sales(created_at);",
@@ -272,6 +418,24 @@ def setup_database():
 
     conn.commit()
 
+    # Trigger-maintained row counts used by get_database_stats, report aggregates, sales
+    # velocities, the inventory movement ledger, the change feed, the archive registry and
+    # the sale amendment trail
+    import aggregates
+    import amendments
+    import archive
+    import cdc
+    import dbstats
+    import inventory
+    import reorder
+    dbstats.install_counters(conn)
+    aggregates.install_aggregates(conn)
+    reorder.install_velocities(conn)
+    inventory.install_inventory(conn)
+    cdc.install_cdc(conn)
+    archive.install_archive(conn)
+    amendments.install_amendments(conn)
+
     # Seed data if new DB
     if must_seed:
         print("Seeding initial data...")
@@ -286,24 +450,15 @@ def setup_database():
     conn.close()
     print("Database setup completed successfully.")
 
-def backup_database(backup_path=None):
-    """Create a backup of the database"""
+def backup_database(backup_path=None, compress=False):
+    """Create a consistent, integrity-checked backup of the live database (see backup.online_backup)"""
     if not backup_path:
-        from datetime import datetime
         backup_path = f"store_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.db"
-    import shutil
-    shutil.copy2(DB_NAME, backup_path)
-    return backup_path
+    import backup
+    return backup.online_backup(backup_path, src_path=DB_NAME, compress=compress)
+
+def get_database_stats(include_sizes=True):
+    """Return stats: table counts, DB/WAL size, freelist, cache hit ratio & object sizes (see dbstats.get_stats)"""
+    import dbstats
+    return dbstats.get_stats(include_sizes=include_sizes)
 
-def get_database_stats():
-    """Return stats: table counts & DB size"""
-    conn = get_connection()
-    cur = conn.cursor()
-    stats = {}
-    for table in ['categories', 'items', 'sales', 'sale_details']:
-        cur.execute(f"SELECT COUNT(*) FROM {table}")
-        stats[f"{table}_count"] = cur.fetchone()[0]
-    stats['db_size_bytes'] = os.path.getsize(DB_NAME) if os.path.exists(DB_NAME) else 0
-    stats['db_size_mb'] = round(stats['db_size_bytes'] / (1024*1024), 2)
-    conn.close()
-    return stats
@@ -0,0 +1,257 @@
+# dbstats.py (cheap database statistics: trigger-maintained row counts and storage health)
+import contextlib
+import ctypes
+import os
+import platform
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import weakref
+
+import database
+
+COUNTED_TABLES = ("categories", "items", "sales", "sale_details")
+SIZE_REFRESH_SECONDS = 300  # dbstat walks every page, so object sizes are refreshed at most this often
+# Set KIOSQUE_CACHE_STATS=1 to report the page cache hit ratio of the long-lived connections
+CACHE_STATS = os.environ.get("KIOSQUE_CACHE_STATS") == "1"
+
+def install_counters(conn):
+    """
+    Create the table_counts projection and the triggers that keep it in sync.
+    Counts are seeded with one COUNT(*) only for tables that have no counter row yet
+    (first install, or after a migration dropped it with reset_counter).
+    """
+    cur = conn.cursor()
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS table_counts (
+            table_name TEXT PRIMARY KEY,
+            row_count INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    for table in COUNTED_TABLES:
+        cur.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_count_insert AFTER INSERT ON {table}
+            BEGIN
+                UPDATE table_counts SET row_count = row_count + 1 WHERE table_name = '{table}';
+            END
+        """)
+        cur.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_count_delete AFTER DELETE ON {table}
+            BEGIN
+                UPDATE table_counts SET row_count = row_count - 1 WHERE table_name = '{table}';
+            END
+        """)
+        cur.execute(
+            f"INSERT OR IGNORE INTO table_counts(table_name, row_count) SELECT ?, COUNT(*) FROM {table}",
+            (table,)
+        )
+    conn.commit()
+
+def reset_counter(conn, table):
+    """Forget the count of a table that is being rebuilt; install_counters re-seeds it."""
+    cur = conn.cursor()
+    cur.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='table_counts'")
+    if cur.fetchone():
+        cur.execute("DELETE FROM table_counts WHERE table_name = ?", (table,))
+
+def get_row_counts(conn):
+    return {row[0]: row[1] for row in conn.execute("SELECT table_name, row_count FROM table_counts")}
+
+# --- Page cache hit ratio -------------------------------------------------------------
+# sqlite3 has no API for sqlite3_db_status. With CACHE_STATS on, CPython's native handle
+# (the first field of the connection object) is read and queried through ctypes, but only
+# once that layout was checked on a scratch connection, and only for the long-lived
+# connections watched with cache_watched (short get_db connections start with a cold
+# cache every time). Counters are read when get_stats polls, never on the hot path.
+
+_SQLITE_DBSTATUS_CACHE_HIT = 7
+_SQLITE_DBSTATUS_CACHE_MISS = 8
+
+_cache_lock = threading.Lock()
+_watched = weakref.WeakSet()
+_closed_totals = [0, 0]     # Hits and misses of watched connections already closed
+_native = {}                # "lib": the sqlite3 library through ctypes, or None when unusable
+
+def _handle(conn):
+    handle = ctypes.c_void_p.from_address(id(conn) + object.__basicsize__).value
+    return handle or None
+
+def _native_lib():
+    """The sqlite3 library, once the handle layout is known to be right (None otherwise)"""
+    if "lib" in _native:
+        return _native["lib"]
+    _native["lib"] = None
+    # CPython 3.7 to 3.13 keep the sqlite3* right after the object header
+    if platform.python_implementation() != "CPython" or not (3, 7) <= sys.version_info[:2] <= (3, 13):
+        return None
+    try:
+        import _sqlite3
+        lib = ctypes.CDLL(_sqlite3.__file__)
+        lib.sqlite3_db_status.argtypes = [ctypes.c_void_p, ctypes.c_int, ctypes.POINTER(ctypes.c_int),
+                                          ctypes.POINTER(ctypes.c_int), ctypes.c_int]
+        lib.sqlite3_db_status.restype = ctypes.c_int
+        lib.sqlite3_db_filename.argtypes = [ctypes.c_void_p, ctypes.c_char_p]
+        lib.sqlite3_db_filename.restype = ctypes.c_char_p
+    except (ImportError, OSError, AttributeError):
+        return None
+    # The handle read from a scratch connection must name the file it was opened on
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    try:
+        probe = sqlite3.connect(path)
+        try:
+            handle = _handle(probe)
+            name = lib.sqlite3_db_filename(handle, b"main") if handle else None
+        finally:
+            probe.close()
+        if name and os.path.samefile(name.decode(), path):
+            _native["lib"] = lib
+    except OSError:
+        pass
+    finally:
+        os.remove(path)
+    return _native["lib"]
+
+def _cache_status(conn):
+    """(hits, misses) of a connection's page cache, or None"""
+    lib = _native_lib()
+    handle = _handle(conn) if lib else None
+    if handle is None:
+        return None
+    current, high = ctypes.c_int(), ctypes.c_int()
+    values = []
+    for op in (_SQLITE_DBSTATUS_CACHE_HIT, _SQLITE_DBSTATUS_CACHE_MISS):
+        if lib.sqlite3_db_status(handle, op, ctypes.byref(current), ctypes.byref(high), 0) != 0:
+            return None
+        values.append(current.value)
+    return values
+
+@contextlib.contextmanager
+def cache_watched(conn):
+    """Count a long-lived connection in the cache hit ratio while the block runs (before it is closed)"""
+    if not CACHE_STATS:
+        yield conn
+        return
+    with _cache_lock:
+        _watched.add(conn)
+    try:
+        yield conn
+    finally:
+        with _cache_lock:
+            _watched.discard(conn)
+            status = _cache_status(conn)
+            if status:
+                _closed_totals[0] += status[0]
+                _closed_totals[1] += status[1]
+
+def get_cache_hit_ratio():
+    """Page cache hits / lookups over the watched connections (None when off or nothing was read)"""
+    if not CACHE_STATS:
+        return None
+    with _cache_lock:
+        hits, misses = _closed_totals
+        for conn in list(_watched):
+            status = _cache_status(conn)
+            if status:
+                hits += status[0]
+                misses += status[1]
+    total = hits + misses
+    return round(hits / total, 4) if total else None
+
+# --- Object sizes via dbstat ----------------------------------------------------------
+
+_sizes_cache = {"at": None, "sizes": None, "running": False}
+_sizes_lock = threading.Lock()
+
+def refresh_object_sizes():
+    """Walk every page through the dbstat virtual table and cache {table or index name: bytes}."""
+    conn = database.get_connection()
+    try:
+        rows = conn.execute("SELECT name, SUM(pgsize) FROM dbstat GROUP BY name ORDER BY 2 DESC").fetchall()
+        sizes = {name: size for name, size in rows}
+    except sqlite3.OperationalError:
+        sizes = None  # dbstat not compiled in
+    finally:
+        conn.close()
+    with _sizes_lock:
+        _sizes_cache.update(at=time.monotonic(), sizes=sizes, running=False)
+    return sizes
+
+def _refresh_in_background():
+    try:
+        refresh_object_sizes()
+    except Exception:
+        with _sizes_lock:
+            _sizes_cache["running"] = False
+
+def get_object_sizes(max_age=SIZE_REFRESH_SECONDS):
+    """
+    Cached object sizes (see refresh_object_sizes), None until the first walk is done.
+    Once they are older than max_age a new walk starts on a background thread, so a poll
+    never waits for it.
+    """
+    with _sizes_lock:
+        stale = _sizes_cache["at"] is None or time.monotonic() - _sizes_cache["at"] >= max_age
+        start = stale and not _sizes_cache["running"]
+        if start:
+            _sizes_cache["running"] = True
+        sizes = _sizes_cache["sizes"]
+    if start:
+        threading.Thread(target=_refresh_in_background, name="DbstatSizes", daemon=True).start()
+    return sizes
+
+def get_stats(include_sizes=True):
+    """
+    Return row counts and storage health without scanning any table:
+    counts come from table_counts, the rest from pragmas, file sizes and dbstat sizes
+    refreshed in the background (None until the first refresh is done).
+    """
+    db_path = database.DB_NAME
+    conn = database.get_connection()
+    try:
+        stats = {}
+        counts = get_row_counts(conn)
+        for table in COUNTED_TABLES:
+            stats[f"{table}_count"] = counts.get(table, 0)
+
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        stats["page_size"] = page_size
+        stats["page_count"] = conn.execute("PRAGMA page_count").fetchone()[0]
+        stats["freelist_pages"] = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        stats["freelist_bytes"] = stats["freelist_pages"] * page_size
+        stats["cache_hit_ratio"] = get_cache_hit_ratio()
+        if include_sizes:
+            sizes = get_object_sizes()
+            stats["object_sizes"] = sizes
+            stats["index_sizes"] = None if sizes is None else {
+                row[0]: sizes.get(row[0], 0)
+                for row in conn.execute("SELECT name FROM sqlite_master WHERE type='index'")
+            }
+    finally:
+        conn.close()
+
+    stats["db_size_bytes"] = os.path.getsize(db_path) if os.path.exists(db_path) else 0
+    stats["db_size_mb"] = round(stats["db_size_bytes"] / (1024*1024), 2)
+    wal_path = db_path + "-wal"
+    stats["wal_size_bytes"] = os.path.getsize(wal_path) if os.path.exists(wal_path) else 0
+    stats["wal_size_mb"] = round(stats["wal_size_bytes"] / (1024*1024), 2)
+    return stats
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Print database statistics")
+    parser.add_argument("--watch", type=float, metavar="SECONDS", help="repeat every SECONDS")
+    parser.add_argument("--no-sizes", action="store_true", help="skip dbstat object sizes")
+    args = parser.parse_args()
+
+    if not args.no_sizes:
+        refresh_object_sizes()
+    while True:
+        print(json.dumps(get_stats(include_sizes=not args.no_sizes), ensure_ascii=False, indent=2))
+        if not args.watch:
+            break
+        time.sleep(args.watch)
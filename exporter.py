@@ -0,0 +1,174 @@
+# exporter.py (streaming CSV / Parquet / Arrow export of sales joined with their lines)
+import argparse
+import csv
+import os
+from datetime import date, datetime, timedelta
+
+import archive
+import models
+from money import MINOR_UNITS
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except Exception:
+    pa = None
+    pq = None
+
+EXPORT_CHUNK_SIZE = 5000
+
+# (column name, arrow type name) in output order
+EXPORT_COLUMNS = [
+    ("sale_id", "int64"),
+    ("sale_datetime", "string"),
+    ("sale_total_price", "float64"),
+    ("sale_total_purchase_price", "float64"),
+    ("line_id", "int64"),
+    ("item_id", "int64"),
+    ("item_name", "string"),
+    ("item_barcode", "string"),
+    ("quantity", "float64"),
+    ("price_each", "float64"),
+    ("purchase_price_each", "float64"),
+    ("subtotal", "float64"),
+]
+
+# Money is stored in minor units; exports stay in major units for spreadsheets and analytics.
+# One arm per schema ({{db}}: main and the archive partitions), see archive.union_all.
+_EXPORT_SQL = """
+    SELECT s.id, s.datetime, s.total_price / {minor}.0, s.total_purchase_price / {minor}.0,
+           sd.id, sd.item_id, sd.item_name, sd.item_barcode,
+           sd.quantity, sd.price_each / {minor}.0, sd.purchase_price_each / {minor}.0,
+           sd.subtotal / {minor}.0
+    FROM {{db}}.sales s
+    LEFT JOIN {{db}}.sale_details sd ON sd.sale_id = s.id
+    {where}
+"""
+
+def _bound(value):
+    """Turn a date/datetime/ISO string into the text form stored in sales.datetime"""
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return datetime.combine(value, datetime.min.time()).isoformat()
+
+def iter_sale_lines(date_from=None, date_to=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yield lists of up to chunk_size row tuples (see EXPORT_COLUMNS), one per sale line.
+    date_from is inclusive and date_to exclusive; both accept date, datetime or ISO text.
+    Archived years in the range are read from their partitions (see archive).
+    Rows are stepped out of SQLite with fetchmany, so memory stays bounded by chunk_size.
+    """
+    date_from, date_to = _bound(date_from), _bound(date_to)
+    clauses, params = [], []
+    if date_from is not None:
+        clauses.append("s.datetime >= ?")
+        params.append(date_from)
+    if date_to is not None:
+        clauses.append("s.datetime < ?")
+        params.append(date_to)
+    where = ("WHERE " + " AND ".join(clauses)) if clauses else ""
+
+    with models.get_db() as conn, archive.attached(conn, date_from, date_to) as schemas:
+        conn.row_factory = None  # Plain tuples, no per-row Row objects
+        sql, params = archive.union_all(_EXPORT_SQL.format(where=where, minor=MINOR_UNITS), schemas, params)
+        c = conn.cursor()
+        try:
+            # By sale datetime, then sale id (columns 2 and 1 of the compound select)
+            c.execute(sql + " ORDER BY 2, 1", params)
+            while True:
+                rows = c.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            c.close()  # The partitions cannot be detached while a statement is still open
+
+def _write_atomically(path, write):
+    """Run write(tmp_path) and move the result into place only once it is complete"""
+    tmp_path = path + ".part"
+    try:
+        count = write(tmp_path)
+        os.replace(tmp_path, path)
+        return count
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def export_sales_csv(path, date_from=None, date_to=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """Stream sales and their lines into a CSV file. Returns the number of rows written."""
+    def write(tmp_path):
+        count = 0
+        with open(tmp_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow([name for name, _ in EXPORT_COLUMNS])
+            for rows in iter_sale_lines(date_from, date_to, chunk_size):
+                writer.writerows(rows)
+                count += len(rows)
+        return count
+    return _write_atomically(path, write)
+
+def _arrow_schema():
+    return pa.schema([(name, getattr(pa, type_name)()) for name, type_name in EXPORT_COLUMNS])
+
+def _arrow_batches(schema, date_from, date_to, chunk_size):
+    for rows in iter_sale_lines(date_from, date_to, chunk_size):
+        columns = list(zip(*rows))
+        yield pa.RecordBatch.from_arrays(
+            [pa.array(col, type=field.type) for col, field in zip(columns, schema)],
+            schema=schema,
+        )
+
+def export_sales_parquet(path, date_from=None, date_to=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """Stream sales and their lines into a Parquet file, one row group per chunk. Returns the row count."""
+    if pq is None:
+        raise RuntimeError("pyarrow غير مثبت: لا يمكن التصدير بصيغة Parquet.")
+    schema = _arrow_schema()
+
+    def write(tmp_path):
+        count = 0
+        with pq.ParquetWriter(tmp_path, schema) as writer:
+            for batch in _arrow_batches(schema, date_from, date_to, chunk_size):
+                writer.write_table(pa.Table.from_batches([batch]))
+                count += batch.num_rows
+        return count
+    return _write_atomically(path, write)
+
+def export_sales_arrow(path, date_from=None, date_to=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """Stream sales and their lines into an Arrow IPC (Feather v2) file. Returns the row count."""
+    if pa is None:
+        raise RuntimeError("pyarrow غير مثبت: لا يمكن التصدير بصيغة Arrow.")
+    schema = _arrow_schema()
+
+    def write(tmp_path):
+        count = 0
+        with pa.OSFile(tmp_path, "wb") as sink, pa.ipc.new_file(sink, schema) as writer:
+            for batch in _arrow_batches(schema, date_from, date_to, chunk_size):
+                writer.write_batch(batch)
+                count += batch.num_rows
+        return count
+    return _write_atomically(path, write)
+
+EXPORTERS = {
+    "csv": export_sales_csv,
+    "parquet": export_sales_parquet,
+    "arrow": export_sales_arrow,
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export sales and sale details")
+    parser.add_argument("path", help="output file")
+    parser.add_argument("--format", choices=sorted(EXPORTERS), default="csv")
+    parser.add_argument("--from", dest="date_from", help="inclusive start (YYYY-MM-DD or ISO datetime)")
+    parser.add_argument("--to", dest="date_to", help="exclusive end (YYYY-MM-DD or ISO datetime)")
+    parser.add_argument("--yesterday", action="store_true", help="export yesterday's sales only")
+    parser.add_argument("--chunk-size", type=int, default=EXPORT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    if args.yesterday:
+        today = date.today()
+        args.date_from, args.date_to = today - timedelta(days=1), today
+
+    rows = EXPORTERS[args.format](args.path, args.date_from, args.date_to, args.chunk_size)
+    print(f"Exported {rows} rows to {args.path}")
@@ -0,0 +1,372 @@
+# http_api.py (embedded asyncio HTTP/JSON API: price lookup, name search, stock and bill submission)
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit, unquote
+
+import maintenance
+import models
+from instrumentation import Histogram
+from money import fmt_money, line_total
+from records import BillLine
+
+logger = logging.getLogger(__name__)
+
+# Set KIOSQUE_HTTP to host:port (or just a port) to serve the API from the till itself
+ENABLED = bool(os.environ.get("KIOSQUE_HTTP"))
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+ADDRESS = os.environ.get("KIOSQUE_HTTP") or f"{DEFAULT_HOST}:{DEFAULT_PORT}"
+KEEP_ALIVE_TIMEOUT = 15          # Seconds an idle kept-alive connection stays open
+MAX_HEADER_LINES = 100
+MAX_BODY_BYTES = 1024 * 1024
+DB_WORKERS = 4                   # Threads running the (blocking) models calls
+
+_REASONS = {200: "OK", 201: "Created", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+            411: "Length Required", 413: "Payload Too Large", 422: "Unprocessable Entity",
+            500: "Internal Server Error"}
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+def parse_address(address):
+    host, _, port = (address or "").rpartition(":")
+    return host or DEFAULT_HOST, int(port or DEFAULT_PORT)
+
+def _item_json(item):
+    return {
+        "id": item.id,
+        "name": item.name,
+        "barcode": item.barcode,
+        "category": item.category_name,
+        "price": item.price,
+        "price_text": fmt_money(item.price),
+        "stock_count": item.stock_count,
+    }
+
+class ApiServer:
+    """
+    HTTP/1.1 JSON API over asyncio streams. Connections are kept alive between requests
+    (HTTP/1.1 default, or Connection: keep-alive on 1.0) until idle for KEEP_ALIVE_TIMEOUT.
+    Handlers call the store (models, or a register_client.RegisterClient in multi-register
+    mode) on a small thread pool so the event loop never waits on SQLite. Per-route latency
+    histograms and connection reuse counts are served at GET /metrics. on_committed(sale_ids)
+    is called from a pool thread after each bill posted to /bills is written.
+
+        GET  /items/barcode/<barcode>      price check
+        GET  /items?q=<name>&limit=<n>     name search
+        GET  /items/<id>/stock             stock level
+        POST /bills                        {"lines": [{"barcode" | "id": ..., "qty": n}, ...]}
+        GET  /metrics
+    """
+
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, store=None, on_committed=None, workers=DB_WORKERS):
+        self.host = host
+        self.port = port
+        self.store = store or models
+        self.on_committed = on_committed
+        self.routes = [
+            ("GET", re.compile(r"/items/barcode/([^/]+)"), "GET /items/barcode/{barcode}", self._get_by_barcode),
+            ("GET", re.compile(r"/items"), "GET /items", self._search),
+            ("GET", re.compile(r"/items/(\d+)/stock"), "GET /items/{id}/stock", self._get_stock),
+            ("POST", re.compile(r"/bills"), "POST /bills", self._post_bill),
+            ("GET", re.compile(r"/metrics"), "GET /metrics", self._metrics),
+        ]
+        self.connections = 0
+        self.open_connections = 0
+        self.requests = 0
+        self.reused_requests = 0
+        self._stats = {}
+        self._stats_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="http_api")
+        self._server = None
+
+    # --- Handlers (run on the thread pool) ---------------------------------------------
+
+    def _get_by_barcode(self, match, query, body):
+        item = self.store.get_item_by_barcode(unquote(match.group(1)))
+        if item is None:
+            raise HttpError(404, "الباركود غير موجود")
+        return 200, _item_json(item)
+
+    def _search(self, match, query, body):
+        name = (query.get("q") or [""])[0].strip()
+        if not name:
+            raise HttpError(400, "q is required")
+        raw_limit = (query.get("limit") or ["20"])[0]
+        if not raw_limit.isdecimal() or int(raw_limit) <= 0:
+            raise HttpError(400, "limit must be a positive integer")
+        limit = int(raw_limit)
+        return 200, [_item_json(item) for item in self.store.search_items_by_name(name)[:limit]]
+
+    def _get_stock(self, match, query, body):
+        item = self.store.get_item(int(match.group(1)))
+        if item is None:
+            raise HttpError(404, "الصنف غير موجود")
+        return 200, {"id": item.id, "name": item.name, "stock_count": item.stock_count}
+
+    def _post_bill(self, match, query, body):
+        """Prices come from the catalog; a line may only give a barcode or id and a quantity."""
+        maintenance.note_activity()
+        try:
+            requested = json.loads(body or b"{}")["lines"]
+        except (ValueError, KeyError, TypeError):
+            raise HttpError(400, "body must be {\"lines\": [...]}")
+        if not isinstance(requested, list) or not all(isinstance(line, dict) for line in requested):
+            raise HttpError(422, "lines must be a list of objects")
+        if not requested:
+            raise HttpError(422, "لا توجد أصناف في الفاتورة.")
+        lines = []
+        for line in requested:
+            qty = line.get("qty", 1)
+            # bool is an int subclass, and json accepts NaN / Infinity
+            if isinstance(qty, bool) or not isinstance(qty, (int, float)) or not math.isfinite(qty) or qty <= 0:
+                raise HttpError(422, f"invalid qty: {qty!r}")
+            if "barcode" in line:
+                item = self.store.get_item_by_barcode(str(line["barcode"]))
+            else:
+                item_id = line.get("id")
+                if isinstance(item_id, bool) or not isinstance(item_id, int):
+                    raise HttpError(422, f"invalid id: {item_id!r}")
+                item = self.store.get_item(item_id)
+            if item is None:
+                raise HttpError(404, f"الصنف غير موجود: {line.get('barcode', line.get('id'))}")
+            lines.append(BillLine(item.id, item.name, item.barcode, item.price, qty,
+                                  line_total(item.price, qty), item.purchase_price))
+        sale_id = self.store.commit_bill(lines)
+        if self.on_committed is not None:
+            try:
+                self.on_committed([sale_id])
+            except Exception:
+                logger.exception("HTTP API on_committed callback failed")
+        total = sum(line.total for line in lines)
+        return 201, {"sale_id": sale_id, "total": total, "total_text": fmt_money(total)}
+
+    def _metrics(self, match, query, body):
+        with self._stats_lock:
+            routes = {name: hist.as_dict() for name, hist in self._stats.items()}
+        return 200, {
+            "connections": self.connections,
+            "open_connections": self.open_connections,
+            "requests": self.requests,
+            "reused_requests": self.reused_requests,
+            "routes": routes,
+        }
+
+    # --- HTTP ------------------------------------------------------------------------
+
+    def _route(self, method, path):
+        allowed = False
+        for route_method, pattern, name, handler in self.routes:
+            match = pattern.fullmatch(path)
+            if match:
+                if route_method == method:
+                    return name, handler, match
+                allowed = True
+        raise HttpError(405 if allowed else 404, "method not allowed" if allowed else "not found")
+
+    def _record(self, name, ms):
+        with self._stats_lock:
+            hist = self._stats.get(name)
+            if hist is None:
+                hist = self._stats[name] = Histogram()
+            hist.add(ms, 0)
+
+    async def _read_request(self, reader):
+        """Returns (method, target, version, headers, body), or None when the client closed or went idle"""
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), KEEP_ALIVE_TIMEOUT)
+        except asyncio.TimeoutError:
+            return None
+        if not request_line.strip():
+            return None
+        try:
+            method, target, version = request_line.decode("latin-1").split()
+        except ValueError:
+            raise HttpError(400, "bad request line")
+        headers = {}
+        for _ in range(MAX_HEADER_LINES):
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            key, _, value = line.decode("latin-1").partition(":")
+            headers[key.strip().lower()] = value.strip()
+        else:
+            raise HttpError(400, "too many headers")
+        if "chunked" in headers.get("transfer-encoding", "").lower():
+            raise HttpError(411, "chunked bodies are not supported")
+        raw_length = headers.get("content-length") or "0"
+        if not raw_length.isdecimal():
+            raise HttpError(400, "bad content-length")
+        length = int(raw_length)
+        if length > MAX_BODY_BYTES:
+            raise HttpError(413, "body too large")
+        body = await reader.readexactly(length) if length else b""
+        return method.upper(), target, version.upper(), headers, body
+
+    @staticmethod
+    def _keep_alive(version, headers):
+        connection = headers.get("connection", "").lower()
+        if version == "HTTP/1.0":
+            return connection == "keep-alive"
+        return connection != "close"
+
+    async def _write_response(self, writer, status, payload, keep_alive):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        head = (
+            f"HTTP/1.1 {status} {_REASONS.get(status, '')}\r\n"
+            "Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            + (f"Connection: keep-alive\r\nKeep-Alive: timeout={KEEP_ALIVE_TIMEOUT}\r\n" if keep_alive
+               else "Connection: close\r\n")
+            + "\r\n"
+        )
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
+
+    async def _handle_connection(self, reader, writer):
+        self.connections += 1
+        self.open_connections += 1
+        served = 0
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader)
+                except HttpError as e:
+                    await self._write_response(writer, e.status, {"error": e.message}, False)
+                    break
+                if request is None:
+                    break
+                method, target, version, headers, body = request
+                started = time.perf_counter()
+                keep_alive = self._keep_alive(version, headers)
+                self.requests += 1
+                if served:
+                    self.reused_requests += 1
+                served += 1
+                url = urlsplit(target)
+                name = f"{method} (unmatched)"
+                try:
+                    name, handler, match = self._route(method, url.path)
+                    status, payload = await loop.run_in_executor(
+                        self._executor, handler, match, parse_qs(url.query), body)
+                except HttpError as e:
+                    status, payload = e.status, {"error": e.message}
+                except Exception as e:
+                    logger.exception("%s %s failed", method, target)
+                    status, payload = 500, {"error": str(e)}
+                await self._write_response(writer, status, payload, keep_alive)
+                self._record(name, (time.perf_counter() - started) * 1000)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.open_connections -= 1
+            writer.close()
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        logger.info("HTTP API listening on http://%s:%d", self.host, self.port)
+
+    async def serve_forever(self):
+        if self._server is None:
+            await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+class ApiThread(threading.Thread):
+    """Runs an ApiServer on its own event loop, for serving from inside the GUI process"""
+
+    def __init__(self, server):
+        super().__init__(name="HttpApi", daemon=True)
+        self.server = server
+        self._loop = asyncio.new_event_loop()
+
+    def run(self):
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._loop.run_until_complete(self.server.serve_forever())
+        except asyncio.CancelledError:
+            pass
+
+    def stop(self):
+        if self.server._server is not None:
+            self._loop.call_soon_threadsafe(self.server._server.close)
+
+# --- Load generator -----------------------------------------------------------------
+
+async def _bench_connection(host, port, requests, barcodes, bill_ratio, latencies, statuses):
+    """One kept-alive client connection issuing requests back to back"""
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for _ in range(requests):
+            barcode = random.choice(barcodes)
+            if random.random() < bill_ratio:
+                body = json.dumps({"lines": [{"barcode": barcode, "qty": 1}]}).encode()
+                head = f"POST /bills HTTP/1.1\r\nHost: {host}\r\nContent-Length: {len(body)}\r\n\r\n"
+            else:
+                body = b""
+                head = f"GET /items/barcode/{barcode} HTTP/1.1\r\nHost: {host}\r\n\r\n"
+            started = time.perf_counter()
+            writer.write(head.encode() + body)
+            await writer.drain()
+            status = int((await reader.readline()).split()[1])
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b""):
+                    break
+                if line.lower().startswith(b"content-length:"):
+                    length = int(line.split(b":")[1])
+            await reader.readexactly(length)
+            latencies.append(time.perf_counter() - started)
+            statuses[status] = statuses.get(status, 0) + 1
+    finally:
+        writer.close()
+
+async def bench(host, port, connections, requests, bill_ratio):
+    barcodes = [item.barcode for item in models.get_items() if item.barcode]
+    latencies, statuses = [], {}
+    started = time.perf_counter()
+    await asyncio.gather(*(_bench_connection(host, port, requests, barcodes, bill_ratio, latencies, statuses)
+                           for _ in range(connections)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    print(f"{len(latencies)} requests over {connections} connections in {elapsed:.2f}s "
+          f"({len(latencies) / elapsed:.0f} req/s), statuses {statuses}")
+    if latencies:
+        print(f"latency p50 {latencies[len(latencies) // 2] * 1000:.2f}ms "
+              f"p95 {latencies[int(len(latencies) * 0.95) - 1] * 1000:.2f}ms max {latencies[-1] * 1000:.2f}ms")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the till's HTTP/JSON API, or load test a running one")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--bench", action="store_true", help="load test the API at --host/--port instead of serving")
+    parser.add_argument("--connections", type=int, default=8, help="kept-alive client connections (--bench)")
+    parser.add_argument("--requests", type=int, default=500, help="requests per connection (--bench)")
+    parser.add_argument("--bill-ratio", type=float, default=0.0, help="share of requests that POST a bill (--bench)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    if args.bench:
+        asyncio.run(bench(args.host, args.port, args.connections, args.requests, args.bill_ratio))
+    else:
+        models.init_db()
+        try:
+            asyncio.run(ApiServer(args.host, args.port).serve_forever())
+        except KeyboardInterrupt:
+            pass
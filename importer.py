@@ -0,0 +1,172 @@
+# importer.py (bulk catalog import from CSV with upsert by barcode)
+import argparse
+import csv
+import sqlite3
+from datetime import datetime
+
+import models
+from models import is_valid_barcode
+from money import to_minor
+
+IMPORT_CHUNK_SIZE = 1000
+DEFAULT_CATEGORY = "غير مصنّف"
+
+# Expected CSV header; only name and barcode are mandatory per row
+IMPORT_COLUMNS = ["name", "category", "barcode", "price", "purchase_price", "stock"]
+
+# New items start at zero stock; a row with a stock value then writes the difference
+# to its current stock as an adjustment movement (see inventory)
+_UPSERT_SQL = """
+    INSERT INTO items(name, category_id, barcode, price, purchase_price, stock_count, add_date)
+    VALUES (?, ?, ?, ?, ?, 0, ?)
+    ON CONFLICT(barcode) DO UPDATE SET
+        name = excluded.name,
+        category_id = excluded.category_id,
+        price = excluded.price,
+        purchase_price = excluded.purchase_price
+"""
+
+_STOCK_SQL = """
+    INSERT INTO inventory_movements(item_id, at, kind, delta, ref_type, note)
+    SELECT id, :now, 'adjustment', :stock - stock_count, 'import', 'csv import'
+    FROM items WHERE barcode = :barcode AND :stock IS NOT NULL AND stock_count != :stock
+"""
+
+class ImportReport:
+    def __init__(self):
+        self.inserted = 0
+        self.updated = 0
+        self.errors = []  # (line number, barcode, message)
+
+    @property
+    def ok(self):
+        return self.inserted + self.updated
+
+    def add_error(self, line_no, barcode, message):
+        self.errors.append((line_no, barcode, message))
+
+    def summary(self):
+        return f"تمت إضافة {self.inserted} صنف، وتحديث {self.updated} صنف، ورفض {len(self.errors)} سطر."
+
+    def write_errors_csv(self, path):
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["line", "barcode", "error"])
+            writer.writerows(self.errors)
+
+def _parse_number(value, field, required=False):
+    value = (value or "").strip().replace(",", ".")
+    if not value:
+        if required:
+            raise ValueError(f"{field}: قيمة مطلوبة")
+        return None
+    try:
+        number = float(value)
+    except ValueError:
+        raise ValueError(f"{field}: قيمة غير رقمية '{value}'")
+    if number < 0:
+        raise ValueError(f"{field}: قيمة سالبة")
+    return number
+
+def _flush(conn, batch, report, existing):
+    """Write one chunk in a single transaction; on failure retry row by row to pin the bad rows."""
+    if not batch:
+        return
+    try:
+        with conn:
+            conn.executemany(_UPSERT_SQL, [params for _, _, (params, _) in batch])
+            conn.executemany(_STOCK_SQL, [stock for _, _, (_, stock) in batch])
+    except sqlite3.DatabaseError:
+        for line_no, barcode, (params, stock) in batch:
+            try:
+                with conn:
+                    conn.execute(_UPSERT_SQL, params)
+                    conn.execute(_STOCK_SQL, stock)
+            except sqlite3.DatabaseError as e:
+                report.add_error(line_no, barcode, str(e))
+                continue
+            _count(report, existing, barcode)
+    else:
+        for _, barcode, _ in batch:
+            _count(report, existing, barcode)
+    batch.clear()
+
+def _count(report, existing, barcode):
+    if barcode in existing:
+        report.updated += 1
+    else:
+        report.inserted += 1
+        existing.add(barcode)
+
+def import_items_csv(path, chunk_size=IMPORT_CHUNK_SIZE, create_categories=True, encoding="utf-8-sig"):
+    """
+    Stream an items CSV (see IMPORT_COLUMNS) into the catalog, inserting new barcodes and
+    updating existing ones. Rows are validated in the same pass and written in chunked
+    transactions; categories are resolved through one in-memory name -> id map, creating
+    unknown ones when create_categories is set. Returns an ImportReport with per-row errors.
+    """
+    report = ImportReport()
+    now = datetime.now().isoformat()
+
+    with models.get_db() as conn, open(path, newline="", encoding=encoding) as f:
+        categories = {row["name"]: row["id"] for row in models.get_categories()}
+        created = False
+        existing = {row[0] for row in conn.execute("SELECT barcode FROM items WHERE barcode IS NOT NULL")}
+
+        reader = csv.DictReader(f)
+        missing = [col for col in ("name", "barcode") if col not in (reader.fieldnames or [])]
+        if missing:
+            raise ValueError(f"أعمدة مفقودة في الملف: {', '.join(missing)}")
+
+        batch = []
+        for line_no, row in enumerate(reader, start=2):
+            barcode = (row.get("barcode") or "").strip()
+            try:
+                name = (row.get("name") or "").strip()
+                if not name:
+                    raise ValueError("name: الاسم مطلوب")
+                if not is_valid_barcode(barcode):
+                    raise ValueError("barcode: الباركود غير صالح")
+                # CSV prices are in major units; the database stores minor units
+                price = to_minor(_parse_number(row.get("price"), "price") or 0)
+                purchase_price = to_minor(_parse_number(row.get("purchase_price"), "purchase_price") or 0)
+                stock = _parse_number(row.get("stock"), "stock")
+
+                cat_name = (row.get("category") or "").strip() or DEFAULT_CATEGORY
+                cat_id = categories.get(cat_name)
+                if cat_id is None:
+                    if not create_categories:
+                        raise ValueError(f"category: تصنيف غير معروف '{cat_name}'")
+                    with conn:
+                        cat_id = conn.execute("INSERT INTO categories(name) VALUES (?)", (cat_name,)).lastrowid
+                    categories[cat_name] = cat_id
+                    created = True
+            except ValueError as e:
+                report.add_error(line_no, barcode, str(e))
+                continue
+
+            batch.append((line_no, barcode, (
+                (name, cat_id, barcode, price, purchase_price, now),
+                {"now": now, "stock": stock, "barcode": barcode},
+            )))
+            if len(batch) >= chunk_size:
+                _flush(conn, batch, report, existing)
+        _flush(conn, batch, report, existing)
+
+    if created:
+        models.reload_categories()
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import catalog items from CSV")
+    parser.add_argument("path", help=f"CSV file with columns: {', '.join(IMPORT_COLUMNS)}")
+    parser.add_argument("--errors", help="write rejected rows to this CSV file")
+    parser.add_argument("--no-new-categories", action="store_true", help="reject rows with unknown categories")
+    parser.add_argument("--chunk-size", type=int, default=IMPORT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    result = import_items_csv(args.path, args.chunk_size, create_categories=not args.no_new_categories)
+    print(result.summary())
+    if args.errors and result.errors:
+        result.write_errors_csv(args.errors)
+        print(f"Rejected rows written to {args.errors}")
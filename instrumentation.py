@@ -0,0 +1,316 @@
+# instrumentation.py (latency histograms per models function and per SQL statement, plus a slow-query log)
+import functools
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import weakref
+from logging.handlers import RotatingFileHandler
+
+ENABLED = os.environ.get("KIOSQUE_PROFILE", "1") != "0"
+SLOW_QUERY_MS = float(os.environ.get("KIOSQUE_SLOW_QUERY_MS", "50"))
+SLOW_QUERY_LOG = "slow_queries.log"
+SLOW_QUERY_LOG_BYTES = 1024 * 1024
+SLOW_QUERY_LOG_BACKUPS = 3
+
+# Histogram bucket upper bounds in milliseconds (the last bucket is open-ended)
+BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, float("inf"))
+
+_lock = threading.RLock()  # Re-entered when a cursor collected mid-update records its sample (__del__)
+_function_stats = {}
+_sql_stats = {}
+_local = threading.local()
+
+_slow_logger = logging.getLogger("kiosque.slow_sql")
+_slow_logger.propagate = False
+
+def _slow_log():
+    if not _slow_logger.handlers:
+        handler = RotatingFileHandler(SLOW_QUERY_LOG, maxBytes=SLOW_QUERY_LOG_BYTES,
+                                      backupCount=SLOW_QUERY_LOG_BACKUPS, encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+        _slow_logger.addHandler(handler)
+        _slow_logger.setLevel(logging.INFO)
+    return _slow_logger
+
+class Histogram:
+    __slots__ = ("count", "total_ms", "max_ms", "rows", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.rows = 0
+        self.buckets = [0] * len(BUCKETS_MS)
+
+    def add(self, ms, rows):
+        self.count += 1
+        self.total_ms += ms
+        self.rows += rows
+        if ms > self.max_ms:
+            self.max_ms = ms
+        for i, bound in enumerate(BUCKETS_MS):
+            if ms <= bound:
+                self.buckets[i] += 1
+                break
+
+    def percentile(self, p):
+        """Upper bound (ms) of the bucket holding the p-th percentile"""
+        if not self.count:
+            return 0.0
+        target = self.count * p / 100.0
+        seen = 0
+        for bound, n in zip(BUCKETS_MS, self.buckets):
+            seen += n
+            if seen >= target:
+                return min(bound, self.max_ms)
+        return self.max_ms
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "total_ms": round(self.total_ms, 3),
+            "avg_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+            "p50_ms": self.percentile(50),
+            "p95_ms": self.percentile(95),
+            "p99_ms": self.percentile(99),
+            "max_ms": round(self.max_ms, 3),
+            "rows": self.rows,
+        }
+
+def _normalize(sql):
+    return re.sub(r"\s+", " ", sql).strip()
+
+def _record(table, key, ms, rows):
+    with _lock:
+        hist = table.get(key)
+        if hist is None:
+            hist = table[key] = Histogram()
+        hist.add(ms, rows)
+
+def _current_function():
+    stack = getattr(_local, "stack", None)
+    return stack[-1] if stack else None
+
+def record_sql(sql, ms, rows, params=None):
+    sql = _normalize(sql)
+    _record(_sql_stats, sql, ms, rows)
+    frame = _current_function()
+    if frame is not None:
+        frame[1] += rows
+    if ms >= SLOW_QUERY_MS:
+        _slow_log().info("%.2fms rows=%d func=%s sql=%s params=%s", ms, rows,
+                         frame[0] if frame else "-", sql, repr(params)[:200])
+
+def timed(func):
+    """Decorator: record latency and rows read/written for each call of a models function."""
+    if not ENABLED:
+        return func
+    name = func.__name__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        stack = getattr(_local, "stack", None)
+        if stack is None:
+            stack = _local.stack = []
+        frame = [name, 0]
+        stack.append(frame)
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            stack.pop()
+            _record(_function_stats, name, (time.perf_counter() - started) * 1000.0, frame[1])
+    return wrapper
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """
+    Cursor that times execute and fetch calls and counts rows. A statement's sample is
+    recorded once it is exhausted, re-executed, closed or dropped, or its connection is closed.
+    """
+
+    _sql = None
+
+    def _start(self, sql, params):
+        self._finish()
+        self._sql = sql
+        self._params = params
+        self._elapsed = 0.0
+        self._rows = 0
+
+    def _finish(self):
+        if self._sql is None:
+            return
+        rows = self._rows or max(self.rowcount, 0)
+        record_sql(self._sql, self._elapsed * 1000.0, rows, self._params)
+        self._sql = None
+
+    def _timed(self, method, *args):
+        started = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            self._elapsed += time.perf_counter() - started
+
+    def execute(self, sql, parameters=()):
+        self._start(sql, parameters)
+        return self._timed(super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        self._start(sql, None)
+        return self._timed(super().executemany, sql, seq_of_parameters)
+
+    def fetchone(self):
+        row = self._timed(super().fetchone)
+        if row is None:
+            self._finish()
+        else:
+            self._rows += 1
+        return row
+
+    def fetchmany(self, size=None):
+        rows = self._timed(super().fetchmany, self.arraysize if size is None else size)
+        self._rows += len(rows)
+        if not rows:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        rows = self._timed(super().fetchall)
+        self._rows += len(rows)
+        self._finish()
+        return rows
+
+    def __next__(self):
+        try:
+            row = self._timed(super().__next__)
+        except StopIteration:
+            self._finish()
+            raise
+        self._rows += 1
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        try:
+            self._finish()
+        except Exception:
+            pass
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection whose cursors (including those behind conn.execute) are InstrumentedCursors."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._cursors = weakref.WeakSet()  # Open cursors, finished on close(); dropped ones finish themselves
+
+    def cursor(self, factory=InstrumentedCursor):
+        cur = super().cursor(factory)
+        if isinstance(cur, InstrumentedCursor):
+            self._cursors.add(cur)
+        return cur
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        started = time.perf_counter()
+        try:
+            super().commit()
+        finally:
+            record_sql("COMMIT", (time.perf_counter() - started) * 1000.0, 0)
+
+    def close(self):
+        for cur in list(self._cursors):
+            cur._finish()
+        self._cursors.clear()
+        super().close()
+
+def connection_factory():
+    return InstrumentedConnection if ENABLED else sqlite3.Connection
+
+def reset():
+    with _lock:
+        _function_stats.clear()
+        _sql_stats.clear()
+
+def summary(top=20):
+    """Return {"functions": [...], "sql": [...]}, each sorted by total time, busiest first."""
+    with _lock:
+        functions = [dict(name=k, **v.as_dict()) for k, v in _function_stats.items()]
+        statements = [dict(sql=k, **v.as_dict()) for k, v in _sql_stats.items()]
+    functions.sort(key=lambda d: d["total_ms"], reverse=True)
+    statements.sort(key=lambda d: d["total_ms"], reverse=True)
+    return {"functions": functions[:top], "sql": statements[:top]}
+
+def format_summary(top=20):
+    data = summary(top)
+    lines = [f"{'function':<32}{'calls':>8}{'total ms':>12}{'avg':>9}{'p95':>9}{'max':>9}{'rows':>10}"]
+    for d in data["functions"]:
+        lines.append(f"{d['name']:<32}{d['count']:>8}{d['total_ms']:>12.1f}{d['avg_ms']:>9.2f}"
+                     f"{d['p95_ms']:>9.2f}{d['max_ms']:>9.2f}{d['rows']:>10}")
+    lines.append("")
+    lines.append(f"{'calls':>8}{'total ms':>12}{'avg':>9}{'p95':>9}{'rows':>10}  sql")
+    for d in data["sql"]:
+        lines.append(f"{d['count']:>8}{d['total_ms']:>12.1f}{d['avg_ms']:>9.2f}{d['p95_ms']:>9.2f}"
+                     f"{d['rows']:>10}  {d['sql'][:120]}")
+    return "\n".join(lines)
+
+class StartupTimer:
+    """Wall-clock breakdown of application startup: mark() after each step, summary() once up"""
+
+    def __init__(self):
+        self.started = self.last = time.perf_counter()
+        self.steps = []
+
+    def mark(self, step):
+        now = time.perf_counter()
+        self.steps.append((step, (now - self.last) * 1000))
+        self.last = now
+
+    def total_ms(self):
+        return (self.last - self.started) * 1000
+
+    def summary(self):
+        steps = ", ".join(f"{step} {ms:.0f}ms" for step, ms in self.steps)
+        return f"{steps} (total {self.total_ms():.0f}ms)"
+
+# Started when this module is first imported, which main.py does before anything else
+startup = StartupTimer()
+
+def summarize_slow_log(path=SLOW_QUERY_LOG):
+    """Aggregate a slow-query log (and its rotated files) into (count, total ms, max ms, sql) rows."""
+    pattern = re.compile(r"([\d.]+)ms rows=\d+ func=\S+ sql=(.*) params=")
+    totals = {}
+    for candidate in [path] + [f"{path}.{i}" for i in range(1, SLOW_QUERY_LOG_BACKUPS + 1)]:
+        if not os.path.exists(candidate):
+            continue
+        with open(candidate, encoding="utf-8") as f:
+            for line in f:
+                match = pattern.search(line)
+                if not match:
+                    continue
+                ms, sql = float(match.group(1)), match.group(2)
+                count, total, worst = totals.get(sql, (0, 0.0, 0.0))
+                totals[sql] = (count + 1, total + ms, max(worst, ms))
+    return sorted(((c, t, m, sql) for sql, (c, t, m) in totals.items()), key=lambda r: r[1], reverse=True)
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Summarize the slow-query log")
+    parser.add_argument("path", nargs="?", default=SLOW_QUERY_LOG)
+    parser.add_argument("--top", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'count':>7}{'total ms':>12}{'max ms':>10}  sql")
+    for count, total, worst, sql in summarize_slow_log(args.path)[:args.top]:
+        print(f"{count:>7}{total:>12.1f}{worst:>10.1f}  {sql[:140]}")
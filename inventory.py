@@ -0,0 +1,197 @@
+# inventory.py (append-only inventory movement ledger, stock_count projection and stock snapshots)
+from datetime import datetime
+
+MOVEMENT_KINDS = ("sale", "return", "receipt", "adjustment", "void")
+
+# Every stock change is one movement row; items.stock_count is the running sum of an
+# item's deltas, applied by trg_inventory_apply. `at` is when the movement was written,
+# so it grows with id. Snapshots hold an item's stock as of movement_id, written only
+# for items that moved since the previous run, so "stock as of" reads one snapshot row
+# and the movements after it.
+INVENTORY_SCHEMA = [
+    f"""
+    CREATE TABLE IF NOT EXISTS inventory_movements (
+        id INTEGER PRIMARY KEY,
+        item_id INTEGER NOT NULL,
+        at TEXT NOT NULL,
+        kind TEXT NOT NULL CHECK (kind IN ({", ".join(f"'{k}'" for k in MOVEMENT_KINDS)})),
+        delta REAL NOT NULL,
+        ref_type TEXT,
+        ref_id INTEGER,
+        note TEXT
+    )
+    """,
+    # Entries also carry the rowid, so this serves "item_id = ? AND id > ?" ranges too
+    "CREATE INDEX IF NOT EXISTS idx_inventory_movements_item ON inventory_movements(item_id)",
+    "CREATE INDEX IF NOT EXISTS idx_inventory_movements_at ON inventory_movements(at)",
+    """
+    CREATE TABLE IF NOT EXISTS inventory_snapshots (
+        item_id INTEGER NOT NULL,
+        taken_at TEXT NOT NULL,
+        stock REAL NOT NULL,
+        movement_id INTEGER NOT NULL,
+        PRIMARY KEY (item_id, taken_at)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS inventory_snapshot_runs (
+        id INTEGER PRIMARY KEY,
+        taken_at TEXT NOT NULL,
+        movement_id INTEGER NOT NULL,
+        items INTEGER NOT NULL
+    )
+    """,
+]
+
+# No foreign key to items: history outlives deleted items, and ON DELETE SET NULL
+# would be an UPDATE of the ledger
+TRIGGERS = {
+    "trg_inventory_apply": """
+        AFTER INSERT ON inventory_movements BEGIN
+            UPDATE items SET stock_count = stock_count + NEW.delta WHERE id = NEW.item_id;
+        END
+    """,
+    "trg_inventory_no_update": """
+        BEFORE UPDATE ON inventory_movements BEGIN
+            SELECT RAISE(ABORT, 'inventory_movements is append-only');
+        END
+    """,
+    "trg_inventory_no_delete": """
+        BEFORE DELETE ON inventory_movements BEGIN
+            SELECT RAISE(ABORT, 'inventory_movements is append-only');
+        END
+    """,
+}
+
+SNAPSHOT_INTERVAL_HOURS = 24
+
+def install_inventory(conn):
+    """
+    Create the ledger, snapshot tables and triggers. The first time, every item's current
+    stock is written as an opening adjustment (before the apply trigger exists, so
+    stock_count is not doubled) and a first full snapshot is taken.
+    """
+    cur = conn.cursor()
+    cur.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='inventory_movements'")
+    first_install = cur.fetchone() is None
+    for sql in INVENTORY_SCHEMA:
+        cur.execute(sql)
+    if first_install:
+        cur.execute("""
+            INSERT INTO inventory_movements(item_id, at, kind, delta, ref_type, note)
+            SELECT id, ?, 'adjustment', stock_count, 'item', 'opening balance'
+            FROM items WHERE stock_count != 0
+            ORDER BY id
+        """, (datetime.now().isoformat(),))
+    for name, body in TRIGGERS.items():
+        cur.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {body}")
+    if first_install:
+        take_snapshot(conn)
+    conn.commit()
+
+def record_movement(cur, item_id, kind, delta, ref_type=None, ref_id=None, note=None):
+    """Append one movement; the trigger applies it to items.stock_count. Runs in the caller's transaction."""
+    if item_id is None or not delta:
+        return
+    cur.execute(
+        "INSERT INTO inventory_movements(item_id, at, kind, delta, ref_type, ref_id, note) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (item_id, datetime.now().isoformat(), kind, delta, ref_type, ref_id, note)
+    )
+
+def take_snapshot(conn):
+    """
+    Snapshot the stock of every item that moved since the previous run (all items on the
+    first run). Returns the number of items written. Runs in the caller's transaction.
+    """
+    cur = conn.cursor()
+    now = datetime.now().isoformat()
+    cur.execute("SELECT MAX(movement_id) FROM inventory_snapshot_runs")
+    last = cur.fetchone()[0]
+    cur.execute("SELECT COALESCE(MAX(id), 0) FROM inventory_movements")
+    movement_id = cur.fetchone()[0]
+    if last is None:
+        cur.execute("""
+            INSERT OR REPLACE INTO inventory_snapshots(item_id, taken_at, stock, movement_id)
+            SELECT id, ?, stock_count, ? FROM items
+        """, (now, movement_id))
+    else:
+        cur.execute("""
+            INSERT OR REPLACE INTO inventory_snapshots(item_id, taken_at, stock, movement_id)
+            SELECT id, ?, stock_count, ? FROM items
+            WHERE id IN (SELECT item_id FROM inventory_movements WHERE id > ?)
+        """, (now, movement_id, last))
+    items = cur.rowcount
+    cur.execute(
+        "INSERT INTO inventory_snapshot_runs(taken_at, movement_id, items) VALUES (?, ?, ?)",
+        (now, movement_id, items)
+    )
+    return items
+
+def snapshot_if_due(conn, interval_hours=SNAPSHOT_INTERVAL_HOURS):
+    """Take a snapshot when the last one is older than interval_hours; returns items written or None."""
+    cur = conn.cursor()
+    cur.execute("SELECT MAX(taken_at) FROM inventory_snapshot_runs")
+    last = cur.fetchone()[0]
+    if last is not None and (datetime.now() - datetime.fromisoformat(last)).total_seconds() < interval_hours * 3600:
+        return None
+    # Stock and the last movement id must be read in the same write transaction
+    cur.execute("BEGIN IMMEDIATE")
+    try:
+        items = take_snapshot(conn)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return items
+
+def stock_as_of(conn, at, item_id=None):
+    """
+    Stock at time `at` (ISO text): the latest snapshot taken at or before it plus the
+    movements written after that snapshot up to `at`. With item_id, returns that item's
+    stock; otherwise {item_id: stock} for every current item.
+    """
+    if isinstance(at, datetime):
+        at = at.isoformat()
+    cur = conn.cursor()
+    cur.row_factory = None
+    if item_id is not None:
+        cur.execute("""
+            SELECT stock, movement_id FROM inventory_snapshots
+            WHERE item_id = ? AND taken_at <= ?
+            ORDER BY taken_at DESC LIMIT 1
+        """, (item_id, at))
+        stock, movement_id = cur.fetchone() or (0.0, 0)
+        cur.execute(
+            "SELECT TOTAL(delta) FROM inventory_movements WHERE item_id = ? AND id > ? AND at <= ?",
+            (item_id, movement_id, at)
+        )
+        return stock + cur.fetchone()[0]
+    cur.execute("""
+        SELECT i.id, COALESCE(s.stock, 0) + (
+            SELECT TOTAL(m.delta) FROM inventory_movements m
+            WHERE m.item_id = i.id AND m.id > COALESCE(s.movement_id, 0) AND m.at <= :at
+        )
+        FROM items i
+        LEFT JOIN inventory_snapshots s ON s.item_id = i.id AND s.taken_at = (
+            SELECT MAX(taken_at) FROM inventory_snapshots WHERE item_id = i.id AND taken_at <= :at
+        )
+    """, {"at": at})
+    return dict(cur.fetchall())
+
+def get_movements(conn, item_id, limit=200):
+    """An item's most recent movements, newest first"""
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT id, at, kind, delta, ref_type, ref_id, note FROM inventory_movements
+        WHERE item_id = ? ORDER BY id DESC LIMIT ?
+    """, (item_id, limit))
+    return [dict(row) for row in cur.fetchall()]
+
+def check_projection(conn):
+    """Items whose stock_count differs from the sum of their movements: [(item_id, stock_count, ledger)]"""
+    return conn.execute("""
+        SELECT i.id, i.stock_count, COALESCE(m.total, 0) FROM items i
+        LEFT JOIN (SELECT item_id, TOTAL(delta) AS total FROM inventory_movements GROUP BY item_id) m
+               ON m.item_id = i.id
+        WHERE ABS(i.stock_count - COALESCE(m.total, 0)) > 1e-9
+    """).fetchall()
@@ -0,0 +1,247 @@
+# journal.py (offline-first sales journal: bills are fsync'd to a local JSONL file, then applied to SQLite in batches)
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import uuid
+from datetime import datetime
+
+import dbstats
+import maintenance
+import models
+from records import BillLine
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_PATH = "sales_journal.jsonl"
+REJECTED_PATH = "sales_journal.rejected.jsonl"
+APPLY_BATCH_MAX = 64     # Most bills applied in one transaction
+RETRY_MIN = 0.5          # Seconds before retrying a batch the database refused (locked, I/O error)
+RETRY_MAX = 30.0
+
+# Journal entries (and tills' bills, see register_server) already written to the database,
+# so replaying the journal or retrying a bill is idempotent
+JOURNAL_SCHEMA = """
+CREATE TABLE IF NOT EXISTS journal_applied (
+    uid TEXT PRIMARY KEY,
+    sale_id INTEGER,
+    applied_at TEXT NOT NULL
+) WITHOUT ROWID
+"""
+
+def install_journal(conn):
+    conn.execute(JOURNAL_SCHEMA)
+    conn.commit()
+
+def read_entries(path=JOURNAL_PATH):
+    """Entries in the journal file; a torn last line (crash mid-append) is skipped."""
+    entries = []
+    try:
+        with open(path, "rb") as f:
+            for raw in f:
+                try:
+                    entries.append(json.loads(raw))
+                except ValueError:
+                    logger.warning("Skipping unreadable journal line in %s", path)
+    except FileNotFoundError:
+        pass
+    return entries
+
+def trim_torn_tail(path=JOURNAL_PATH):
+    """
+    Cut a torn last line (crash mid-append) off the journal so the next append starts on
+    a line of its own; returns the number of bytes removed. The torn entry was never
+    acknowledged: append() returns only once the whole line is fsync'd.
+    """
+    try:
+        f = open(path, "r+b")
+    except FileNotFoundError:
+        return 0
+    with f:
+        size = end = f.seek(0, os.SEEK_END)
+        while end > 0:
+            start = max(0, end - 4096)
+            f.seek(start)
+            newline = f.read(end - start).rfind(b"\n")
+            if newline >= 0:
+                end = start + newline + 1
+                break
+            end = start
+        if end == size:
+            return 0
+        f.truncate(end)
+        f.flush()
+        os.fsync(f.fileno())
+    logger.warning("Cut a torn line of %d bytes off the end of %s", size - end, path)
+    return size - end
+
+class SalesJournal(threading.Thread):
+    """
+    Checkout side: append() writes the bill to the journal and fsyncs it, then returns;
+    the sale is safe from that point. This thread applies queued entries to SQLite in
+    batches, each bill with its journal uid in journal_applied, so an entry is written
+    at most once however often it is replayed. When the database refuses a batch
+    (locked, I/O error, corruption) the batch is retried with backoff and stays in the
+    journal. The file is emptied whenever every entry in it has been applied.
+    on_applied(sale_ids) is called from this thread after each batch.
+    """
+
+    def __init__(self, path=JOURNAL_PATH, on_applied=None, batch_max=APPLY_BATCH_MAX):
+        super().__init__(name="SalesJournal", daemon=True)
+        self.path = path
+        self.on_applied = on_applied
+        self.batch_max = batch_max
+        self.applied = 0
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._unapplied = 0
+        trim_torn_tail(path)
+        self._file = open(path, "ab")
+        self._stop_event = threading.Event()
+
+    def pending(self):
+        """Entries appended (or replayed) but not yet applied"""
+        with self._lock:
+            return self._unapplied
+
+    def replay(self):
+        """Queue every entry left in the journal by the previous run; call before start()."""
+        entries = read_entries(self.path)
+        with self._lock:
+            self._unapplied += len(entries)
+        for entry in entries:
+            self._queue.put(entry)
+        if entries:
+            logger.info("Replaying %d journal entries", len(entries))
+        return len(entries)
+
+    def append(self, lines, sale_datetime=None):
+        """Journal a bill (BillLine records; custom lines are dropped) and queue it; returns its uid."""
+        entry = {
+            "uid": uuid.uuid4().hex,
+            "at": sale_datetime or datetime.now().isoformat(),
+            "lines": [line._asdict() for line in lines if not line.is_custom],
+        }
+        data = (json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._lock:
+            self._file.write(data)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._unapplied += 1
+        self._queue.put(entry)
+        return entry["uid"]
+
+    def stop(self, timeout=5.0):
+        """Apply what is queued (waiting up to timeout) and stop; anything left is replayed next start."""
+        self._stop_event.set()
+        self._queue.put(None)
+        self.join(timeout)
+
+    def run(self):
+        delay = RETRY_MIN
+        with models.get_db() as conn, dbstats.cache_watched(conn):
+            install_journal(conn)
+            batch = []
+            while True:
+                if not batch:
+                    entry = self._queue.get()
+                    if entry is None:
+                        break
+                    batch.append(entry)
+                stopping = False
+                while len(batch) < self.batch_max:
+                    try:
+                        entry = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if entry is None:
+                        stopping = True
+                        break
+                    batch.append(entry)
+                maintenance.note_activity()
+                try:
+                    sale_ids = self._apply(conn, batch)
+                except sqlite3.Error as e:
+                    logger.warning("Applying %d journal entries failed (%s); retrying in %.1fs", len(batch), e, delay)
+                    if stopping or self._stop_event.wait(delay):
+                        break
+                    delay = min(delay * 2, RETRY_MAX)
+                    continue
+                delay = RETRY_MIN
+                self._applied(len(batch))
+                batch = []
+                if self.on_applied is not None:
+                    try:
+                        self.on_applied(sale_ids)
+                    except Exception:
+                        logger.exception("Journal on_applied callback failed")
+                if stopping:
+                    break
+        self._file.close()
+
+    def _apply(self, conn, batch):
+        """Write the batch in one transaction; returns the ids of the sales created."""
+        sale_ids = []
+        c = conn.cursor()
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            for entry in batch:
+                c.execute("SELECT 1 FROM journal_applied WHERE uid = ?", (entry["uid"],))
+                if c.fetchone():
+                    continue  # Applied before the journal was last emptied (e.g. a crash in between)
+                c.execute("SAVEPOINT entry")
+                try:
+                    sale_id = self._write_entry(c, entry)
+                except sqlite3.IntegrityError as e:
+                    sale_id = self._reject(c, entry, e)
+                except sqlite3.Error:
+                    raise  # Locked, I/O or corruption: retry the whole batch later
+                except Exception as e:
+                    sale_id = self._reject(c, entry, e)
+                c.execute(
+                    "INSERT INTO journal_applied(uid, sale_id, applied_at) VALUES (?, ?, ?)",
+                    (entry["uid"], sale_id, datetime.now().isoformat())
+                )
+                c.execute("RELEASE entry")
+                if sale_id is not None:
+                    sale_ids.append(sale_id)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return sale_ids
+
+    def _write_entry(self, c, entry):
+        lines = [BillLine(**line) for line in entry["lines"]]
+        if not lines:
+            return None
+        # Items deleted since checkout: keep the line with its name snapshot, unlinked
+        ids = tuple({line.id for line in lines})
+        c.execute(f"SELECT id FROM items WHERE id IN ({', '.join('?' * len(ids))})", ids)
+        existing = {row[0] for row in c.fetchall()}
+        for line in lines:
+            if line.id not in existing:
+                line.id = None
+        return models.write_bill(c, lines, entry["at"])
+
+    def _reject(self, c, entry, error):
+        """Set aside an entry that can never be applied instead of retrying it forever"""
+        c.execute("ROLLBACK TO entry")
+        logger.error("Rejected journal entry %s: %s", entry.get("uid"), error)
+        with open(REJECTED_PATH, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"error": str(error), "entry": entry}, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        return None
+
+    def _applied(self, count):
+        with self._lock:
+            self.applied += count
+            self._unapplied -= count
+            if self._unapplied == 0:
+                # Everything in the file is in the database; start it afresh
+                self._file.truncate(0)
+                self._file.flush()
+                os.fsync(self._file.fileno())
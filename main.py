@@ -1,10 +1,73 @@
 # main.py
+import instrumentation  # First, so the startup timer covers the other imports
 import sys
+import logging
+from PyQt5.QtCore import QTimer
 from PyQt5.QtWidgets import QApplication
 from controllers import Controller
+import backup
+import http_api
+import journal
+import maintenance
+import models
+import qss
+import register_client
+import stall_monitor
+
+def _log_startup():
+    """Runs once the event loop is idle after the window first showed: the till can take scans"""
+    instrumentation.startup.mark("first_frame")
+    logging.getLogger("kiosque.startup").info("Startup: %s", instrumentation.startup.summary())
 
 if __name__ == "__main__":
+    logging.basicConfig(filename="kiosque.log", level=logging.INFO,
+                        format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    instrumentation.startup.mark("imports")
     app = QApplication(sys.argv)
-    window = Controller()
+    # One application-wide stylesheet, set before any widget exists so each is polished once
+    qss.apply_theme(app, models.get_theme() or qss.DEFAULT_THEME)
+    instrumentation.startup.mark("qapplication")
+    # Opt-in (KIOSQUE_WATCHDOG=1): log the GUI stack whenever the event loop stalls
+    monitor = None
+    if stall_monitor.ENABLED:
+        monitor = stall_monitor.StallMonitor()
+        monitor.start()
+    # Multi-register mode (KIOSQUE_SERVER=<socket path or host:port>): the checkout goes
+    # through register_server, which owns the database
+    store = register_client.RegisterClient() if register_client.ENABLED else None
+    # Standalone tills journal every bill before it reaches the database; entries left
+    # unapplied by the previous run are replayed first
+    sales_journal = None
+    if store is None:
+        sales_journal = journal.SalesJournal()
+        sales_journal.replay()
+        instrumentation.startup.mark("journal_replay")
+    window = Controller(store=store, journal=sales_journal)
+    if sales_journal is not None:
+        sales_journal.on_applied = window.bills_applied.emit
+        sales_journal.start()
     window.show()
-    sys.exit(app.exec_())
\ No newline at end of file
+    instrumentation.startup.mark("show")
+    QTimer.singleShot(0, _log_startup)
+    # Opt-in (KIOSQUE_HTTP=<host:port>): price lookups and bill submission over HTTP/JSON
+    api_thread = None
+    if http_api.ENABLED:
+        api_thread = http_api.ApiThread(http_api.ApiServer(
+            *http_api.parse_address(http_api.ADDRESS), store=store, on_committed=window.bills_applied.emit))
+        api_thread.start()
+    # Periodic online backups while the till is running
+    backup_scheduler = backup.BackupScheduler()
+    backup_scheduler.start()
+    # Checkpoints, PRAGMA optimize and incremental vacuum while the till is idle
+    maintenance_scheduler = maintenance.MaintenanceScheduler()
+    maintenance_scheduler.start()
+    exit_code = app.exec_()
+    if api_thread is not None:
+        api_thread.stop()
+    if sales_journal is not None:
+        sales_journal.stop()
+    maintenance_scheduler.stop()
+    backup_scheduler.stop()
+    if monitor is not None:
+        monitor.stop()
+    sys.exit(exit_code)
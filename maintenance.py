@@ -0,0 +1,156 @@
+# maintenance.py (idle-time database maintenance: WAL checkpoints, PRAGMA optimize, incremental vacuum, inventory snapshots, change feed pruning, sales archival)
+import logging
+import threading
+import time
+
+import archive
+import cdc
+import database
+import inventory
+
+logger = logging.getLogger(__name__)
+
+MAINTENANCE_IDLE_SECONDS = 120      # No scan/bill activity for this long counts as idle
+MAINTENANCE_MIN_INTERVAL = 30 * 60  # At most one full maintenance run per this many seconds
+MAINTENANCE_CHECK_INTERVAL = 30     # How often the scheduler wakes up (and runs a passive checkpoint)
+VACUUM_PAGES_PER_RUN = 2000         # Free pages returned to the OS per incremental_vacuum run
+
+_last_activity = time.monotonic()
+
+def note_activity():
+    """
+    Called on scans and bill writes (UI, HTTP API, register server, sales journal);
+    maintenance waits until the till is idle.
+    """
+    global _last_activity
+    _last_activity = time.monotonic()
+
+def idle_seconds():
+    return time.monotonic() - _last_activity
+
+def checkpoint(mode="PASSIVE"):
+    """Run PRAGMA wal_checkpoint(mode); returns (busy, wal_frames, checkpointed_frames)."""
+    conn = database.get_connection()
+    try:
+        return tuple(conn.execute(f"PRAGMA wal_checkpoint({mode})").fetchone())
+    finally:
+        conn.close()
+
+def optimize():
+    """PRAGMA optimize: re-ANALYZE only the tables whose statistics look stale."""
+    conn = database.get_connection()
+    try:
+        conn.execute("PRAGMA optimize")
+    finally:
+        conn.close()
+
+def ensure_incremental_auto_vacuum():
+    """
+    Switch the database to auto_vacuum=INCREMENTAL. Existing files need one full VACUUM
+    for the change to take effect; returns True when that conversion was done now.
+    """
+    conn = database.get_connection()
+    try:
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+            return False
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+        return True
+    finally:
+        conn.close()
+
+def incremental_vacuum(max_pages=VACUUM_PAGES_PER_RUN):
+    """Return up to max_pages free pages to the filesystem; returns the number of pages freed."""
+    conn = database.get_connection()
+    try:
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            return 0
+        before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        # sqlite3 steps a statement without result columns only once, and each step of
+        # incremental_vacuum frees a single page, so repeat it inside one transaction.
+        conn.execute("BEGIN")
+        for _ in range(min(before, int(max_pages))):
+            conn.execute("PRAGMA incremental_vacuum")
+        conn.commit()
+        return before - conn.execute("PRAGMA freelist_count").fetchone()[0]
+    finally:
+        conn.close()
+
+def snapshot_inventory():
+    """Write the periodic inventory snapshot when one is due; returns items written or None."""
+    conn = database.get_connection()
+    try:
+        return inventory.snapshot_if_due(conn)
+    finally:
+        conn.close()
+
+def prune_change_log():
+    """Drop change feed rows older than cdc.RETENTION_DAYS; returns the number removed."""
+    conn = database.get_connection()
+    try:
+        return cdc.prune_changes(conn)
+    finally:
+        conn.close()
+
+def archive_closed_years():
+    """Move years closed for archive.ARCHIVE_GRACE_DAYS into their partitions; returns {year: sales moved}."""
+    conn = database.get_connection()
+    try:
+        return archive.archive_closed_years(conn)
+    finally:
+        conn.close()
+
+def run_maintenance():
+    """Run every maintenance step once, logging and returning {step: seconds taken}."""
+    steps = [
+        ("checkpoint_truncate", lambda: checkpoint("TRUNCATE")),
+        ("optimize", optimize),
+        ("inventory_snapshot", snapshot_inventory),
+        ("change_log_prune", prune_change_log),
+        ("archive_closed_years", archive_closed_years),
+        ("auto_vacuum_incremental", ensure_incremental_auto_vacuum),
+        ("incremental_vacuum", incremental_vacuum),
+    ]
+    timings = {}
+    for name, step in steps:
+        started = time.perf_counter()
+        try:
+            result = step()
+        except Exception:
+            logger.exception("Maintenance step %s failed", name)
+            continue
+        timings[name] = round(time.perf_counter() - started, 4)
+        logger.info("Maintenance %s took %.3fs (result: %s)", name, timings[name], result)
+    return timings
+
+class MaintenanceScheduler(threading.Thread):
+    """
+    Background thread that runs a passive checkpoint every check interval and a full
+    run_maintenance() once the till has been idle for idle_seconds, at most every min_interval.
+    """
+
+    def __init__(self, idle_seconds=MAINTENANCE_IDLE_SECONDS, min_interval=MAINTENANCE_MIN_INTERVAL,
+                 check_interval=MAINTENANCE_CHECK_INTERVAL):
+        super().__init__(name="MaintenanceScheduler", daemon=True)
+        self.idle_seconds = idle_seconds
+        self.min_interval = min_interval
+        self.check_interval = check_interval
+        self.last_run = None
+        self.last_timings = None
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.check_interval):
+            try:
+                checkpoint("PASSIVE")
+            except Exception:
+                logger.exception("Passive checkpoint failed")
+            if idle_seconds() < self.idle_seconds:
+                continue
+            if self.last_run is not None and time.monotonic() - self.last_run < self.min_interval:
+                continue
+            self.last_timings = run_maintenance()
+            self.last_run = time.monotonic()
+
+    def stop(self):
+        self._stop_event.set()
@@ -1,22 +1,52 @@
 # models.py (fixed with all required functions)
 import sqlite3
-from datetime import datetime
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
 from contextlib import contextmanager
 
+import aggregates
+import amendments
+import archive
+import cdc
+import database
+import dbstats
+import instrumentation
+import inventory
+import reorder
+from instrumentation import timed
+from money import line_total
+from records import Item, Sale, SaleLine, ITEM_COLUMNS, SALE_COLUMNS, SALE_LINE_COLUMNS
+
 DB_PATH = "store.db"
 
+ALLOWED_BARCODE_LENGTHS = {8, 12, 13}
+
+def is_valid_barcode(code: str) -> bool:
+    return code.isdigit() and (len(code) in ALLOWED_BARCODE_LENGTHS)
+
+# Small LRU cache of recently viewed sales (header + lines), keyed by sale id.
+# Entries are dropped whenever a sale, one of its lines or a referenced item changes.
+SALE_CACHE_SIZE = 64
+_sale_cache = OrderedDict()
+_sale_cache_lock = threading.Lock()
+
 @contextmanager
 def get_db():
-    conn = sqlite3.connect(DB_PATH)
+    conn = sqlite3.connect(DB_PATH, factory=instrumentation.connection_factory())
     conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA foreign_keys = ON")  # Needed for sale line cascades / SET NULL
     try:
         yield conn
     finally:
         conn.close()
 
+@timed
 def init_db():
     with get_db() as conn:
         c = conn.cursor()
+        # Only takes effect on a new, empty file; existing ones are converted by maintenance
+        c.execute("PRAGMA auto_vacuum = INCREMENTAL")
         # Settings table
         c.execute("""
             CREATE TABLE IF NOT EXISTS settings (
@@ -24,7 +54,8 @@ def init_db():
                 shop_name TEXT NOT NULL DEFAULT 'متجري',
                 contact TEXT,
                 location TEXT,
-                currency TEXT DEFAULT 'د.ج'
+                currency TEXT DEFAULT 'د.ج',
+                theme TEXT
             )
         """)
         # Categories table
@@ -34,50 +65,24 @@ def init_db():
                 name TEXT NOT NULL UNIQUE
             )
         """)
-        # Items table (with purchase_price column)
-        c.execute("""
-            CREATE TABLE IF NOT EXISTS items (
-                id INTEGER PRIMARY KEY,
-                name TEXT NOT NULL,
-                category_id INTEGER,
-                barcode TEXT UNIQUE,
-                price REAL NOT NULL DEFAULT 0,
-                purchase_price REAL DEFAULT 0,
-                stock_count REAL DEFAULT 0,
-                photo_path TEXT,
-                add_date TEXT,
-                FOREIGN KEY (category_id) REFERENCES categories (id) ON DELETE SET NULL
-            )
-        """)
-        # Sales table (with total_purchase_price column)
-        c.execute("""
-            CREATE TABLE IF NOT EXISTS sales (
-                id INTEGER PRIMARY KEY,
-                datetime TEXT NOT NULL,
-                total_price REAL NOT NULL,
-                total_purchase_price REAL NOT NULL DEFAULT 0
-            )
-        """)
-        # Sale Details table (with subtotal and purchase_price_each columns)
-        c.execute("""
-            CREATE TABLE IF NOT EXISTS sale_details (
-                id INTEGER PRIMARY KEY,
-                sale_id INTEGER NOT NULL,
-                item_id INTEGER,
-                quantity REAL NOT NULL,
-                price_each REAL NOT NULL,
-                purchase_price_each REAL DEFAULT 0,
-                subtotal REAL NOT NULL,
-                FOREIGN KEY (sale_id) REFERENCES sales (id) ON DELETE CASCADE,
-                FOREIGN KEY (item_id) REFERENCES items (id) ON DELETE SET NULL
-            )
-        """)
+        # Items table (with purchase_price column, money in minor units)
+        c.execute(database.ITEMS_SCHEMA.format(table="items"))
+        # Sales table (with total_purchase_price column, money in minor units)
+        c.execute(database.SALES_SCHEMA.format(table="sales"))
+        # Sale Details table (with subtotal, purchase_price_each and item name/barcode snapshot)
+        c.execute(database.SALE_DETAILS_SCHEMA.format(table="sale_details"))
+        database.migrate_schema(conn)
+
+        # Suppliers and goods receipts (see purchases)
+        for sql in database.PURCHASE_SCHEMA:
+            c.execute(sql)
 
         # Create indexes if they don't exist
         c.execute("CREATE INDEX IF NOT EXISTS idx_items_barcode ON items(barcode)")
         c.execute("CREATE INDEX IF NOT EXISTS idx_items_category_id ON items(category_id)")
         c.execute("CREATE INDEX IF NOT EXISTS idx_sales_datetime ON sales(datetime)")
-        c.execute("CREATE INDEX IF NOT EXISTS idx_sale_details_sale_id ON sale_details(sale_id)")
+        c.execute("DROP INDEX IF EXISTS idx_sale_details_sale_id")  # Superseded by idx_sale_details_receipt
+        c.execute(database.SALE_DETAILS_RECEIPT_INDEX)
         c.execute("CREATE INDEX IF NOT EXISTS idx_sale_details_item_id ON sale_details(item_id)")
         c.execute("CREATE INDEX IF NOT EXISTS idx_items_purchase_price ON items(purchase_price)") # Index for purchase price
         c.execute("CREATE INDEX IF NOT EXISTS idx_sales_total_purchase_price ON sales(total_purchase_price)") # Index for sales total purchase price
@@ -86,6 +91,18 @@ def init_db():
 
         conn.commit()
 
+        # Trigger-maintained row counts (see dbstats), report aggregates (see aggregates),
+        # sales velocities (see reorder), the inventory movement ledger (see inventory),
+        # the change feed (see cdc), the registry of archived years (see archive) and the
+        # sale amendment trail (see amendments)
+        dbstats.install_counters(conn)
+        aggregates.install_aggregates(conn)
+        reorder.install_velocities(conn)
+        inventory.install_inventory(conn)
+        cdc.install_cdc(conn)
+        archive.install_archive(conn)
+        amendments.install_amendments(conn)
+
         # Seed data if new DB
         cur = conn.cursor()
         cur.execute("SELECT COUNT(*) FROM categories")
@@ -97,115 +114,225 @@ def init_db():
             conn.commit()
             print("Initial data seeded.")
 
+# Settings and categories, loaded once per process and updated in place by save_settings,
+# save_theme and add_category, so lookups on the checkout path never touch the database.
+# Functions in settings_listeners / categories_listeners are called (on the writer's
+# thread) with the new settings dict / category list after every change.
+_registry = {}
+_registry_lock = threading.Lock()
+settings_listeners = []
+categories_listeners = []
+
+def _notify(listeners, value):
+    for listener in list(listeners):
+        listener(value)
+
+def _settings_row(conn):
+    row = conn.execute("SELECT * FROM settings WHERE id = 1").fetchone()
+    return dict(row) if row else None
+
+def _categories_rows(conn):
+    return [dict(row) for row in conn.execute("SELECT * FROM categories ORDER BY name")]
+
+def _cached_settings():
+    with _registry_lock:
+        if "settings" not in _registry:
+            with get_db() as conn:
+                _registry["settings"] = _settings_row(conn)
+        return _registry["settings"]
+
+def _cached_categories():
+    with _registry_lock:
+        if "categories" not in _registry:
+            with get_db() as conn:
+                rows = _categories_rows(conn)
+            _registry["categories"] = rows
+            _registry["categories_by_name"] = {row["name"]: row for row in rows}
+        return _registry["categories"], _registry["categories_by_name"]
+
 def get_settings():
-    with get_db() as conn:
-        c = conn.cursor()
-        c.execute("SELECT * FROM settings WHERE id = 1")
-        settings = c.fetchone()
-        if settings:
-            return dict(settings)
-        return None
+    settings = _cached_settings()
+    return dict(settings) if settings else None
 
+@timed
 def save_settings(shop_name, contact, location, currency):
     with get_db() as conn:
         c = conn.cursor()
         c.execute("""
-            INSERT OR REPLACE INTO settings (id, shop_name, contact, location, currency)
+            INSERT INTO settings (id, shop_name, contact, location, currency)
             VALUES (1, ?, ?, ?, ?)
+            ON CONFLICT(id) DO UPDATE SET shop_name = excluded.shop_name, contact = excluded.contact,
+                location = excluded.location, currency = excluded.currency
         """, (shop_name, contact, location, currency))
         conn.commit()
+        with _registry_lock:
+            settings = _registry.get("settings")
+            if settings is None:
+                settings = _registry["settings"] = _settings_row(conn)
+            else:
+                settings.update(shop_name=shop_name, contact=contact, location=location, currency=currency)
+            settings = dict(settings)
+    _notify(settings_listeners, settings)
+
+def get_theme():
+    """Saved theme name (see qss.THEMES), or None"""
+    settings = _cached_settings()
+    return settings.get("theme") if settings else None
+
+@timed
+def save_theme(theme):
+    with get_db() as conn:
+        conn.execute("UPDATE settings SET theme = ? WHERE id = 1", (theme,))
+        conn.commit()
+    with _registry_lock:
+        settings = _registry.get("settings")
+        if settings is not None:
+            settings["theme"] = theme
+    _notify(settings_listeners, get_settings())
 
+@timed
 def add_category(name):
     with get_db() as conn:
         c = conn.cursor()
         c.execute("INSERT INTO categories(name) VALUES (?)", (name,))
+        row = dict(c.execute("SELECT * FROM categories WHERE id = ?", (c.lastrowid,)).fetchone())
         conn.commit()
+    with _registry_lock:
+        rows = _registry.get("categories")
+        if rows is not None:
+            # Kept in name order, as ORDER BY name returns them
+            position = next((i for i, other in enumerate(rows) if other["name"] > name), len(rows))
+            rows.insert(position, row)
+            _registry["categories_by_name"][name] = row
+    _notify(categories_listeners, get_categories())
 
 def get_categories():
-    with get_db() as conn:
-        c = conn.cursor()
-        c.execute("SELECT * FROM categories ORDER BY name")
-        return [dict(row) for row in c.fetchall()]
+    rows, _ = _cached_categories()
+    with _registry_lock:
+        return [dict(row) for row in rows]
 
 def get_category_by_name(name):
-    with get_db() as conn:
-        c = conn.cursor()
-        c.execute("SELECT * FROM categories WHERE name = ?", (name,))
-        cat = c.fetchone()
-        return dict(cat) if cat else None
+    _, by_name = _cached_categories()
+    row = by_name.get(name)
+    return dict(row) if row else None
 
+@timed
+def reload_categories():
+    """Re-read the categories after they were written behind the registry's back (see importer)"""
+    with get_db() as conn:
+        rows = _categories_rows(conn)
+    with _registry_lock:
+        _registry["categories"] = rows
+        _registry["categories_by_name"] = {row["name"]: row for row in rows}
+    _notify(categories_listeners, [dict(row) for row in rows])
+
+# stock_count is only ever changed through inventory movements (see inventory)
+@timed
 def add_item(name, category_id, barcode, price, stock_count, photo_path, purchase_price=0):
     with get_db() as conn:
         c = conn.cursor()
         c.execute(
-            "INSERT INTO items(name, category_id, barcode, price, stock_count, photo_path, add_date, purchase_price) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
-            (name, category_id, barcode, price, stock_count, photo_path, datetime.now().isoformat(), purchase_price)
+            "INSERT INTO items(name, category_id, barcode, price, stock_count, photo_path, add_date, purchase_price) VALUES (?, ?, ?, ?, 0, ?, ?, ?)",
+            (name, category_id, barcode, price, photo_path, datetime.now().isoformat(), purchase_price)
         )
+        item_id = c.lastrowid
+        inventory.record_movement(c, item_id, "adjustment", stock_count, "item", note="opening balance")
         conn.commit()
-
-def update_item(item_id, name, category_id, barcode, price, stock_count, photo_path, purchase_price=0):
+    return item_id
+
+@timed
+def update_item(item_id, name, category_id, barcode, price, stock_count, photo_path, purchase_price=0, expected_stock=None):
+    """
+    Save the stock form. The stock change is written as an adjustment of
+    stock_count - expected_stock (the value the form was loaded with), so sales
+    committed in the meantime are kept; without expected_stock the current stock is used.
+    """
     with get_db() as conn:
         c = conn.cursor()
         c.execute(
-            "UPDATE items SET name=?, category_id=?, barcode=?, price=?, stock_count=?, photo_path=?, purchase_price=? WHERE id=?",
-            (name, category_id, barcode, price, stock_count, photo_path, purchase_price, item_id)
+            "UPDATE items SET name=?, category_id=?, barcode=?, price=?, photo_path=?, purchase_price=? WHERE id=?",
+            (name, category_id, barcode, price, photo_path, purchase_price, item_id)
         )
+        if expected_stock is None:
+            c.execute("SELECT stock_count FROM items WHERE id=?", (item_id,))
+            row = c.fetchone()
+            expected_stock = row[0] if row else stock_count
+        inventory.record_movement(c, item_id, "adjustment", stock_count - expected_stock, "item")
         conn.commit()
 
+@timed
 def delete_item(item_id):
     with get_db() as conn:
         c = conn.cursor()
+        # Close the item's ledger at zero so a reused id starts from a clean history
+        c.execute("SELECT stock_count FROM items WHERE id=?", (item_id,))
+        row = c.fetchone()
+        if row:
+            inventory.record_movement(c, item_id, "adjustment", -row[0], "item", note="item deleted")
         c.execute("DELETE FROM items WHERE id=?", (item_id,))
         conn.commit()
+    # Sale lines keep their snapshot but lose item_id (ON DELETE SET NULL)
+    invalidate_sale_cache()
 
+# Item, Sale and SaleLine records are built straight from plain cursor tuples
+# (row_factory None), skipping the sqlite3.Row and dict copies per row.
+@timed
 def get_items():
     with get_db() as conn:
         c = conn.cursor()
-        c.execute("""
-            SELECT i.*, c.name as category_name 
+        c.row_factory = None
+        c.execute(f"""
+            SELECT {ITEM_COLUMNS}
             FROM items i 
             LEFT JOIN categories c ON i.category_id = c.id
             ORDER BY i.name
         """)
-        return [dict(row) for row in c.fetchall()]
+        return Item.from_rows(c.fetchall())
 
+@timed
 def get_item_by_barcode(barcode):
     with get_db() as conn:
         c = conn.cursor()
-        c.execute("""
-            SELECT i.*, c.name as category_name 
+        c.row_factory = None
+        c.execute(f"""
+            SELECT {ITEM_COLUMNS}
             FROM items i 
             LEFT JOIN categories c ON i.category_id = c.id 
             WHERE i.barcode = ?
         """, (barcode,))
         item = c.fetchone()
-        return dict(item) if item else None
+        return Item(*item) if item else None
 
-# NEW: Explicit get_item function returning a dictionary
+# NEW: Explicit get_item function returning an Item
+@timed
 def get_item(item_id):
     with get_db() as conn:
         c = conn.cursor()
-        c.execute("""
-            SELECT i.*, c.name as category_name 
+        c.row_factory = None
+        c.execute(f"""
+            SELECT {ITEM_COLUMNS}
             FROM items i 
             LEFT JOIN categories c ON i.category_id = c.id 
             WHERE i.id = ?
         """, (item_id,))
         item = c.fetchone()
-        return dict(item) if item else None
+        return Item(*item) if item else None
 
+@timed
 def search_items_by_name(name_query):
     with get_db() as conn:
         c = conn.cursor()
-        c.execute("""
-            SELECT i.*, c.name as category_name 
+        c.row_factory = None
+        c.execute(f"""
+            SELECT {ITEM_COLUMNS}
             FROM items i 
             LEFT JOIN categories c ON i.category_id = c.id 
             WHERE i.name LIKE ?
             ORDER BY i.name
         """, (f"%{name_query}%",))
-        return [dict(row) for row in c.fetchall()]
+        return Item.from_rows(c.fetchall())
 
+@timed
 def add_sale(total_price, total_purchase_price, sale_datetime=None):
     with get_db() as conn:
         c = conn.cursor()
@@ -218,118 +345,372 @@ def add_sale(total_price, total_purchase_price, sale_datetime=None):
         conn.commit()
         return c.lastrowid
 
-def add_sale_detail(sale_id, item_id, quantity, price_each, purchase_price_each):
+def _insert_sale_detail(c, sale_id, sale_day, item_id, quantity, price_each, purchase_price_each,
+                        item_name=None, item_barcode=None):
+    subtotal = line_total(price_each, quantity)
+    # Snapshot the item name/barcode so the line survives later catalog edits and deletes
+    c.execute(
+        """
+        INSERT INTO sale_details(sale_id, item_id, quantity, price_each, purchase_price_each, subtotal, item_name, item_barcode)
+        VALUES (?, ?, ?, ?, ?, ?,
+                COALESCE(?, (SELECT name FROM items WHERE id = ?), ?),
+                COALESCE(?, (SELECT barcode FROM items WHERE id = ?)))
+        """,
+        (sale_id, item_id, quantity, price_each, purchase_price_each, subtotal,
+         item_name, item_id, database.DELETED_ITEM_NAME, item_barcode, item_id)
+    )
+    detail_id = c.lastrowid
+    # Deduct from stock_count
+    inventory.record_movement(c, item_id, "sale", -quantity, "sale", sale_id)
+    # Keep the item's sales velocity current for the reorder list
+    reorder.record_sale(c, item_id, quantity, sale_day)
+    return detail_id
+
+@timed
+def add_sale_detail(sale_id, item_id, quantity, price_each, purchase_price_each, item_name=None, item_barcode=None):
     with get_db() as conn:
         c = conn.cursor()
-        subtotal = quantity * price_each
-        c.execute(
-            "INSERT INTO sale_details(sale_id, item_id, quantity, price_each, purchase_price_each, subtotal) VALUES (?, ?, ?, ?, ?, ?)",
-            (sale_id, item_id, quantity, price_each, purchase_price_each, subtotal)
-        )
-        
-        # Deduct from stock_count
-        c.execute("UPDATE items SET stock_count = stock_count - ? WHERE id = ?", (quantity, item_id))
+        c.execute("SELECT date(datetime) FROM sales WHERE id = ?", (sale_id,))
+        _insert_sale_detail(c, sale_id, c.fetchone()[0], item_id, quantity, price_each, purchase_price_each,
+                            item_name, item_barcode)
         conn.commit()
-
-def get_sales():
+    invalidate_sale_cache(sale_id)
+
+def write_bill(c, lines, sale_datetime=None):
+    """
+    Insert a sale and its lines with cursor c, in the caller's transaction. lines are
+    BillLine records (custom lines are skipped). Returns the new sale id.
+    """
+    lines = [line for line in lines if not line.is_custom]
+    sale_datetime = sale_datetime or datetime.now().isoformat()
+    c.execute(
+        "INSERT INTO sales(datetime, total_price, total_purchase_price) VALUES (?, ?, ?)",
+        (sale_datetime,
+         sum(line_total(line.price, line.qty) for line in lines),
+         sum(line_total(line.purchase_price, line.qty) for line in lines))
+    )
+    sale_id = c.lastrowid
+    for line in lines:
+        _insert_sale_detail(c, sale_id, sale_datetime[:10], line.id, line.qty, line.price, line.purchase_price,
+                            line.name, line.barcode or None)
+    return sale_id
+
+@timed
+def commit_bill(lines, sale_datetime=None):
+    """Save a whole bill (see write_bill) in one transaction; returns the sale id."""
     with get_db() as conn:
         c = conn.cursor()
-        c.execute("SELECT * FROM sales ORDER BY datetime DESC")
-        return [dict(row) for row in c.fetchall()]
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            sale_id = write_bill(c, lines, sale_datetime)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return sale_id
+
+def _date_range(date_from, date_to):
+    """WHERE clause (possibly empty) and params for date_from <= datetime < date_to"""
+    terms, params = [], []
+    if date_from is not None:
+        terms.append("datetime >= ?")
+        params.append(str(date_from))
+    if date_to is not None:
+        terms.append("datetime < ?")
+        params.append(str(date_to))
+    return (" WHERE " + " AND ".join(terms) if terms else ""), params
+
+@timed
+def get_sales(date_from=None, date_to=None, include_archive=False):
+    """
+    Sales newest first, optionally with date_from <= datetime < date_to (ISO text).
+    Archived years (see archive) are left out unless include_archive; then only the
+    partitions overlapping the range are read.
+    """
+    where, params = _date_range(date_from, date_to)
+    with get_db() as conn, archive.attached(conn, date_from, date_to, enabled=include_archive) as schemas:
+        sql, params = archive.union_all(f"SELECT {SALE_COLUMNS} FROM {{db}}.sales{where}", schemas, params)
+        c = conn.cursor()
+        c.row_factory = None
+        c.execute(sql + " ORDER BY datetime DESC", params)
+        return Sale.from_rows(c.fetchall())
 
+@timed
 def get_sale_details(sale_id):
     with get_db() as conn:
         c = conn.cursor()
-        c.execute("""
-            SELECT sd.*, i.name as item_name, i.barcode as item_barcode
-            FROM sale_details sd
-            JOIN items i ON sd.item_id = i.id
-            WHERE sd.sale_id = ?
-            ORDER BY i.name
+        c.row_factory = None
+        c.execute(f"""
+            SELECT {SALE_LINE_COLUMNS}
+            FROM sale_details
+            WHERE sale_id = ?
+            ORDER BY item_name
         """, (sale_id,))
-        return [dict(row) for row in c.fetchall()]
+        return SaleLine.from_rows(c.fetchall())
 
 # ADDED: Missing function for sale details dialog
+@timed
 def get_sale_by_id(sale_id):
     with get_db() as conn:
         c = conn.cursor()
-        c.execute("SELECT * FROM sales WHERE id = ?", (sale_id,))
+        c.row_factory = None
+        c.execute(f"SELECT {SALE_COLUMNS} FROM sales WHERE id = ?", (sale_id,))
         sale = c.fetchone()
-        return dict(sale) if sale else None
-
+        return Sale(*sale) if sale else None
+
+def invalidate_sale_cache(sale_id=None):
+    """Drop one sale from the sale cache, or the whole cache when sale_id is None."""
+    with _sale_cache_lock:
+        if sale_id is None:
+            _sale_cache.clear()
+        else:
+            _sale_cache.pop(sale_id, None)
+
+def _fetch_sales_with_details(conn, schema, ids, fetched):
+    """Add {sale_id: Sale with .details} for the ids found in schema to fetched"""
+    c = conn.cursor()
+    c.row_factory = None
+    # SQLite limits bound parameters per statement, so fetch in slices
+    for start in range(0, len(ids), 500):
+        chunk = ids[start:start + 500]
+        placeholders = ",".join("?" * len(chunk))
+        c.execute(f"""
+            SELECT s.id, s.datetime, s.total_price, s.total_purchase_price, s.created_at,
+                   sd.id, sd.sale_id, sd.item_id, sd.quantity, sd.price_each, sd.subtotal,
+                   sd.purchase_price_each, sd.item_name, sd.item_barcode
+            FROM {schema}.sales s
+            LEFT JOIN {schema}.sale_details sd ON sd.sale_id = s.id
+            WHERE s.id IN ({placeholders})
+            ORDER BY s.id, sd.item_name
+        """, chunk)
+        for row in c.fetchall():
+            sale = fetched.get(row[0])
+            if sale is None:
+                sale = fetched[row[0]] = Sale(*row[:5], details=[])
+            if row[5] is not None:
+                sale.details.append(SaleLine(*row[5:]))
+
+@timed
+def get_sale_with_details(ids):
+    """
+    Return {sale_id: Sale} for one sale id or an iterable of ids, where each Sale has
+    its SaleLines (as from get_sale_details) in .details. Missing sales are left out.
+    Uncached sales are fetched with a single joined query (and from the archive
+    partitions whose id range holds them when not in store.db); results are kept in a
+    small LRU cache and must be treated as read-only by callers.
+    """
+    if isinstance(ids, int):
+        ids = [ids]
+    ids = list(dict.fromkeys(ids))
+
+    result = {}
+    missing = []
+    with _sale_cache_lock:
+        for sale_id in ids:
+            sale = _sale_cache.get(sale_id)
+            if sale is None:
+                missing.append(sale_id)
+            else:
+                _sale_cache.move_to_end(sale_id)
+                result[sale_id] = sale
+
+    if missing:
+        fetched = {}
+        with get_db() as conn:
+            _fetch_sales_with_details(conn, "main", missing, fetched)
+            archived = [sale_id for sale_id in missing if sale_id not in fetched]
+            if archived:
+                with archive.attached(conn, sale_ids=archived) as schemas:
+                    for schema in schemas[1:]:
+                        _fetch_sales_with_details(conn, schema, archived, fetched)
+
+        with _sale_cache_lock:
+            for sale_id, sale in fetched.items():
+                _sale_cache[sale_id] = sale
+                _sale_cache.move_to_end(sale_id)
+            while len(_sale_cache) > SALE_CACHE_SIZE:
+                _sale_cache.popitem(last=False)
+        result.update(fetched)
+
+    return {sale_id: result[sale_id] for sale_id in ids if sale_id in result}
+
+@timed
 def delete_sale(sale_id):
     with get_db() as conn:
         c = conn.cursor()
-        # First, get details to return items to stock
+        c.execute("SELECT date(datetime) FROM sales WHERE id = ?", (sale_id,))
+        row = c.fetchone()
+        sale_day = row[0] if row else None
+        # First, get details to return items to stock and take them out of the sales velocity
         c.execute("SELECT item_id, quantity FROM sale_details WHERE sale_id = ?", (sale_id,))
         details = c.fetchall()
         for detail in details:
-            c.execute("UPDATE items SET stock_count = stock_count + ? WHERE id = ?", (detail["quantity"], detail["item_id"]))
+            inventory.record_movement(c, detail["item_id"], "void", detail["quantity"], "sale", sale_id)
+            reorder.record_sale(c, detail["item_id"], -detail["quantity"], sale_day)
         
         # Then delete the sale and its details (ON DELETE CASCADE handles sale_details)
         c.execute("DELETE FROM sales WHERE id = ?", (sale_id,))
         conn.commit()
+    invalidate_sale_cache(sale_id)
+
+def _amend(c, sale_id, edits, removals, additions, note):
+    """
+    Apply an amendment (see amend_sale) with cursor c, in the caller's transaction. Only the
+    touched lines are read; totals and stock move by their deltas. Returns the amendment id,
+    or None when nothing changed.
+    """
+    c.execute("SELECT date(datetime) FROM sales WHERE id = ?", (sale_id,))
+    row = c.fetchone()
+    if row is None:
+        raise ValueError(f"الفاتورة رقم {sale_id} غير موجودة أو مؤرشفة.")
+    sale_day = row[0]
+    edits = dict(edits or {})
+    removals = set(removals)
+    if edits.keys() & removals:
+        raise ValueError("لا يمكن تعديل سطر وحذفه في نفس الوقت.")
+
+    touched = list(edits.keys() | removals)
+    lines = {}
+    if touched:
+        c.execute(f"""
+            SELECT {SALE_LINE_COLUMNS} FROM sale_details
+            WHERE sale_id = ? AND id IN ({", ".join("?" for _ in touched)})
+        """, (sale_id, *touched))
+        lines = {line.id: line for line in SaleLine.from_rows(c.fetchall())}
+        missing = [detail_id for detail_id in touched if detail_id not in lines]
+        if missing:
+            raise ValueError(f"أسطر غير موجودة في الفاتورة رقم {sale_id}: {missing}")
+
+    # Work out the trail first so an amendment that changes nothing writes nothing
+    trail = []
+    for detail_id, (quantity, price_each) in edits.items():
+        line = lines[detail_id]
+        if quantity <= 0:
+            raise ValueError("يرجى إدخال كمية صحيحة")
+        if quantity == line.quantity and price_each == line.price_each:
+            continue
+        trail.append({
+            "action": "edit", "detail_id": detail_id, "item_id": line.item_id, "item_name": line.item_name,
+            "old_quantity": line.quantity, "new_quantity": quantity,
+            "old_price_each": line.price_each, "new_price_each": price_each,
+            "subtotal_delta": line_total(price_each, quantity) - line.subtotal,
+            "cost_delta": (line_total(line.purchase_price_each, quantity)
+                           - line_total(line.purchase_price_each, line.quantity)),
+        })
+    for detail_id in removals:
+        line = lines[detail_id]
+        trail.append({
+            "action": "remove", "detail_id": detail_id, "item_id": line.item_id, "item_name": line.item_name,
+            "old_quantity": line.quantity, "new_quantity": None,
+            "old_price_each": line.price_each, "new_price_each": None,
+            "subtotal_delta": -line.subtotal,
+            "cost_delta": -line_total(line.purchase_price_each, line.quantity),
+        })
+    additions = [line for line in additions if not line.is_custom]
+    for line in additions:
+        if line.qty <= 0:
+            raise ValueError("يرجى إدخال كمية صحيحة")
+    if not trail and not additions:
+        return None
 
-def delete_sale_detail(detail_id):
+    amendment_id = amendments.open_amendment(c, sale_id, note)
+    movement_note = f"amendment {amendment_id}"
+    for entry in trail:
+        detail_id = entry["detail_id"]
+        if entry["action"] == "edit":
+            quantity, price_each = entry["new_quantity"], entry["new_price_each"]
+            c.execute("UPDATE sale_details SET quantity = ?, price_each = ?, subtotal = ? WHERE id = ?",
+                      (quantity, price_each, line_total(price_each, quantity), detail_id))
+            returned = entry["old_quantity"] - quantity  # Positive: units back on the shelf
+            inventory.record_movement(c, entry["item_id"], "return" if returned > 0 else "sale", returned,
+                                      "sale", sale_id, movement_note)
+            reorder.record_sale(c, entry["item_id"], -returned, sale_day)
+        else:
+            c.execute("DELETE FROM sale_details WHERE id = ?", (detail_id,))
+            inventory.record_movement(c, entry["item_id"], "void", entry["old_quantity"], "sale", sale_id,
+                                      movement_note)
+            reorder.record_sale(c, entry["item_id"], -entry["old_quantity"], sale_day)
+    for line in additions:
+        detail_id = _insert_sale_detail(c, sale_id, sale_day, line.id, line.qty, line.price, line.purchase_price,
+                                        line.name, line.barcode or None)
+        trail.append({
+            "action": "add", "detail_id": detail_id, "item_id": line.id, "item_name": line.name,
+            "old_quantity": None, "new_quantity": line.qty,
+            "old_price_each": None, "new_price_each": line.price,
+            "subtotal_delta": line_total(line.price, line.qty),
+            "cost_delta": line_total(line.purchase_price, line.qty),
+        })
+
+    c.execute("""
+        UPDATE sales SET total_price = total_price + ?, total_purchase_price = total_purchase_price + ?
+        WHERE id = ?
+    """, (sum(e["subtotal_delta"] for e in trail), sum(e["cost_delta"] for e in trail), sale_id))
+    amendments.close_amendment(c, amendment_id, trail)
+    return amendment_id
+
+@timed
+def amend_sale(sale_id, edits=None, removals=(), additions=(), note=None):
+    """
+    Correct a committed sale in one transaction. edits maps detail ids to new
+    (quantity, price_each), removals are detail ids and additions BillLine records.
+    The sale's totals and stock move by the deltas of the touched lines only, and the
+    change is logged in the amendment trail (see amendments). Archived sales cannot be
+    amended. Returns the amendment id, or None when nothing changed.
+    """
     with get_db() as conn:
         c = conn.cursor()
-        # Get detail to return item to stock
-        c.execute("SELECT item_id, quantity FROM sale_details WHERE id=?", (detail_id,))
-        detail = c.fetchone()
-        
-        if detail:
-            # Return quantity to stock
-            c.execute("UPDATE items SET stock_count = stock_count + ? WHERE id = ?", (detail["quantity"], detail["item_id"]))
-            # Delete the detail
-            c.execute("DELETE FROM sale_details WHERE id=?", (detail_id,))
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            amendment_id = _amend(c, sale_id, edits, removals, additions, note)
             conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    invalidate_sale_cache(sale_id)
+    return amendment_id
 
-def update_sale_detail(detail_id, quantity, price_each):
+def _amend_detail(detail_id, edits=None, removals=()):
     with get_db() as conn:
         c = conn.cursor()
-        
-        # Get current detail to calculate stock difference
-        c.execute("SELECT item_id, quantity FROM sale_details WHERE id=? ", (detail_id,))
-        old_detail = c.fetchone()
-        
-        if old_detail:
-            # Calculate quantity difference
-            quantity_diff = old_detail["quantity"] - quantity # If new qty is less, diff is positive (stock increases)
-            
-            # Update stock
-            c.execute("UPDATE items SET stock_count = stock_count + ? WHERE id = ?", 
-                     (quantity_diff, old_detail["item_id"]))
-        
-        # Update sale detail
-        subtotal = quantity * price_each
-        c.execute(
-            "UPDATE sale_details SET quantity=?, price_each=?, subtotal=? WHERE id=?",
-            (quantity, price_each, subtotal, detail_id)
-        )
-        
-        # Update parent sale's total_price and total_purchase_price
-        c.execute("SELECT sale_id FROM sale_details WHERE id=?", (detail_id,))
-        sale_id = c.fetchone()["sale_id"]
-        
-        c.execute("SELECT SUM(subtotal) FROM sale_details WHERE sale_id=?", (sale_id,))
-        new_total_price = c.fetchone()[0] or 0.0
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            c.execute("SELECT sale_id FROM sale_details WHERE id = ?", (detail_id,))
+            row = c.fetchone()
+            sale_id = row[0] if row else None
+            if sale_id is not None:
+                _amend(c, sale_id, edits, removals, (), None)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    if sale_id is not None:
+        invalidate_sale_cache(sale_id)
 
-        c.execute("SELECT SUM(quantity * purchase_price_each) FROM sale_details WHERE sale_id=?", (sale_id,))
-        new_total_purchase_price = c.fetchone()[0] or 0.0
+@timed
+def delete_sale_detail(detail_id):
+    """Remove one line from its sale (see amend_sale)"""
+    _amend_detail(detail_id, removals=(detail_id,))
 
-        c.execute("UPDATE sales SET total_price=?, total_purchase_price=? WHERE id=?", 
-                  (new_total_price, new_total_purchase_price, sale_id))
-        
-        conn.commit()
+@timed
+def update_sale_detail(detail_id, quantity, price_each):
+    """Change one line's quantity and price (see amend_sale)"""
+    _amend_detail(detail_id, edits={detail_id: (quantity, price_each)})
+
+@timed
+def get_sale_amendments(sale_id):
+    with get_db() as conn:
+        return amendments.get_amendments(conn, sale_id)
 
 
+@timed
 def get_sales_total():
     with get_db() as conn:
         c = conn.cursor()
         c.execute("SELECT COALESCE(SUM(total_price), 0) as total FROM sales")
         result = c.fetchone()
-        return result["total"] if result else 0
+        return (result["total"] if result else 0) + archive.archived_totals(conn)[0]
 
+@timed
 def get_sales_summary_today():
     with get_db() as conn:
         c = conn.cursor()
@@ -338,20 +719,43 @@ def get_sales_summary_today():
         result = c.fetchone()
         return result["total"] if result else 0
 
+@timed
 def get_latest_sale():
     with get_db() as conn:
         c = conn.cursor()
-        c.execute("SELECT * FROM sales ORDER BY datetime DESC LIMIT 1")
+        c.row_factory = None
+        c.execute(f"SELECT {SALE_COLUMNS} FROM sales ORDER BY datetime DESC LIMIT 1")
         sale = c.fetchone()
-        return dict(sale) if sale else None
+        return Sale(*sale) if sale else None
 
+@timed
 def get_revenue_and_profit_all_time():
     with get_db() as conn:
         c = conn.cursor()
         c.execute("SELECT COALESCE(SUM(total_price), 0) as total_revenue, COALESCE(SUM(total_price - total_purchase_price), 0) as total_profit FROM sales")
-        result = c.fetchone()
-        return dict(result) if result else {"total_revenue": 0, "total_profit": 0}
-
+        result = dict(c.fetchone())
+        # Archived years from their registry totals, without attaching the partitions
+        revenue, cost = archive.archived_totals(conn)
+        result["total_revenue"] += revenue
+        result["total_profit"] += revenue - cost
+        return result
+
+@timed
+def get_revenue_and_profit(date_from=None, date_to=None):
+    """Revenue and profit of the sales with date_from <= datetime < date_to, archived years included"""
+    where, params = _date_range(date_from, date_to)
+    with get_db() as conn, archive.attached(conn, date_from, date_to) as schemas:
+        sql, params = archive.union_all(
+            f"SELECT total_price, total_purchase_price FROM {{db}}.sales{where}", schemas, params)
+        c = conn.cursor()
+        c.execute(f"""
+            SELECT COALESCE(SUM(total_price), 0) as total_revenue,
+                   COALESCE(SUM(total_price - total_purchase_price), 0) as total_profit
+            FROM ({sql})
+        """, params)
+        return dict(c.fetchone())
+
+@timed
 def get_revenue_and_profit_today():
     with get_db() as conn:
         c = conn.cursor()
@@ -360,5 +764,87 @@ def get_revenue_and_profit_today():
         result = c.fetchone()
         return dict(result) if result else {"total_revenue": 0, "total_profit": 0}
 
+# Reports: served from the trigger-maintained tables in aggregates.py, never from sale_details
+REPORT_METRICS = {"revenue": "a.revenue", "profit": "a.revenue - a.cost", "units": "a.units"}
+
+def _item_totals(days):
+    """FROM-clause source of per item totals (item_id, units, revenue, cost) and its params"""
+    if not days:
+        return "item_sales_agg", ()
+    since = (datetime.now() - timedelta(days=days - 1)).strftime("%Y-%m-%d")
+    return """(
+        SELECT item_id, SUM(units) AS units, SUM(revenue) AS revenue, SUM(cost) AS cost
+        FROM daily_item_sales WHERE day >= ? GROUP BY item_id
+    )""", (since,)
+
+@timed
+def get_top_items(metric="revenue", limit=20, days=None):
+    """Best items by revenue, profit or units, over all history or the last `days` days"""
+    source, params = _item_totals(days)
+    with get_db() as conn:
+        c = conn.cursor()
+        c.execute(f"""
+            SELECT a.item_id, i.name, i.barcode, a.units, a.revenue, a.revenue - a.cost AS profit
+            FROM {source} a
+            JOIN items i ON i.id = a.item_id
+            ORDER BY {REPORT_METRICS[metric]} DESC
+            LIMIT ?
+        """, params + (limit,))
+        return [dict(row) for row in c.fetchall()]
+
+@timed
+def get_dead_stock(days=30, limit=500):
+    """In-stock items not sold for `days` days (or never), largest stock value first"""
+    cutoff = (datetime.now() - timedelta(days=days)).isoformat()
+    with get_db() as conn:
+        c = conn.cursor()
+        c.execute("""
+            SELECT i.id, i.name, i.barcode, i.stock_count, a.last_sold,
+                   CAST(ROUND(i.stock_count * i.purchase_price) AS INTEGER) AS stock_value
+            FROM items i
+            LEFT JOIN item_sales_agg a ON a.item_id = i.id
+            WHERE i.stock_count > 0 AND (a.last_sold IS NULL OR a.last_sold < ?)
+            ORDER BY stock_value DESC
+            LIMIT ?
+        """, (cutoff, limit))
+        return [dict(row) for row in c.fetchall()]
+
+@timed
+def get_margin_by_category(days=None):
+    """Revenue, cost, profit and margin percent per category, highest revenue first"""
+    source, params = _item_totals(days)
+    with get_db() as conn:
+        c = conn.cursor()
+        c.execute(f"""
+            SELECT COALESCE(cat.name, 'غير مصنّف') AS category, SUM(a.units) AS units,
+                   SUM(a.revenue) AS revenue, SUM(a.cost) AS cost, SUM(a.revenue - a.cost) AS profit
+            FROM {source} a
+            JOIN items i ON i.id = a.item_id
+            LEFT JOIN categories cat ON cat.id = i.category_id
+            GROUP BY cat.id
+            ORDER BY revenue DESC
+        """, params)
+        rows = [dict(row) for row in c.fetchall()]
+    for row in rows:
+        row["margin"] = row["profit"] * 100.0 / row["revenue"] if row["revenue"] else 0.0
+    return rows
+
+@timed
+def get_hourly_heatmap():
+    """7 x 24 grid (weekday 0 = Sunday, hour) of {"sales": n, "revenue": minor units}"""
+    grid = [[{"sales": 0, "revenue": 0} for _ in range(24)] for _ in range(7)]
+    with get_db() as conn:
+        c = conn.cursor()
+        c.execute("SELECT weekday, hour, sales, revenue FROM hourly_sales")
+        for weekday, hour, sales, revenue in c.fetchall():
+            grid[weekday][hour] = {"sales": sales, "revenue": revenue}
+    return grid
+
+@timed
+def get_reorder_list():
+    """Items running out within the supplier lead time, with suggested order quantities (see reorder)"""
+    with get_db() as conn:
+        return reorder.build_reorder_list(conn)
+
 # Initialize database when module is imported
 init_db()
\ No newline at end of file
@@ -0,0 +1,25 @@
+# money.py (money is stored and computed as integer minor units, e.g. centimes)
+from decimal import Decimal, ROUND_HALF_UP
+
+MINOR_UNITS = 100  # Minor units per major unit
+
+_ONE = Decimal(1)
+
+def to_minor(major) -> int:
+    """Convert a major-unit amount (spinbox float, CSV text) to integer minor units, rounding half up."""
+    return int((Decimal(str(major)) * MINOR_UNITS).quantize(_ONE, rounding=ROUND_HALF_UP))
+
+def to_major(minor) -> float:
+    """Convert minor units to a float for display widgets such as QDoubleSpinBox."""
+    return (minor or 0) / MINOR_UNITS
+
+def line_total(price_minor, qty) -> int:
+    """Exact price * quantity in minor units; quantities may be fractional (e.g. weighed goods)."""
+    return int((Decimal(str(qty)) * int(price_minor or 0)).quantize(_ONE, rounding=ROUND_HALF_UP))
+
+def fmt_money(minor):
+    """Format minor units; whole amounts are shown without decimals."""
+    minor = int(minor or 0)
+    sign = "-" if minor < 0 else ""
+    major, cents = divmod(abs(minor), MINOR_UNITS)
+    return f"{sign}{major}" if cents == 0 else f"{sign}{major}.{cents:02d}"
@@ -1,5 +1,6 @@
 import models
 import database
+from money import to_minor, line_total
 from datetime import datetime, timedelta
 import random
 from faker import Faker
@@ -42,6 +43,7 @@ def generate_items_data(num_items=100):
 
         price = round(random.uniform(10.0, 1000.0), 2)
         purchase_price = round(price * random.uniform(0.6, 0.9), 2) # 60-90% of selling price
+        price, purchase_price = to_minor(price), to_minor(purchase_price) # Stored in minor units
         stock_count = random.randint(0, 200) # Varied stock levels
         category_id = random.choice(category_ids)
         
@@ -114,8 +116,8 @@ def generate_sales_data(num_sales=100):
         selected_item_ids = random.sample(item_ids, min(num_details, len(item_ids)))
         
         current_sale_details = []
-        total_price = 0.0
-        total_purchase_price = 0.0
+        total_price = 0
+        total_purchase_price = 0
 
         for item_id in selected_item_ids:
             item_info = items_with_stock.get(item_id) # Get item info from our pre-filtered dict
@@ -127,7 +129,7 @@ def generate_sales_data(num_sales=100):
                 if quantity > 0:
                     price_each = item_info['price']
                     purchase_price_each = item_info['purchase_price']
-                    subtotal = price_each * quantity
+                    subtotal = line_total(price_each, quantity)
                     
                     current_sale_details.append({
                         'item_id': item_id,
@@ -137,7 +139,7 @@ def generate_sales_data(num_sales=100):
                         'subtotal': subtotal
                     })
                     total_price += subtotal
-                    total_purchase_price += purchase_price_each * quantity
+                    total_purchase_price += line_total(purchase_price_each, quantity)
             
         if current_sale_details: # Only add sale if it has details
             sales_to_add.append({
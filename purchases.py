@@ -0,0 +1,119 @@
+# purchases.py (suppliers and goods receipts: delta stock increments with weighted-average cost)
+from datetime import datetime
+
+import database
+import inventory
+import models
+from instrumentation import timed
+from money import line_total
+
+@timed
+def get_suppliers():
+    with models.get_db() as conn:
+        c = conn.cursor()
+        c.execute("SELECT id, name, contact FROM suppliers ORDER BY name")
+        return [dict(row) for row in c.fetchall()]
+
+@timed
+def get_or_create_supplier(name, contact=None):
+    """Return the id of the supplier with this name, adding it if needed"""
+    with models.get_db() as conn:
+        c = conn.cursor()
+        c.execute(
+            "INSERT OR IGNORE INTO suppliers(name, contact, created_at) VALUES (?, ?, ?)",
+            (name, contact, datetime.now().isoformat())
+        )
+        c.execute("SELECT id FROM suppliers WHERE name = ?", (name,))
+        supplier_id = c.fetchone()[0]
+        conn.commit()
+        return supplier_id
+
+def merge_lines(lines):
+    """Collapse repeated scans of the same item into one line; the last cost scanned wins"""
+    merged = {}
+    for line in lines:
+        current = merged.get(line.item_id)
+        if current is None:
+            merged[line.item_id] = [line.quantity, line.cost_each]
+        else:
+            current[0] += line.quantity
+            current[1] = line.cost_each
+    return [(item_id, qty, cost) for item_id, (qty, cost) in merged.items()]
+
+# Runs before the receipt movement is written, so the average uses the stock on hand.
+# Negative stock (sold before it was received) does not weigh on the new cost.
+_COST_SQL = """
+    UPDATE items SET
+        purchase_price = CASE
+            WHEN MAX(stock_count, 0) + :qty > 0 THEN CAST(ROUND(
+                (MAX(stock_count, 0) * purchase_price + :qty * :cost) / (MAX(stock_count, 0) + :qty)
+            ) AS INTEGER)
+            ELSE :cost
+        END,
+        updated_at = :now
+    WHERE id = :item_id
+"""
+
+@timed
+def commit_receipt(lines, supplier_id=None, reference=None, received_at=None):
+    """
+    Record a goods receipt in one transaction: the header, one line per item, and for each
+    item a receipt movement of +quantity (see inventory) with purchase_price moved to the weighted average of the
+    stock on hand and the delivery. lines are ReceiptLine records (repeated scans allowed).
+    Returns the receipt id.
+    """
+    rows = merge_lines(lines)
+    if not rows:
+        raise ValueError("لا توجد أصناف في الاستلام.")
+    now = datetime.now().isoformat()
+    with models.get_db() as conn:
+        c = conn.cursor()
+        # Take the write lock up front so concurrent sales wait instead of failing mid-receipt
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            c.execute(
+                "INSERT INTO purchase_receipts(supplier_id, datetime, reference, total_cost) VALUES (?, ?, ?, ?)",
+                (supplier_id, received_at or now, reference,
+                 sum(line_total(cost, qty) for _, qty, cost in rows))
+            )
+            receipt_id = c.lastrowid
+            c.executemany(
+                "INSERT INTO purchase_receipt_lines(receipt_id, item_id, quantity, cost_each, subtotal) VALUES (?, ?, ?, ?, ?)",
+                [(receipt_id, item_id, qty, cost, line_total(cost, qty)) for item_id, qty, cost in rows]
+            )
+            c.executemany(_COST_SQL, [
+                {"item_id": item_id, "qty": qty, "cost": cost, "now": now} for item_id, qty, cost in rows
+            ])
+            for item_id, qty, _ in rows:
+                inventory.record_movement(c, item_id, "receipt", qty, "receipt", receipt_id)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return receipt_id
+
+@timed
+def get_receipts(limit=200):
+    with models.get_db() as conn:
+        c = conn.cursor()
+        c.execute("""
+            SELECT r.id, r.datetime, r.reference, r.total_cost, s.name AS supplier_name,
+                   (SELECT COUNT(*) FROM purchase_receipt_lines l WHERE l.receipt_id = r.id) AS lines
+            FROM purchase_receipts r
+            LEFT JOIN suppliers s ON s.id = r.supplier_id
+            ORDER BY r.datetime DESC
+            LIMIT ?
+        """, (limit,))
+        return [dict(row) for row in c.fetchall()]
+
+@timed
+def get_receipt_lines(receipt_id):
+    with models.get_db() as conn:
+        c = conn.cursor()
+        c.execute("""
+            SELECT l.id, l.item_id, COALESCE(i.name, ?) AS item_name, i.barcode, l.quantity, l.cost_each, l.subtotal
+            FROM purchase_receipt_lines l
+            LEFT JOIN items i ON i.id = l.item_id
+            WHERE l.receipt_id = ?
+        """, (database.DELETED_ITEM_NAME, receipt_id))
+        return [dict(row) for row in c.fetchall()]
@@ -1,4 +1,252 @@
-# qss.py - Modern Dark Theme with Vibrant Colors
+# qss.py (application stylesheets, one per theme, compiled once and set on the QApplication)
+import logging
+import re
+
+from PyQt5.QtCore import Qt
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_THEME = "light"
+
+# Widgets carry no stylesheet of their own: everything is styled from here, by type,
+# object name (setObjectName) or the "role" dynamic property (see set_role)
+LIGHT_QSS = """
+QMainWindow {
+    background-color: #f8f9fa;
+}
+
+QWidget {
+    font-family: 'Segoe UI', Arial, sans-serif;
+    font-size: 12px;
+}
+
+QLabel {
+    color: #212529;
+    font-weight: bold;
+}
+
+QLabel#title {
+    font-size: 24px;
+    font-weight: bold;
+    color: #007bff;
+    padding: 10px;
+    background-color: white;
+    border-radius: 4px;
+    border: 1px solid #dee2e6;
+}
+
+QLabel[role="total"] {
+    font-size: 16px;
+    font-weight: bold;
+    color: #007bff;
+}
+
+QLabel#preview {
+    border: 1px solid #ced4da;
+    background-color: white;
+}
+
+/* Tabs */
+QTabWidget::pane {
+    border: 1px solid #cccccc;
+    background: #f8f9fa;
+    border-radius: 4px;
+}
+
+QTabWidget::tab-bar {
+    alignment: center;
+}
+
+QTabBar::tab {
+    background: #e9ecef;
+    border: 1px solid #cccccc;
+    padding: 8px 16px;
+    margin-right: 2px;
+    border-top-left-radius: 4px;
+    border-top-right-radius: 4px;
+    color: #495057;
+    font-weight: bold;
+}
+
+QTabBar::tab:selected {
+    background: #007bff;
+    color: white;
+    border-color: #0056b3;
+}
+
+QTabBar::tab:hover:!selected {
+    background: #dee2e6;
+}
+
+/* Buttons */
+QPushButton {
+    background-color: #007bff;
+    color: white;
+    border: none;
+    padding: 8px 16px;
+    border-radius: 4px;
+    font-weight: bold;
+}
+
+QPushButton:hover {
+    background-color: #0056b3;
+}
+
+QPushButton:pressed {
+    background-color: #004085;
+}
+
+QPushButton:disabled {
+    background-color: #6c757d;
+    color: #ced4da;
+}
+
+QPushButton#danger {
+    background-color: #dc3545;
+}
+
+QPushButton#danger:hover {
+    background-color: #c82333;
+}
+
+QPushButton#danger:pressed {
+    background-color: #bd2130;
+}
+
+/* Tables */
+QTableWidget {
+    background-color: white;
+    alternate-background-color: #f8f9fa;
+    selection-background-color: #cce5ff;
+    selection-color: black;
+    gridline-color: #dee2e6;
+    border: 1px solid #dee2e6;
+    border-radius: 4px;
+}
+
+QTableWidget::item {
+    padding: 4px;
+    border-right: 1px solid #dee2e6;
+    border-bottom: 1px solid #dee2e6;
+}
+
+QTableWidget::item:selected {
+    background-color: #cce5ff;
+    color: black;
+}
+
+QHeaderView::section {
+    background-color: #007bff;
+    color: white;
+    padding: 6px;
+    border: none;
+    font-weight: bold;
+}
+
+QTableCornerButton::section {
+    background-color: #007bff;
+    border: none;
+}
+
+/* Input fields */
+QLineEdit, QComboBox, QDoubleSpinBox, QSpinBox {
+    border: 1px solid #ced4da;
+    border-radius: 4px;
+    padding: 6px 12px;
+    background-color: white;
+    selection-background-color: #cce5ff;
+}
+
+QLineEdit:focus, QComboBox:focus, QDoubleSpinBox:focus, QSpinBox:focus {
+    border: 2px solid #007bff;
+}
+
+QLineEdit:disabled, QComboBox:disabled, QDoubleSpinBox:disabled, QSpinBox:disabled {
+    background-color: #e9ecef;
+    color: #6c757d;
+}
+
+QComboBox {
+    min-width: 6em;
+}
+
+QComboBox::drop-down {
+    subcontrol-origin: padding;
+    subcontrol-position: top right;
+    width: 20px;
+    border-left-width: 1px;
+    border-left-color: #ced4da;
+    border-left-style: solid;
+    border-top-right-radius: 4px;
+    border-bottom-right-radius: 4px;
+}
+
+QComboBox::down-arrow {
+    image: none;
+    border-left: 4px solid transparent;
+    border-right: 4px solid transparent;
+    border-top: 6px solid #495057;
+    width: 0;
+    height: 0;
+}
+
+QComboBox QAbstractItemView {
+    border: 1px solid #ced4da;
+    selection-background-color: #cce5ff;
+    selection-color: black;
+    background-color: white;
+}
+
+QDoubleSpinBox::up-button, QDoubleSpinBox::down-button, QSpinBox::up-button, QSpinBox::down-button {
+    subcontrol-origin: border;
+    width: 20px;
+    border-left: 1px solid #ced4da;
+}
+
+QDoubleSpinBox::up-button, QSpinBox::up-button {
+    subcontrol-position: top right;
+    border-bottom: 1px solid #ced4da;
+    border-top-right-radius: 3px;
+}
+
+QDoubleSpinBox::down-button, QSpinBox::down-button {
+    subcontrol-position: bottom right;
+    border-bottom-right-radius: 3px;
+}
+
+QDoubleSpinBox::up-arrow, QDoubleSpinBox::down-arrow, QSpinBox::up-arrow, QSpinBox::down-arrow {
+    width: 0;
+    height: 0;
+    border-left: 4px solid transparent;
+    border-right: 4px solid transparent;
+}
+
+QDoubleSpinBox::up-arrow, QSpinBox::up-arrow {
+    border-bottom: 6px solid #495057;
+}
+
+QDoubleSpinBox::down-arrow, QSpinBox::down-arrow {
+    border-top: 6px solid #495057;
+}
+
+/* Group boxes */
+QGroupBox {
+    font-weight: bold;
+    border: 1px solid #ced4da;
+    border-radius: 4px;
+    margin-top: 10px;
+    padding-top: 10px;
+    background-color: #f8f9fa;
+}
+
+QGroupBox::title {
+    subcontrol-origin: margin;
+    subcontrol-position: top center;
+    padding: 0 5px;
+}
+"""
+
+# Modern dark theme with vibrant colors
 APP_QSS = """
 /* Global Styles */
 * { 
@@ -512,4 +760,84 @@ QMenu::item:selected {
     background-color: #3b82f6;
     color: white;
 }
-"""
\ No newline at end of file
+
+/* Named widgets (object names and the "role" property set in ui_main) */
+QLabel#title {
+    font-size: 22pt;
+    font-weight: 800;
+    color: #60a5fa;
+    background: transparent;
+    padding: 10px;
+}
+
+QLabel[role="total"] {
+    font-size: 13pt;
+    font-weight: 700;
+    color: #22c55e;
+    padding: 10px 12px;
+    border-radius: 8px;
+    background-color: rgba(34, 197, 94, 0.1);
+    border: 1px solid rgba(34, 197, 94, 0.2);
+}
+
+QLabel#preview {
+    border: 2px solid #475569;
+    border-radius: 8px;
+    background-color: #1e293b;
+}
+"""
+
+
+THEMES = {"light": LIGHT_QSS, "dark": APP_QSS}
+THEME_NAMES = {"light": "فاتح", "dark": "داكن"}
+
+# CSS properties Qt's stylesheet parser does not know; dropped at compile time instead of
+# being warned about on every parse
+UNSUPPORTED_PROPERTIES = ("box-shadow", "text-shadow", "transform", "transition")
+
+_COMMENT = re.compile(r"/\*.*?\*/", re.S)
+_UNSUPPORTED = re.compile(r"(?:%s)\s*:[^;{}]*;" % "|".join(UNSUPPORTED_PROPERTIES))
+
+_compiled = {}
+_current = None
+
+def compile_qss(source):
+    """Strip comments, unsupported declarations and redundant whitespace from a stylesheet"""
+    source = _UNSUPPORTED.sub("", _COMMENT.sub("", source))
+    return re.sub(r"\s*([{};:,])\s*", r"\1", re.sub(r"\s+", " ", source)).strip()
+
+def stylesheet(theme):
+    """Compiled stylesheet of theme (cached)"""
+    if theme not in THEMES:
+        theme = DEFAULT_THEME
+    if theme not in _compiled:
+        _compiled[theme] = compile_qss(THEMES[theme])
+    return _compiled[theme]
+
+def current_theme():
+    return _current
+
+def apply_theme(app, theme):
+    """
+    Set theme's stylesheet on the whole application. Call before the main window is
+    built so each widget is polished once; switching later re-polishes every widget
+    once, so it does nothing when theme is already applied.
+    """
+    global _current
+    if theme not in THEMES:
+        logger.warning("Unknown theme %r, using %s", theme, DEFAULT_THEME)
+        theme = DEFAULT_THEME
+    if theme == _current:
+        return
+    app.setStyleSheet(stylesheet(theme))
+    _current = theme
+
+def set_role(widget, role):
+    """Set the "role" property styled by [role="..."] selectors, re-polishing only this widget"""
+    if widget.property("role") == role:
+        return
+    widget.setProperty("role", role)
+    if widget.testAttribute(Qt.WA_WState_Polished):
+        style = widget.style()
+        style.unpolish(widget)
+        style.polish(widget)
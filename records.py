@@ -0,0 +1,121 @@
+# records.py (compact __slots__ record types shared by models, the sale cache, the UI and receipts)
+
+class Record:
+    """
+    Base for the record types below. Fields are plain attributes (item.price); item["price"],
+    item.get("price") and dict(item) keep working for code written against dict rows.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Build records from plain cursor tuples whose columns follow the class's field order"""
+        return [cls(*row) for row in rows]
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def keys(self):
+        return self.__slots__
+
+    def _asdict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    __hash__ = None
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+class Item(Record):
+    """A catalog item with its category name; money in minor units"""
+    __slots__ = ("id", "name", "category_id", "barcode", "price", "stock_count", "photo_path",
+                 "add_date", "updated_at", "purchase_price", "category_name")
+
+    def __init__(self, id, name, category_id=None, barcode=None, price=0, stock_count=0,
+                 photo_path=None, add_date=None, updated_at=None, purchase_price=0, category_name=None):
+        self.id = id
+        self.name = name
+        self.category_id = category_id
+        self.barcode = barcode
+        self.price = price
+        self.stock_count = stock_count
+        self.photo_path = photo_path
+        self.add_date = add_date
+        self.updated_at = updated_at
+        self.purchase_price = purchase_price
+        self.category_name = category_name
+
+# Column list matching Item's field order, for "SELECT {ITEM_COLUMNS} FROM items i LEFT JOIN categories c ..."
+ITEM_COLUMNS = ("i.id, i.name, i.category_id, i.barcode, i.price, i.stock_count, i.photo_path, "
+                "i.add_date, i.updated_at, i.purchase_price, c.name")
+
+class SaleLine(Record):
+    """A committed sale line with the item name/barcode snapshot taken at sale time"""
+    __slots__ = ("id", "sale_id", "item_id", "quantity", "price_each", "subtotal",
+                 "purchase_price_each", "item_name", "item_barcode")
+
+    def __init__(self, id, sale_id, item_id, quantity, price_each, subtotal,
+                 purchase_price_each=0, item_name="", item_barcode=None):
+        self.id = id
+        self.sale_id = sale_id
+        self.item_id = item_id
+        self.quantity = quantity
+        self.price_each = price_each
+        self.subtotal = subtotal
+        self.purchase_price_each = purchase_price_each
+        self.item_name = item_name
+        self.item_barcode = item_barcode
+
+SALE_LINE_COLUMNS = ("id, sale_id, item_id, quantity, price_each, subtotal, purchase_price_each, "
+                     "item_name, item_barcode")
+
+class Sale(Record):
+    """A sale header; details holds its SaleLines when loaded through get_sale_with_details"""
+    __slots__ = ("id", "datetime", "total_price", "total_purchase_price", "created_at", "details")
+
+    def __init__(self, id, datetime, total_price=0, total_purchase_price=0, created_at=None, details=None):
+        self.id = id
+        self.datetime = datetime
+        self.total_price = total_price
+        self.total_purchase_price = total_purchase_price
+        self.created_at = created_at
+        self.details = details
+
+SALE_COLUMNS = "id, datetime, total_price, total_purchase_price, created_at"
+
+class BillLine(Record):
+    """A line of the bill being rung up; id is -1 for custom items that are not in the catalog"""
+    __slots__ = ("id", "name", "barcode", "price", "qty", "total", "purchase_price", "is_custom")
+
+    def __init__(self, id, name, barcode, price, qty, total, purchase_price, is_custom=False):
+        self.id = id
+        self.name = name
+        self.barcode = barcode
+        self.price = price
+        self.qty = qty
+        self.total = total
+        self.purchase_price = purchase_price
+        self.is_custom = is_custom
+
+class ReceiptLine(Record):
+    """A line of the goods receipt being scanned in; cost_each in minor units"""
+    __slots__ = ("item_id", "name", "barcode", "quantity", "cost_each")
+
+    def __init__(self, item_id, name, barcode, quantity, cost_each):
+        self.item_id = item_id
+        self.name = name
+        self.barcode = barcode
+        self.quantity = quantity
+        self.cost_each = cost_each
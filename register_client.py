@@ -0,0 +1,249 @@
+# register_client.py (till side of multi-register mode: catalog lookups and bill commits through register_server)
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import socket
+import statistics
+import threading
+import time
+import uuid
+
+import register_server
+from records import BillLine, Item, Sale, SaleLine
+
+# Set KIOSQUE_SERVER to the server's address (socket path or host:port) to run the till against it
+ENABLED = bool(os.environ.get("KIOSQUE_SERVER"))
+ADDRESS = os.environ.get("KIOSQUE_SERVER") or register_server.DEFAULT_ADDRESS
+REQUEST_TIMEOUT = 10
+COMMIT_ATTEMPTS = 3     # Sends of one bill (same uid) before commit_bill gives up
+
+class RegisterClient:
+    """
+    Stands in for the models functions used at the checkout (item lookups, add_item and commit_bill)
+    and by the stock, sales and reports tabs, which show the server's data.
+    Items are cached by id and barcode until the server pushes a catalog change for them;
+    functions in catalog_listeners are then called with the changed item ids (None for
+    everything) from the reader thread. A lost connection is re-opened on the next call,
+    with an empty cache since pushes may have been missed.
+    """
+
+    def __init__(self, address=ADDRESS, timeout=REQUEST_TIMEOUT):
+        self.address = address
+        self.timeout = timeout
+        self.catalog_listeners = []
+        self._sock = None
+        self._send_lock = threading.Lock()
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._next_id = 0
+        self._items = {}
+        self._barcodes = {}
+        self._connect()
+
+    def _connect(self):
+        family, address = register_server.parse_address(self.address)
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.connect(address)
+        self._sock = sock
+        self._invalidate(None)
+        threading.Thread(target=self._read, args=(sock,), name="RegisterClient", daemon=True).start()
+
+    def close(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    def _read(self, sock):
+        try:
+            for raw in sock.makefile("rb"):
+                message = json.loads(raw)
+                if "event" in message:
+                    self._on_event(message)
+                    continue
+                with self._pending_lock:
+                    waiter = self._pending.pop(message.get("id"), None)
+                if waiter is not None:
+                    waiter[1] = message
+                    waiter[0].set()
+        except (OSError, ValueError):
+            pass
+        if self._sock is sock:
+            self._sock = None
+        # Wake every caller still waiting on this connection
+        with self._pending_lock:
+            pending, self._pending = self._pending, {}
+        for waiter in pending.values():
+            waiter[0].set()
+
+    def _call(self, op, **args):
+        if self._sock is None:
+            self._connect()
+        with self._pending_lock:
+            self._next_id += 1
+            request_id = self._next_id
+            waiter = self._pending[request_id] = [threading.Event(), None]
+        data = register_server.encode({"id": request_id, "op": op, "args": args})
+        try:
+            with self._send_lock:
+                self._sock.sendall(data)
+        except OSError as e:
+            with self._pending_lock:
+                self._pending.pop(request_id, None)
+            self._sock = None
+            raise ConnectionError(f"تعذر الاتصال بخادم الصناديق: {e}") from e
+        if not waiter[0].wait(self.timeout):
+            with self._pending_lock:
+                self._pending.pop(request_id, None)
+            raise TimeoutError(f"لم يرد خادم الصناديق على {op}")
+        response = waiter[1]
+        if response is None:
+            raise ConnectionError("انقطع الاتصال بخادم الصناديق")
+        if response.get("error"):
+            raise RuntimeError(response["error"])
+        return response.get("result")
+
+    def _on_event(self, message):
+        if message["event"] != "catalog_changed":
+            return
+        item_ids = message.get("item_ids")
+        self._invalidate(item_ids)
+        for listener in list(self.catalog_listeners):
+            listener(item_ids)
+
+    def _invalidate(self, item_ids):
+        if item_ids is None:
+            self._items.clear()
+            self._barcodes.clear()
+            return
+        for item_id in item_ids:
+            item = self._items.pop(item_id, None)
+            if item is not None and item.barcode:
+                self._barcodes.pop(item.barcode, None)
+
+    def _remember(self, data):
+        if data is None:
+            return None
+        item = Item(**data)
+        self._items[item.id] = item
+        if item.barcode:
+            self._barcodes[item.barcode] = item
+        return item
+
+    def get_item_by_barcode(self, barcode):
+        item = self._barcodes.get(barcode)
+        if item is None:
+            item = self._remember(self._call("get_item_by_barcode", barcode=barcode))
+        return item
+
+    def get_item(self, item_id):
+        item = self._items.get(item_id)
+        if item is None:
+            item = self._remember(self._call("get_item", item_id=item_id))
+        return item
+
+    def get_items(self):
+        return [Item(**data) for data in self._call("get_items")]
+
+    def search_items_by_name(self, name_query):
+        return [Item(**data) for data in self._call("search_items_by_name", name_query=name_query)]
+
+    def get_sales(self, date_from=None, date_to=None, include_archive=False):
+        return [Sale(**data) for data in self._call("get_sales", date_from=date_from, date_to=date_to,
+                                                    include_archive=include_archive)]
+
+    def get_sale_with_details(self, ids):
+        """{sale_id: Sale with its SaleLines in .details}, as models.get_sale_with_details"""
+        if isinstance(ids, int):
+            ids = [ids]
+        result = {}
+        for data in self._call("get_sale_with_details", ids=list(ids)):
+            data["details"] = [SaleLine(**line) for line in data["details"] or []]
+            result[data["id"]] = Sale(**data)
+        return result
+
+    def get_sale_amendments(self, sale_id):
+        return self._call("get_sale_amendments", sale_id=sale_id)
+
+    def get_top_items(self, metric="revenue", limit=20, days=None):
+        return self._call("get_top_items", metric=metric, limit=limit, days=days)
+
+    def get_dead_stock(self, days=30, limit=500):
+        return self._call("get_dead_stock", days=days, limit=limit)
+
+    def get_reorder_list(self):
+        return self._call("get_reorder_list")
+
+    def get_margin_by_category(self, days=None):
+        return self._call("get_margin_by_category", days=days)
+
+    def get_hourly_heatmap(self):
+        return self._call("get_hourly_heatmap")
+
+    def commit_bill(self, lines, sale_datetime=None, uid=None):
+        """
+        Send a bill to the server's batched writer; returns the sale id once it is committed.
+        The bill carries a uid (pass the same one to save the same bill again), so resending
+        it after a timeout or a lost connection never writes a second sale.
+        """
+        uid = uid or uuid.uuid4().hex
+        args = {"lines": [line._asdict() for line in lines], "sale_datetime": sale_datetime, "uid": uid}
+        for attempt in range(1, COMMIT_ATTEMPTS + 1):
+            try:
+                return self._call("commit_bill", **args)
+            except (TimeoutError, ConnectionError):
+                if attempt == COMMIT_ATTEMPTS:
+                    raise
+
+    def add_item(self, name, category_id, barcode, price, stock_count, photo_path, purchase_price=0):
+        """Save a new item on the server (see models.add_item); returns its id."""
+        return self._call("add_item", name=name, category_id=category_id, barcode=barcode, price=price,
+                          stock_count=stock_count, photo_path=photo_path, purchase_price=purchase_price)
+
+    def notify_catalog(self, item_ids=None):
+        """Tell every till that these items (None: the whole catalog) were changed outside commit_bill."""
+        self._call("notify_catalog", item_ids=item_ids)
+
+    def ping(self):
+        return self._call("ping")
+
+def _lane(address, bills, lines_per_bill, seed, results):
+    """One simulated till: scan items by barcode and commit bills, recording commit latencies."""
+    client = RegisterClient(address)
+    rng = random.Random(seed)
+    barcodes = [item.barcode for item in client.get_items() if item.barcode]
+    latencies = []
+    for _ in range(bills):
+        lines = []
+        for barcode in rng.sample(barcodes, min(lines_per_bill, len(barcodes))):
+            item = client.get_item_by_barcode(barcode)
+            lines.append(BillLine(item.id, item.name, item.barcode, item.price, 1, item.price, item.purchase_price))
+        started = time.perf_counter()
+        client.commit_bill(lines)
+        latencies.append(time.perf_counter() - started)
+    client.close()
+    results.put(latencies)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test a running register_server with several simulated tills")
+    parser.add_argument("--address", default=ADDRESS)
+    parser.add_argument("--lanes", type=int, default=4, help="simulated tills, one process each")
+    parser.add_argument("--bills", type=int, default=200, help="bills per till")
+    parser.add_argument("--lines", type=int, default=3, help="lines per bill")
+    args = parser.parse_args()
+
+    results = multiprocessing.Queue()
+    lanes = [multiprocessing.Process(target=_lane, args=(args.address, args.bills, args.lines, seed, results))
+             for seed in range(args.lanes)]
+    started = time.perf_counter()
+    for lane in lanes:
+        lane.start()
+    latencies = sorted(l for _ in lanes for l in results.get())
+    for lane in lanes:
+        lane.join()
+    elapsed = time.perf_counter() - started
+    print(f"{len(latencies)} bills from {args.lanes} tills in {elapsed:.2f}s ({len(latencies) / elapsed:.0f} bills/s)")
+    if latencies:
+        print(f"commit latency p50 {statistics.median(latencies) * 1000:.1f}ms "
+              f"p95 {latencies[int(len(latencies) * 0.95) - 1] * 1000:.1f}ms max {latencies[-1] * 1000:.1f}ms")
@@ -0,0 +1,303 @@
+# register_server.py (multi-register mode: one process owns store.db and serves the tills over a local socket)
+import argparse
+import json
+import logging
+import os
+import queue
+import socket
+import socketserver
+import threading
+import time
+from datetime import datetime
+
+import dbstats
+import journal
+import maintenance
+import models
+from records import BillLine, Record
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ADDRESS = "kiosque.sock"
+BATCH_MAX_BILLS = 64    # Most bills written in one transaction
+BATCH_WINDOW = 0.0      # Seconds the writer waits for more bills once one has arrived;
+                        # at 0 a batch is whatever queued up while the previous one was written
+
+# Catalog lookups answered straight from the database by the connection's thread
+READ_OPS = {
+    "ping": lambda: "pong",
+    "get_item_by_barcode": models.get_item_by_barcode,
+    "get_item": models.get_item,
+    "get_items": models.get_items,
+    "search_items_by_name": models.search_items_by_name,
+    # Sales history and reports, so a till's tabs show the server's data rather than its own store.db
+    "get_sales": models.get_sales,
+    "get_sale_with_details": lambda ids: list(models.get_sale_with_details(ids).values()),
+    "get_sale_amendments": models.get_sale_amendments,
+    "get_top_items": models.get_top_items,
+    "get_dead_stock": models.get_dead_stock,
+    "get_reorder_list": models.get_reorder_list,
+    "get_margin_by_category": models.get_margin_by_category,
+    "get_hourly_heatmap": models.get_hourly_heatmap,
+}
+
+# Catalog writes a till may make at the checkout (a new item saved from the scan dialog);
+# every till is told about the change once it is committed
+CATALOG_WRITE_OPS = {
+    "add_item": models.add_item,
+}
+
+def parse_address(address):
+    """'host:port' or ':port' is TCP, anything else is the path of a Unix socket"""
+    host, sep, port = address.rpartition(":")
+    if sep and port.isdigit():
+        return socket.AF_INET, (host or "127.0.0.1", int(port))
+    return socket.AF_UNIX, address
+
+def encode(message):
+    """One protocol message: a JSON object on its own line"""
+    return (json.dumps(message, ensure_ascii=False) + "\n").encode("utf-8")
+
+def _plain(value):
+    if isinstance(value, Record):
+        return {name: _plain(v) for name, v in value._asdict().items()}
+    if isinstance(value, list):
+        return [_plain(v) for v in value]
+    return value
+
+class BillWriter(threading.Thread):
+    """
+    The only writer of sales. Bills queued by any connection are written in batches of
+    up to BATCH_MAX_BILLS per transaction (group commit); each bill has its own savepoint
+    so a failing bill does not take the rest of the batch with it. A bill sent with a uid
+    is recorded in journal_applied; a till retrying it after a timeout gets the sale id
+    of the first write back instead of a second sale.
+    """
+
+    def __init__(self, on_committed, max_bills=BATCH_MAX_BILLS, window=BATCH_WINDOW):
+        super().__init__(name="BillWriter", daemon=True)
+        self.on_committed = on_committed
+        self.max_bills = max_bills
+        self.window = window
+        self.bills_written = 0
+        self.batches_written = 0
+        self._queue = queue.Queue()
+
+    def submit(self, lines, sale_datetime, reply, uid=None):
+        """Queue a bill; reply(sale_id, error) is called from the writer thread once it is written."""
+        self._queue.put((lines, sale_datetime, reply, uid))
+
+    def stop(self):
+        self._queue.put(None)
+
+    def run(self):
+        # One connection for the life of the writer, used only from this thread
+        with models.get_db() as conn, dbstats.cache_watched(conn):
+            journal.install_journal(conn)
+            stopping = False
+            while not stopping:
+                job = self._queue.get()
+                if job is None:
+                    break
+                batch = [job]
+                deadline = time.monotonic() + self.window
+                while len(batch) < self.max_bills:
+                    try:
+                        job = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                    except queue.Empty:
+                        break
+                    if job is None:
+                        stopping = True
+                        break
+                    batch.append(job)
+                self._write(conn, batch)
+
+    def _write(self, conn, batch):
+        maintenance.note_activity()
+        results = []
+        c = conn.cursor()
+        try:
+            c.execute("BEGIN IMMEDIATE")
+            try:
+                for lines, sale_datetime, reply, uid in batch:
+                    if uid is not None:
+                        c.execute("SELECT sale_id FROM journal_applied WHERE uid = ?", (uid,))
+                        row = c.fetchone()
+                        if row:
+                            results.append((reply, row[0], None, []))  # A retry of a bill already written
+                            continue
+                    c.execute("SAVEPOINT bill")
+                    try:
+                        sale_id = models.write_bill(c, lines, sale_datetime)
+                        if uid is not None:
+                            c.execute(
+                                "INSERT INTO journal_applied(uid, sale_id, applied_at) VALUES (?, ?, ?)",
+                                (uid, sale_id, datetime.now().isoformat())
+                            )
+                    except Exception as e:
+                        c.execute("ROLLBACK TO bill")
+                        results.append((reply, None, str(e), lines))
+                    else:
+                        results.append((reply, sale_id, None, lines))
+                    c.execute("RELEASE bill")
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        except Exception as e:
+            logger.exception("Writing a batch of %d bills failed", len(batch))
+            results = [(reply, None, str(e), lines) for lines, _, reply, _ in batch]
+        else:
+            self.bills_written += sum(1 for _, sale_id, _, lines in results if sale_id is not None and lines)
+            self.batches_written += 1
+        try:
+            for reply, sale_id, error, _ in results:
+                reply(sale_id, error)
+            item_ids = sorted({line.id for _, sale_id, _, lines in results if sale_id is not None
+                               for line in lines if not line.is_custom})
+            if item_ids:
+                self.on_committed(item_ids)
+        except Exception:
+            logger.exception("Replying to a batch of %d bills failed", len(batch))
+
+class _Handler(socketserver.StreamRequestHandler):
+    """One till connection: requests in, replies and catalog events out, all JSON lines"""
+
+    def setup(self):
+        super().setup()
+        self.send_lock = threading.Lock()
+        self.server.owner._add_client(self)
+
+    def finish(self):
+        self.server.owner._remove_client(self)
+        super().finish()
+
+    def send(self, message):
+        data = encode(message)
+        with self.send_lock:
+            try:
+                self.wfile.write(data)
+                self.wfile.flush()
+            except (OSError, ValueError):
+                pass  # The till went away; finish() unregisters it
+
+    def handle(self):
+        try:
+            for raw in self.rfile:
+                try:
+                    request = json.loads(raw)
+                except ValueError:
+                    self.send({"id": None, "error": "bad request"})
+                    continue
+                self.server.owner._dispatch(self, request)
+        except OSError:
+            pass  # Connection reset by the till
+
+class _UnixServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+class _TCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+class RegisterServer:
+    """
+    Serves catalog lookups and bill commits to several tills (register_client.RegisterClient)
+    and pushes {"event": "catalog_changed", "item_ids": [...]} to every till when bills
+    change stock, a till saves a new item or reports a catalog edit (item_ids null means everything).
+    """
+
+    def __init__(self, address=DEFAULT_ADDRESS):
+        self.address = address
+        family, bind_address = parse_address(address)
+        if family == socket.AF_UNIX and os.path.exists(bind_address):
+            os.unlink(bind_address)  # Left over by a server that did not shut down cleanly
+        server_class = _UnixServer if family == socket.AF_UNIX else _TCPServer
+        self._server = server_class(bind_address, _Handler)
+        self._server.owner = self
+        self._clients = set()
+        self._clients_lock = threading.Lock()
+        self.writer = BillWriter(self.broadcast_catalog_change)
+
+    def _add_client(self, handler):
+        with self._clients_lock:
+            self._clients.add(handler)
+        logger.info("Till connected (%d connected)", len(self._clients))
+
+    def _remove_client(self, handler):
+        with self._clients_lock:
+            self._clients.discard(handler)
+        logger.info("Till disconnected (%d connected)", len(self._clients))
+
+    def broadcast_catalog_change(self, item_ids=None):
+        with self._clients_lock:
+            clients = list(self._clients)
+        message = {"event": "catalog_changed", "item_ids": item_ids}
+        for client in clients:
+            client.send(message)
+
+    def _dispatch(self, handler, request):
+        request_id = request.get("id")
+        op = request.get("op")
+        args = request.get("args") or {}
+        try:
+            if op == "commit_bill":
+                lines = [BillLine(**line) for line in args["lines"]]
+                self.writer.submit(
+                    lines, args.get("sale_datetime"),
+                    lambda sale_id, error: handler.send(
+                        {"id": request_id, "error": error} if error else {"id": request_id, "result": sale_id}
+                    ),
+                    args.get("uid")
+                )
+                return
+            if op == "notify_catalog":
+                self.broadcast_catalog_change(args.get("item_ids"))
+                result = None
+            elif op in CATALOG_WRITE_OPS:
+                result = CATALOG_WRITE_OPS[op](**args)
+                self.broadcast_catalog_change(None)
+            elif op in READ_OPS:
+                result = _plain(READ_OPS[op](**args))
+            else:
+                raise ValueError(f"unknown op: {op}")
+        except Exception as e:
+            handler.send({"id": request_id, "error": str(e)})
+            return
+        handler.send({"id": request_id, "result": result})
+
+    def serve_forever(self):
+        self.writer.start()
+        logger.info("Register server listening on %s", self.address)
+        try:
+            self._server.serve_forever()
+        finally:
+            self.writer.stop()
+            self.writer.join()
+            self._server.server_close()
+            family, bind_address = parse_address(self.address)
+            if family == socket.AF_UNIX and os.path.exists(bind_address):
+                os.unlink(bind_address)
+
+    def shutdown(self):
+        """Stop serve_forever from another thread; queued bills are written first."""
+        self._server.shutdown()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve store.db to several tills (set KIOSQUE_SERVER on each till)")
+    parser.add_argument("--address", default=DEFAULT_ADDRESS, help="Unix socket path, or host:port for TCP")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    models.init_db()
+    server = RegisterServer(args.address)
+    # The server owns store.db, so it also runs the idle-time maintenance (idle: no bills written)
+    maintenance_scheduler = maintenance.MaintenanceScheduler()
+    maintenance_scheduler.start()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        maintenance_scheduler.stop()
+        logger.info("Wrote %d bills in %d transactions", server.writer.bills_written, server.writer.batches_written)
@@ -0,0 +1,126 @@
+# reorder.py (sales velocity per item with exponential smoothing, days of cover and reorder suggestions)
+import math
+from datetime import date
+
+SMOOTHING_ALPHA = 0.2   # Weight of the latest day in the smoothed units/day
+LEAD_TIME_DAYS = 7      # Days between placing an order and receiving it
+REVIEW_DAYS = 14        # Days of sales an order should cover once received
+SAFETY_DAYS = 3         # Extra cover against demand above the forecast
+
+# Smoothed units/day of each item as of the end of last_day, plus the units sold
+# on last_day itself, which are folded in once a later day is seen
+VELOCITY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS item_velocity (
+    item_id INTEGER PRIMARY KEY,
+    velocity REAL NOT NULL DEFAULT 0,
+    last_day TEXT NOT NULL,
+    day_units REAL NOT NULL DEFAULT 0,
+    FOREIGN KEY (item_id) REFERENCES items(id) ON DELETE CASCADE
+)
+"""
+
+def _days_between(start, end):
+    return (date.fromisoformat(end) - date.fromisoformat(start)).days
+
+def _advance(velocity, last_day, day_units, day, alpha=SMOOTHING_ALPHA):
+    """Velocity as of the start of `day`: close last_day, then decay over the days without sales."""
+    gap = _days_between(last_day, day)
+    if gap <= 0:
+        return velocity
+    closed = alpha * day_units + (1 - alpha) * velocity
+    return closed * (1 - alpha) ** (gap - 1)
+
+def current_velocity(velocity, last_day, day_units, today=None, alpha=SMOOTHING_ALPHA):
+    """
+    Forecast units/day for today: the velocity over the closed days only. Today is not
+    folded in until it is over, as a day still under way would count as a slow one.
+    """
+    today = today or date.today().isoformat()
+    return _advance(velocity, last_day, day_units, today, alpha)
+
+def record_sale(cur, item_id, quantity, day, alpha=SMOOTHING_ALPHA):
+    """
+    Fold one sale line's units sold on `day` into the item's velocity (negative units when
+    a sale is deleted or amended down); runs in the caller's transaction.
+    """
+    if item_id is None:
+        return
+    cur.execute("SELECT velocity, last_day, day_units FROM item_velocity WHERE item_id = ?", (item_id,))
+    row = cur.fetchone()
+    if row is None:
+        velocity, last_day, day_units = 0.0, day, 0.0
+    else:
+        velocity, last_day, day_units = row[0], row[1], row[2]
+    if day > last_day:
+        velocity = _advance(velocity, last_day, day_units, day, alpha)
+        last_day, day_units = day, 0.0
+    if day == last_day:
+        day_units = max(0.0, day_units + quantity)
+    else:
+        # A line for a day already closed moves the velocity by that day's weight in it
+        weight = alpha * (1 - alpha) ** (_days_between(day, last_day) - 1)
+        velocity = max(0.0, velocity + weight * quantity)
+    cur.execute("""
+        INSERT INTO item_velocity(item_id, velocity, last_day, day_units) VALUES (?, ?, ?, ?)
+        ON CONFLICT(item_id) DO UPDATE SET
+            velocity = excluded.velocity, last_day = excluded.last_day, day_units = excluded.day_units
+    """, (item_id, velocity, last_day, day_units))
+
+def rebuild_velocities(conn, alpha=SMOOTHING_ALPHA):
+    """Recompute every velocity from the per-day totals in daily_item_sales (see aggregates)."""
+    cur = conn.cursor()
+    cur.execute("DELETE FROM item_velocity")
+    rows = []
+    state = None
+    for item_id, day, units in conn.execute(
+            "SELECT item_id, day, units FROM daily_item_sales ORDER BY item_id, day"):
+        if state is None or state[0] != item_id:
+            if state is not None:
+                rows.append(state)
+            state = (item_id, 0.0, day, units)
+            continue
+        velocity = _advance(state[1], state[2], state[3], day, alpha)
+        state = (item_id, velocity, day, units)
+    if state is not None:
+        rows.append(state)
+    cur.executemany(
+        "INSERT INTO item_velocity(item_id, velocity, last_day, day_units) VALUES (?, ?, ?, ?)", rows)
+    return len(rows)
+
+def install_velocities(conn):
+    """Create item_velocity; seed it from daily_item_sales the first time."""
+    cur = conn.cursor()
+    cur.execute(VELOCITY_SCHEMA)
+    cur.execute("SELECT 1 FROM item_velocity LIMIT 1")
+    if cur.fetchone() is None:
+        rebuild_velocities(conn)
+    conn.commit()
+
+def build_reorder_list(conn, lead_time=LEAD_TIME_DAYS, review=REVIEW_DAYS, safety=SAFETY_DAYS, today=None):
+    """
+    Items whose stock no longer covers lead_time + safety days of forecast sales, with the
+    quantity that brings them to lead_time + review + safety days of cover. Sorted by
+    days of cover, most urgent first. Items that never sold are not forecast.
+    """
+    today = today or date.today().isoformat()
+    result = []
+    for item_id, name, barcode, stock, velocity, last_day, day_units in conn.execute("""
+            SELECT i.id, i.name, i.barcode, i.stock_count, v.velocity, v.last_day, v.day_units
+            FROM item_velocity v JOIN items i ON i.id = v.item_id"""):
+        per_day = current_velocity(velocity, last_day, day_units, today)
+        if per_day <= 0:
+            continue
+        stock = max(0.0, stock or 0.0)
+        if stock > per_day * (lead_time + safety):
+            continue
+        result.append({
+            "item_id": item_id,
+            "name": name,
+            "barcode": barcode,
+            "stock_count": stock,
+            "velocity": per_day,
+            "days_of_cover": stock / per_day,
+            "suggested_qty": max(0, math.ceil(per_day * (lead_time + review + safety) - stock)),
+        })
+    result.sort(key=lambda r: r["days_of_cover"])
+    return result
@@ -0,0 +1,102 @@
+# stall_monitor.py (opt-in Qt event-loop stall detector: logs the GUI thread stack when the UI freezes)
+import faulthandler
+import os
+import sys
+import threading
+import time
+import traceback
+from datetime import datetime
+
+from PyQt5.QtCore import QTimer
+
+ENABLED = os.environ.get("KIOSQUE_WATCHDOG", "0") == "1"
+STALL_THRESHOLD_MS = int(os.environ.get("KIOSQUE_STALL_MS", "500"))
+HEARTBEAT_MS = 100
+HARD_STALL_FACTOR = 4   # faulthandler dumps all threads after threshold * factor
+STALL_LOG = "ui_stalls.log"
+
+class StallMonitor:
+    """
+    A QTimer heartbeat in the GUI thread plus a watcher thread. When the heartbeat is late
+    by more than threshold_ms the watcher logs the GUI thread's stack and the Controller
+    method it is in. If the GUI thread holds the GIL (e.g. stuck in C++), faulthandler's
+    own timer, re-armed on every heartbeat, dumps all thread stacks to the same log.
+    Must be created in the GUI thread.
+    """
+
+    def __init__(self, threshold_ms=STALL_THRESHOLD_MS, interval_ms=HEARTBEAT_MS, log_path=STALL_LOG):
+        self.threshold = threshold_ms / 1000.0
+        self.interval = interval_ms / 1000.0
+        self.stalls = 0
+        self._gui_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stall_started = None
+        self._log_lock = threading.Lock()
+        self._log_file = open(log_path, "a", encoding="utf-8")
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._watch, name="StallMonitor", daemon=True)
+        self._timer = QTimer()
+        self._timer.setInterval(interval_ms)
+        self._timer.timeout.connect(self._beat)
+
+    def start(self):
+        self._last_beat = time.monotonic()
+        self._timer.start()
+        self._thread.start()
+        self._arm_faulthandler()
+
+    def stop(self):
+        self._timer.stop()
+        self._stop_event.set()
+        faulthandler.cancel_dump_traceback_later()
+        with self._log_lock:
+            self._log_file.close()
+
+    def _arm_faulthandler(self):
+        faulthandler.dump_traceback_later(self.threshold * HARD_STALL_FACTOR, repeat=False,
+                                          file=self._log_file)
+
+    def _write(self, text):
+        with self._log_lock:
+            if not self._log_file.closed:
+                self._log_file.write(f"[{datetime.now().isoformat(timespec='milliseconds')}] {text}\n")
+                self._log_file.flush()
+
+    def _beat(self):
+        now = time.monotonic()
+        late = now - self._last_beat - self.interval
+        if self._stall_started is not None:
+            self._write(f"UI stall ended after {(now - self._stall_started) * 1000:.0f}ms")
+            self._stall_started = None
+        elif late > self.threshold:
+            # The watcher could not run (GIL held by the GUI thread); only the duration is known
+            self.stalls += 1
+            self._write(f"UI stall of {late * 1000:.0f}ms (no stack captured)")
+        self._last_beat = now
+        self._arm_faulthandler()
+
+    def _watch(self):
+        while not self._stop_event.wait(self.interval / 2):
+            last_beat = self._last_beat
+            blocked = time.monotonic() - last_beat
+            if self._stall_started is None and blocked > self.threshold + self.interval:
+                self._stall_started = last_beat
+                self.stalls += 1
+                self._report(blocked)
+
+    @staticmethod
+    def _controller_slot(stack):
+        """Outermost controllers.py frame, i.e. the Controller slot that is running"""
+        for entry in stack:
+            if os.path.basename(entry.filename) == "controllers.py":
+                return entry.name
+        return None
+
+    def _report(self, blocked):
+        frame = sys._current_frames().get(self._gui_thread_id)
+        stack = traceback.extract_stack(frame) if frame is not None else []
+        slot = self._controller_slot(stack) or "?"
+        self._write(
+            f"UI stall: event loop blocked for {blocked * 1000:.0f}ms in slot {slot}\n"
+            + "".join(traceback.format_list(stack))
+        )
@@ -0,0 +1,8 @@
+# tests/conftest.py (modules are imported from the repository root, with store.db in a scratch directory)
+import os
+import sys
+import tempfile
+
+# models opens (and migrates) store.db in the working directory as soon as it is imported
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(tempfile.mkdtemp(prefix="kiosque_tests_"))
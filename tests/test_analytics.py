@@ -0,0 +1,21 @@
+# tests/test_analytics.py (column cache: lines follow their item into a new category)
+import pytest
+
+import analytics
+import models
+from records import BillLine
+
+pytest.importorskip("numpy")
+
+def test_recategorized_item_moves_without_a_rebuild(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    old_cat, new_cat = [cat["id"] for cat in models.get_categories()[:2]]
+    item_id = models.add_item("analytics test", old_cat, None, 100, 10, None, purchase_price=50)
+    models.commit_bill([BillLine(item_id, "analytics test", None, 100, 2, 200, 50)])
+    cols = analytics.load(cache_dir)
+    assert set(cols.category_id[cols.item_id == item_id]) == {old_cat}
+
+    models.update_item(item_id, "analytics test", new_cat, None, 100, 8, None, 50)
+    assert analytics.refresh_cache(cache_dir) == 0
+    cols = analytics.load(cache_dir, refresh=False)
+    assert set(cols.category_id[cols.item_id == item_id]) == {new_cat}
@@ -0,0 +1,31 @@
+# tests/test_cdc.py (change feed: a cursor older than the retention window is reported, not skipped past)
+import pytest
+
+import cdc
+import database
+import models
+
+def test_cursor_behind_pruned_changes_expires():
+    for n in range(3):
+        models.add_item(f"cdc test {n}", None, None, 100, 1, None)
+    conn = database.get_connection()
+    try:
+        latest = cdc.latest_seq(conn)
+        cursor = latest - 2
+        assert [change["seq"] for change in cdc.changes_since(conn, cursor)] == [latest - 1, latest]
+
+        conn.execute("DELETE FROM change_log WHERE seq <= ?", (latest - 1,))
+        conn.commit()
+        assert [change["seq"] for change in cdc.changes_since(conn, latest - 1)] == [latest]
+        with pytest.raises(cdc.CursorExpired) as expired:
+            cdc.changes_since(conn, cursor)
+        assert expired.value.oldest == latest
+
+        conn.execute("DELETE FROM change_log")
+        conn.commit()
+        assert cdc.latest_seq(conn) == latest
+        assert cdc.changes_since(conn, latest) == []
+        with pytest.raises(cdc.CursorExpired):
+            cdc.changes_since(conn, latest - 1)
+    finally:
+        conn.close()
@@ -0,0 +1,59 @@
+# tests/test_http_api.py (HTTP API: malformed requests get a 4xx, never a 500 or a dropped connection)
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import http_api
+
+class _Store:
+    def get_item(self, item_id):
+        if item_id != 1:
+            return None
+        return SimpleNamespace(id=1, name="صنف", barcode="123", price=100, purchase_price=50,
+                               category_name=None, stock_count=3)
+
+    def get_item_by_barcode(self, barcode):
+        return self.get_item(1)
+
+    def commit_bill(self, lines):
+        return 7
+
+def _post_bill(body):
+    api = http_api.ApiServer(store=_Store(), workers=1)
+    try:
+        return api._post_bill(None, {}, json.dumps(body).encode())
+    except http_api.HttpError as e:
+        return e.status, e.message
+
+@pytest.mark.parametrize("body", [
+    {"lines": 5},
+    {"lines": ["123"]},
+    {"lines": [{"id": "abc"}]},
+    {"lines": [{"id": True}]},
+    {"lines": [{"id": 1, "qty": True}]},
+    {"lines": [{"id": 1, "qty": float("nan")}]},
+])
+def test_malformed_bill_is_unprocessable(body):
+    assert _post_bill(body)[0] == 422
+
+def test_valid_bill_is_created():
+    status, payload = _post_bill({"lines": [{"id": 1, "qty": 2}]})
+    assert status == 201 and payload["sale_id"] == 7
+
+@pytest.mark.parametrize("length", [b"xx", b"-5"])
+def test_bad_content_length_is_answered(length):
+    async def exchange():
+        api = http_api.ApiServer(port=0, store=_Store(), workers=1)
+        await api.start()
+        port = api._server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"POST /bills HTTP/1.1\r\nContent-Length: " + length + b"\r\n\r\n")
+        await writer.drain()
+        response = await reader.read()
+        writer.close()
+        api._server.close()
+        return response
+
+    assert asyncio.run(exchange()).startswith(b"HTTP/1.1 400 ")
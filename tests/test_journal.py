@@ -0,0 +1,27 @@
+# tests/test_journal.py (sales journal: torn lines left by a crash mid-append)
+import journal
+from records import BillLine
+
+def _line():
+    return BillLine(1, "صنف", "123", 100, 1, 100, 50)
+
+def test_append_after_torn_line_is_readable(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    with open(path, "wb") as f:
+        f.write(b'{"uid": "torn", "at": "2026-')
+
+    sales_journal = journal.SalesJournal(path)
+    assert sales_journal.replay() == 0
+    uid = sales_journal.append([_line()])
+    sales_journal._file.close()  # Crash: the thread never applied the entry
+
+    assert [entry["uid"] for entry in journal.read_entries(path)] == [uid]
+
+def test_trim_torn_tail_keeps_complete_lines(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    with open(path, "wb") as f:
+        f.write(b'{"uid": "a"}\n{"uid": "b"}\n{"uid": "c", "li')
+
+    assert journal.trim_torn_tail(path) == len(b'{"uid": "c", "li')
+    assert journal.trim_torn_tail(path) == 0
+    assert [entry["uid"] for entry in journal.read_entries(path)] == ["a", "b"]
@@ -0,0 +1,51 @@
+# tests/test_reorder.py (sales velocity: incomplete days, deleted and amended sales)
+from datetime import date, timedelta
+
+import pytest
+
+import models
+import reorder
+from records import BillLine
+
+def _velocity_row(item_id):
+    with models.get_db() as conn:
+        return tuple(conn.execute(
+            "SELECT velocity, last_day, day_units FROM item_velocity WHERE item_id = ?", (item_id,)).fetchone())
+
+def _rebuilt_row(item_id):
+    with models.get_db() as conn:
+        reorder.rebuild_velocities(conn)
+        row = tuple(conn.execute(
+            "SELECT velocity, last_day, day_units FROM item_velocity WHERE item_id = ?", (item_id,)).fetchone())
+        conn.rollback()
+    return row
+
+def _sell(item_id, qty, day):
+    item = models.get_item(item_id)
+    return models.commit_bill([BillLine(item.id, item.name, item.barcode, item.price, qty, item.price * qty,
+                                        item.purchase_price)], f"{day}T12:00:00")
+
+def test_today_does_not_count_as_a_slow_day():
+    yesterday = date.today() - timedelta(days=1)
+    before = reorder.current_velocity(4.0, yesterday.isoformat(), 10, today=yesterday.isoformat())
+    morning = reorder.current_velocity(4.0, yesterday.isoformat(), 10)
+    assert before == 4.0
+    assert morning == pytest.approx(0.2 * 10 + 0.8 * 4.0)
+    # Sales so far today leave the forecast alone until the day is over
+    assert reorder.current_velocity(morning, date.today().isoformat(), 1) == pytest.approx(morning)
+
+def test_deleted_and_amended_sales_leave_the_velocity():
+    item_id = models.add_item("velocity test", None, None, 100, 1000, None, purchase_price=50)
+    days = [(date.today() - timedelta(days=n)).isoformat() for n in (5, 3, 2, 0)]
+    sale_ids = [_sell(item_id, qty, day) for qty, day in zip((4, 6, 3, 2), days)]
+
+    models.delete_sale(sale_ids[1])
+    models.delete_sale(sale_ids[3])
+    sale = models.get_sale_with_details(sale_ids[2])[sale_ids[2]]
+    models.amend_sale(sale.id, edits={sale.details[0].id: (1, sale.details[0].price_each)})
+
+    velocity, last_day, day_units = _velocity_row(item_id)
+    rebuilt = _rebuilt_row(item_id)
+    assert (last_day, day_units) == (days[3], 0)
+    # rebuild_velocities only sees days that still have sales
+    assert reorder._advance(*rebuilt, last_day) == pytest.approx(velocity)
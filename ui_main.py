@@ -3,234 +3,41 @@ from PyQt5.QtWidgets import (QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QTa
                              QLabel, QLineEdit, QPushButton, QTableWidget, QTableWidgetItem, 
                              QComboBox, QDoubleSpinBox, QGroupBox, QGridLayout, QTextEdit, 
                              QHeaderView, QDialog, QDialogButtonBox, QCheckBox, QScrollArea,
-                             QSizePolicy, QSpacerItem, QMessageBox)  # Added QMessageBox
+                             QSizePolicy, QSpacerItem, QMessageBox, QSpinBox)  # Added QMessageBox
 from PyQt5.QtCore import Qt, QSize
 from PyQt5.QtGui import QFont, QPalette, QColor, QPixmap, QIcon
 import os
 
+from money import line_total, to_minor, to_major
+from records import BillLine, SaleLine
+from qss import THEME_NAMES, set_role
+
+# The Modern* widgets carry no stylesheet of their own: qss.apply_theme styles the whole
+# application from one stylesheet, so widgets are not re-parsed and re-polished one by one
 class ModernTabWidget(QTabWidget):
-    def __init__(self, parent=None):
-        super().__init__(parent)
-        self.setStyleSheet("""
-            QTabWidget::pane { 
-                border: 1px solid #cccccc; 
-                background: #f8f9fa; 
-                border-radius: 4px; 
-            }
-            QTabWidget::tab-bar { 
-                alignment: center; 
-            }
-            QTabBar::tab { 
-                background: #e9ecef; 
-                border: 1px solid #cccccc; 
-                padding: 8px 16px; 
-                margin-right: 2px; 
-                border-top-left-radius: 4px; 
-                border-top-right-radius: 4px; 
-                color: #495057;
-                font-weight: bold;
-            }
-            QTabBar::tab:selected { 
-                background: #007bff; 
-                color: white; 
-                border-color: #0056b3; 
-            }
-            QTabBar::tab:hover:!selected { 
-                background: #dee2e6; 
-            }
-        """)
+    pass
 
 class ModernButton(QPushButton):
-    def __init__(self, text, parent=None):
-        super().__init__(text, parent)
-        self.setStyleSheet("""
-            QPushButton {
-                background-color: #007bff;
-                color: white;
-                border: none;
-                padding: 8px 16px;
-                border-radius: 4px;
-                font-weight: bold;
-            }
-            QPushButton:hover {
-                background-color: #0056b3;
-            }
-            QPushButton:pressed {
-                background-color: #004085;
-            }
-            QPushButton:disabled {
-                background-color: #6c757d;
-                color: #ced4da;
-            }
-        """)
+    pass
 
 class ModernTable(QTableWidget):
     def __init__(self, rows=0, columns=0, parent=None):
         super().__init__(rows, columns, parent)
-        self.setStyleSheet("""
-            QTableWidget {
-                background-color: white;
-                alternate-background-color: #f8f9fa;
-                selection-background-color: #cce5ff;
-                selection-color: black;
-                gridline-color: #dee2e6;
-                border: 1px solid #dee2e6;
-                border-radius: 4px;
-            }
-            QTableWidget::item {
-                padding: 4px;
-                border-right: 1px solid #dee2e6;
-                border-bottom: 1px solid #dee2e6;
-            }
-            QTableWidget::item:selected {
-                background-color: #cce5ff;
-                color: black;
-            }
-            QHeaderView::section {
-                background-color: #007bff;
-                color: white;
-                padding: 6px;
-                border: none;
-                font-weight: bold;
-            }
-            QTableCornerButton::section {
-                background-color: #007bff;
-                border: none;
-            }
-        """)
         self.setAlternatingRowColors(True)
         self.horizontalHeader().setStretchLastSection(True)
         self.verticalHeader().setVisible(False)
 
 class ModernLineEdit(QLineEdit):
-    def __init__(self, parent=None):
-        super().__init__(parent)
-        self.setStyleSheet("""
-            QLineEdit {
-                border: 1px solid #ced4da;
-                border-radius: 4px;
-                padding: 6px 12px;
-                background-color: white;
-                selection-background-color: #cce5ff;
-            }
-            QLineEdit:focus {
-                border: 2px solid #007bff;
-            }
-            QLineEdit:disabled {
-                background-color: #e9ecef;
-                color: #6c757d;
-            }
-        """)
+    pass
 
 class ModernComboBox(QComboBox):
-    def __init__(self, parent=None):
-        super().__init__(parent)
-        self.setStyleSheet("""
-            QComboBox {
-                border: 1px solid #ced4da;
-                border-radius: 4px;
-                padding: 6px 12px;
-                background-color: white;
-                min-width: 6em;
-            }
-            QComboBox:focus {
-                border: 2px solid #007bff;
-            }
-            QComboBox:disabled {
-                background-color: #e9ecef;
-                color: #6c757d;
-            }
-            QComboBox::drop-down {
-                subcontrol-origin: padding;
-                subcontrol-position: top right;
-                width: 20px;
-                border-left-width: 1px;
-                border-left-color: #ced4da;
-                border-left-style: solid;
-                border-top-right-radius: 4px;
-                border-bottom-right-radius: 4px;
-            }
-            QComboBox::down-arrow {
-                image: none;
-                border-left: 4px solid transparent;
-                border-right: 4px solid transparent;
-                border-top: 6px solid #495057;
-                width: 0;
-                height: 0;
-            }
-            QComboBox QAbstractItemView {
-                border: 1px solid #ced4da;
-                selection-background-color: #cce5ff;
-                selection-color: black;
-                background-color: white;
-            }
-        """)
+    pass
 
 class ModernDoubleSpinBox(QDoubleSpinBox):
-    def __init__(self, parent=None):
-        super().__init__(parent)
-        self.setStyleSheet("""
-            QDoubleSpinBox {
-                border: 1px solid #ced4da;
-                border-radius: 4px;
-                padding: 6px 12px;
-                background-color: white;
-                selection-background-color: #cce5ff;
-            }
-            QDoubleSpinBox:focus {
-                border: 2px solid #007bff;
-            }
-            QDoubleSpinBox:disabled {
-                background-color: #e9ecef;
-                color: #6c757d;
-            }
-            QDoubleSpinBox::up-button, QDoubleSpinBox::down-button {
-                subcontrol-origin: border;
-                subcontrol-position: top right;
-                width: 20px;
-                border-left: 1px solid #ced4da;
-            }
-            QDoubleSpinBox::up-button {
-                subcontrol-position: top right;
-                border-bottom: 1px solid #ced4da;
-                border-top-right-radius: 3px;
-            }
-            QDoubleSpinBox::down-button {
-                subcontrol-position: bottom right;
-                border-bottom-right-radius: 3px;
-            }
-            QDoubleSpinBox::up-arrow, QDoubleSpinBox::down-arrow {
-                width: 0;
-                height: 0;
-                border-left: 4px solid transparent;
-                border-right: 4px solid transparent;
-            }
-            QDoubleSpinBox::up-arrow {
-                border-bottom: 6px solid #495057;
-            }
-            QDoubleSpinBox::down-arrow {
-                border-top: 6px solid #495057;
-            }
-        """)
+    pass
 
 class ModernGroupBox(QGroupBox):
-    def __init__(self, title, parent=None):
-        super().__init__(title, parent)
-        self.setStyleSheet("""
-            QGroupBox {
-                font-weight: bold;
-                border: 1px solid #ced4da;
-                border-radius: 4px;
-                margin-top: 10px;
-                padding-top: 10px;
-                background-color: #f8f9fa;
-            }
-            QGroupBox::title {
-                subcontrol-origin: margin;
-                subcontrol-position: top center;
-                padding: 0 5px;
-            }
-        """)
+    pass
 
 class ItemScanDialog(QDialog):
     def __init__(self, parent=None, item_data=None, currency="د.ج"):
@@ -295,9 +102,9 @@ class ItemScanDialog(QDialog):
         
         # If we have item data, pre-fill the form
         if self.item_data:
-            self.in_barcode.setText(self.item_data.get("barcode", ""))
-            self.in_item_name.setText(self.item_data.get("name", ""))
-            self.in_price.setValue(float(self.item_data.get("price", 0)))
+            self.in_barcode.setText(self.item_data.barcode or "")
+            self.in_item_name.setText(self.item_data.name)
+            self.in_price.setValue(to_major(self.item_data.price))
             self.in_qty.setValue(1.0)
             self.in_item_name.setReadOnly(True)
             self.chk_manual_price.setChecked(False)
@@ -326,7 +133,7 @@ class ItemScanDialog(QDialog):
     def accept_with_details(self):
         barcode = self.in_barcode.text().strip()
         name = self.in_item_name.text().strip()
-        price = self.in_price.value()
+        price = to_minor(self.in_price.value())
         qty = self.in_qty.value()
         save_to_db = self.chk_save_to_db.isChecked()
         
@@ -344,7 +151,7 @@ class ItemScanDialog(QDialog):
         
         # Prepare return details
         self._return_details = {
-            "id": self.item_data["id"] if self.item_data else -1,
+            "id": self.item_data.id if self.item_data else -1,
             "barcode": barcode,
             "name": name,
             "price": price,
@@ -387,27 +194,128 @@ class SaleDetailsDialog(QDialog):
         # For now, return a placeholder
         return f"<h1>تفاصيل الفاتورة #{self.sale_id}</h1><p>سيتم عرض التفاصيل هنا</p>"
 
+class SaleAmendDialog(QDialog):
+    """
+    Correct a saved sale: change quantities and prices, mark lines for removal and add
+    items by barcode. After accept, changes holds the keyword arguments of
+    models.amend_sale (None when nothing was changed).
+    """
+    def __init__(self, sale, currency, lookup_item, parent=None):
+        super().__init__(parent)
+        self.sale = sale
+        self.currency = currency
+        self.lookup_item = lookup_item  # barcode -> Item or None
+        self.changes = None
+        self._rows = []  # (SaleLine or Item, quantity spin box, price spin box, remove check box)
+        self.setWindowTitle(f"تعديل الفاتورة #{sale.id}")
+        self.setModal(True)
+        self.resize(800, 550)
+        self.setup_ui()
+
+    def setup_ui(self):
+        layout = QVBoxLayout(self)
+        
+        # Lines: existing ones first, then the ones added here
+        self.tbl_lines = ModernTable(0, 5)
+        self.tbl_lines.setHorizontalHeaderLabels(["الصنف", "الكمية", f"السعر ({self.currency})", "حذف", "ملاحظة"])
+        self.tbl_lines.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        for line in self.sale.details or []:
+            self._add_row(line, line.item_name, line.quantity, line.price_each, "")
+        layout.addWidget(self.tbl_lines)
+        
+        # Add an item by barcode
+        add_group = ModernGroupBox("إضافة صنف")
+        add_layout = QHBoxLayout(add_group)
+        add_layout.addWidget(QLabel("الباركود:"))
+        self.in_add_barcode = ModernLineEdit()
+        self.in_add_barcode.returnPressed.connect(self.add_item)
+        add_layout.addWidget(self.in_add_barcode)
+        add_layout.addWidget(QLabel("الكمية:"))
+        self.in_add_qty = ModernDoubleSpinBox()
+        self.in_add_qty.setMaximum(9999.99)
+        self.in_add_qty.setValue(1.0)
+        add_layout.addWidget(self.in_add_qty)
+        self.btn_add = ModernButton("إضافة")
+        self.btn_add.clicked.connect(self.add_item)
+        add_layout.addWidget(self.btn_add)
+        layout.addWidget(add_group)
+        
+        # Reason, kept in the amendment trail
+        note_layout = QHBoxLayout()
+        note_layout.addWidget(QLabel("سبب التعديل:"))
+        self.in_note = ModernLineEdit()
+        note_layout.addWidget(self.in_note)
+        layout.addLayout(note_layout)
+        
+        # Buttons
+        button_layout = QHBoxLayout()
+        self.btn_ok = ModernButton("حفظ التعديل")
+        self.btn_ok.clicked.connect(self.accept_with_changes)
+        self.btn_cancel = ModernButton("إلغاء")
+        self.btn_cancel.clicked.connect(self.reject)
+        button_layout.addWidget(self.btn_ok)
+        button_layout.addWidget(self.btn_cancel)
+        layout.addLayout(button_layout)
+
+    def _add_row(self, source, name, quantity, price, note):
+        row = self.tbl_lines.rowCount()
+        self.tbl_lines.insertRow(row)
+        self.tbl_lines.setItem(row, 0, QTableWidgetItem(name))
+        spin_qty = ModernDoubleSpinBox()
+        spin_qty.setMaximum(9999.99)
+        spin_qty.setValue(quantity)
+        self.tbl_lines.setCellWidget(row, 1, spin_qty)
+        spin_price = ModernDoubleSpinBox()
+        spin_price.setMaximum(999999.99)
+        spin_price.setDecimals(2)
+        spin_price.setValue(to_major(price))
+        self.tbl_lines.setCellWidget(row, 2, spin_price)
+        chk_remove = QCheckBox()
+        self.tbl_lines.setCellWidget(row, 3, chk_remove)
+        self.tbl_lines.setItem(row, 4, QTableWidgetItem(note))
+        self._rows.append((source, spin_qty, spin_price, chk_remove))
+
+    def add_item(self):
+        barcode = self.in_add_barcode.text().strip()
+        if not barcode:
+            return
+        item = self.lookup_item(barcode)
+        if item is None:
+            QMessageBox.warning(self, "خطأ", "لم يتم العثور على الصنف")
+            return
+        self._add_row(item, item.name, self.in_add_qty.value(), item.price, "جديد")
+        self.in_add_barcode.clear()
+        self.in_add_qty.setValue(1.0)
+
+    def accept_with_changes(self):
+        edits, removals, additions = {}, [], []
+        for source, spin_qty, spin_price, chk_remove in self._rows:
+            qty = spin_qty.value()
+            price = to_minor(spin_price.value())
+            is_new = not isinstance(source, SaleLine)
+            if chk_remove.isChecked():
+                if not is_new:
+                    removals.append(source.id)
+                continue
+            if qty <= 0:
+                QMessageBox.warning(self, "خطأ", "يرجى إدخال كمية صحيحة")
+                return
+            if is_new:
+                additions.append(BillLine(source.id, source.name, source.barcode, price, qty,
+                                          line_total(price, qty), source.purchase_price))
+            elif qty != source.quantity or price != source.price_each:
+                edits[source.id] = (qty, price)
+        if edits or removals or additions:
+            self.changes = {"edits": edits, "removals": removals, "additions": additions,
+                            "note": self.in_note.text().strip() or None}
+        self.accept()
+
 class MainUI(QMainWindow):
     def __init__(self):
         super().__init__()
         self.setWindowTitle("نظام إدارة المبيعات والمخزون")
         self.resize(1200, 700)
         
-        # Set application style
-        self.setStyleSheet("""
-            QMainWindow {
-                background-color: #f8f9fa;
-            }
-            QWidget {
-                font-family: 'Segoe UI', Arial, sans-serif;
-                font-size: 12px;
-            }
-            QLabel {
-                color: #212529;
-                font-weight: bold;
-            }
-        """)
-        
         # Central widget and main layout
         central_widget = QWidget()
         self.setCentralWidget(central_widget)
@@ -418,28 +326,22 @@ class MainUI(QMainWindow):
         # Title label
         self.lbl_title = QLabel("نظام إدارة المبيعات والمخزون")
         self.lbl_title.setAlignment(Qt.AlignCenter)
-        self.lbl_title.setStyleSheet("""
-            QLabel {
-                font-size: 24px;
-                font-weight: bold;
-                color: #007bff;
-                padding: 10px;
-                background-color: white;
-                border-radius: 4px;
-                border: 1px solid #dee2e6;
-            }
-        """)
+        self.lbl_title.setObjectName("title")
         main_layout.addWidget(self.lbl_title)
         
         # Tab widget
         self.tabs = ModernTabWidget()
         main_layout.addWidget(self.tabs)
         
-        # Create tabs
+        # Create tabs: the bill tab now, the others empty until first shown (see ensure_tab)
+        self._tab_builders = {}
         self._create_bill_tab()
-        self._create_stock_tab()
-        self._create_sales_tab()
-        self._create_settings_tab()
+        self.stock_tab = self._add_lazy_tab("المخزون", self._create_stock_tab)
+        self.receipt_tab = self._add_lazy_tab("الاستلام", self._create_receipt_tab)
+        self.sales_tab = self._add_lazy_tab("المبيعات", self._create_sales_tab)
+        self.reports_tab = self._add_lazy_tab("التقارير", self._create_reports_tab)
+        self.settings_tab = self._add_lazy_tab("الإعدادات", self._create_settings_tab)
+        self.tabs.currentChanged.connect(lambda index: self.ensure_tab(self.tabs.widget(index)))
         
         # Set Arabic font
         self._arabic_font = QFont("Segoe UI", 11)
@@ -450,6 +352,25 @@ class MainUI(QMainWindow):
         self.bill_name_font = QFont("Segoe UI", 12)
         self.bill_name_font.setBold(True)
 
+    def _add_lazy_tab(self, title, builder):
+        page = QWidget()
+        self._tab_builders[page] = builder
+        self.tabs.addTab(page, title)
+        return page
+
+    def is_tab_built(self, page):
+        return page not in self._tab_builders
+
+    def ensure_tab(self, page):
+        """Build the widgets of a lazily created tab if that was not done yet"""
+        builder = self._tab_builders.pop(page, None)
+        if builder is not None:
+            builder()
+            self.on_tab_built(page)
+
+    def on_tab_built(self, page):
+        """Called once per lazily created tab, right after its widgets were built"""
+
     def _create_bill_tab(self):
         bill_tab = QWidget()
         bill_layout = QVBoxLayout(bill_tab)
@@ -461,12 +382,14 @@ class MainUI(QMainWindow):
         # Barcode input
         input_layout.addWidget(QLabel("باركود:"), 0, 0)
         self.in_barcode = ModernLineEdit()
+        self.in_barcode.setObjectName("barcode_field")
         self.in_barcode.setPlaceholderText("أدخل الباركود أو امسحه")
         input_layout.addWidget(self.in_barcode, 0, 1)
         
         # Name input
         input_layout.addWidget(QLabel("اسم الصنف:"), 1, 0)
         self.in_name = ModernLineEdit()
+        self.in_name.setObjectName("name_field")
         self.in_name.setPlaceholderText("اسم الصنف")
         input_layout.addWidget(self.in_name, 1, 1)
         
@@ -514,9 +437,10 @@ class MainUI(QMainWindow):
         # Total label and buttons
         bottom_layout = QHBoxLayout()
         self.lbl_total = QLabel("الإجمالي: 0.00")
-        self.lbl_total.setStyleSheet("font-size: 16px; font-weight: bold; color: #007bff;")
+        set_role(self.lbl_total, "total")
         
         self.btn_bill_remove = ModernButton("حذف المحدد")
+        self.btn_bill_remove.setObjectName("danger")
         self.btn_bill_save = ModernButton("حفظ الفاتورة")
         self.btn_print_bill = ModernButton("طباعة الفاتورة")
         
@@ -531,8 +455,7 @@ class MainUI(QMainWindow):
         self.tabs.addTab(bill_tab, "فاتورة جديدة")
 
     def _create_stock_tab(self):
-        stock_tab = QWidget()
-        stock_layout = QHBoxLayout(stock_tab)
+        stock_layout = QHBoxLayout(self.stock_tab)
         
         # Left side - form
         form_widget = QWidget()
@@ -600,7 +523,7 @@ class MainUI(QMainWindow):
         form_group_layout.addWidget(QLabel("معاينة:"), 7, 0)
         self.lbl_preview = QLabel()
         self.lbl_preview.setFixedSize(150, 150)
-        self.lbl_preview.setStyleSheet("border: 1px solid #ced4da; background-color: white;")
+        self.lbl_preview.setObjectName("preview")
         self.lbl_preview.setAlignment(Qt.AlignCenter)
         form_group_layout.addWidget(self.lbl_preview, 7, 1)
         
@@ -609,12 +532,15 @@ class MainUI(QMainWindow):
         self.btn_stk_add = ModernButton("إضافة")
         self.btn_stk_update = ModernButton("تعديل")
         self.btn_stk_delete = ModernButton("حذف")
+        self.btn_stk_delete.setObjectName("danger")
         self.btn_stk_refresh = ModernButton("تحديث")
+        self.btn_stk_import = ModernButton("استيراد CSV")
         
         btn_layout.addWidget(self.btn_stk_add)
         btn_layout.addWidget(self.btn_stk_update)
         btn_layout.addWidget(self.btn_stk_delete)
         btn_layout.addWidget(self.btn_stk_refresh)
+        btn_layout.addWidget(self.btn_stk_import)
         
         form_group_layout.addLayout(btn_layout, 8, 0, 1, 2)
         
@@ -642,12 +568,68 @@ class MainUI(QMainWindow):
         # Add both sides to main layout
         stock_layout.addWidget(form_widget, 1)
         stock_layout.addWidget(table_widget, 2)
+
+    def _create_receipt_tab(self):
+        receipt_layout = QVBoxLayout(self.receipt_tab)
+        
+        # Delivery header and scan input
+        input_group = ModernGroupBox("استلام بضاعة")
+        input_layout = QGridLayout(input_group)
+        
+        input_layout.addWidget(QLabel("المورد:"), 0, 0)
+        self.rcv_supplier = ModernComboBox()
+        self.rcv_supplier.setEditable(True)
+        input_layout.addWidget(self.rcv_supplier, 0, 1)
+        
+        input_layout.addWidget(QLabel("رقم الوصل:"), 0, 2)
+        self.rcv_reference = ModernLineEdit()
+        input_layout.addWidget(self.rcv_reference, 0, 3)
         
-        self.tabs.addTab(stock_tab, "المخزون")
+        input_layout.addWidget(QLabel("باركود:"), 1, 0)
+        self.rcv_barcode = ModernLineEdit()
+        self.rcv_barcode.setPlaceholderText("امسح الأصناف واحدًا تلو الآخر")
+        input_layout.addWidget(self.rcv_barcode, 1, 1)
+        
+        input_layout.addWidget(QLabel("الكمية لكل مسح:"), 1, 2)
+        self.rcv_qty = ModernDoubleSpinBox()
+        self.rcv_qty.setMaximum(99999.99)
+        self.rcv_qty.setValue(1.0)
+        input_layout.addWidget(self.rcv_qty, 1, 3)
+        
+        input_layout.addWidget(QLabel("سعر الشراء (0 = الحالي):"), 2, 0)
+        self.rcv_cost = ModernDoubleSpinBox()
+        self.rcv_cost.setMaximum(999999.99)
+        self.rcv_cost.setDecimals(2)
+        input_layout.addWidget(self.rcv_cost, 2, 1)
+        
+        receipt_layout.addWidget(input_group)
+        
+        # Lines of the delivery being received
+        lines_group = ModernGroupBox("أصناف الاستلام")
+        lines_layout = QVBoxLayout(lines_group)
+        
+        self.tbl_receipt = ModernTable(0, 5)
+        self.tbl_receipt.setHorizontalHeaderLabels(["باركود", "الصنف", "الكمية", "سعر الشراء", "المجموع"])
+        self.tbl_receipt.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        lines_layout.addWidget(self.tbl_receipt)
+        
+        bottom_layout = QHBoxLayout()
+        self.lbl_receipt_total = QLabel("الإجمالي: 0")
+        set_role(self.lbl_receipt_total, "total")
+        self.btn_rcv_remove = ModernButton("حذف المحدد")
+        self.btn_rcv_remove.setObjectName("danger")
+        self.btn_rcv_clear = ModernButton("إفراغ")
+        self.btn_rcv_save = ModernButton("حفظ الاستلام")
+        bottom_layout.addWidget(self.lbl_receipt_total)
+        bottom_layout.addWidget(self.btn_rcv_remove)
+        bottom_layout.addWidget(self.btn_rcv_clear)
+        bottom_layout.addWidget(self.btn_rcv_save)
+        lines_layout.addLayout(bottom_layout)
+        
+        receipt_layout.addWidget(lines_group)
 
     def _create_sales_tab(self):
-        sales_tab = QWidget()
-        sales_layout = QVBoxLayout(sales_tab)
+        sales_layout = QVBoxLayout(self.sales_tab)
         
         sales_group = ModernGroupBox("الفواتير المحفوظة")
         sales_group_layout = QVBoxLayout(sales_group)
@@ -667,21 +649,92 @@ class MainUI(QMainWindow):
         self.btn_sale_delete.setEnabled(False)
         self.btn_sale_print = ModernButton("طباعة الفاتورة")
         self.btn_sale_print.setEnabled(False)
+        self.btn_sale_amend = ModernButton("تعديل الفاتورة")
+        self.btn_sale_amend.setEnabled(False)
+        self.chk_sales_archive = QCheckBox("عرض السنوات المؤرشفة")
         
         btn_layout.addWidget(self.btn_sale_refresh)
         btn_layout.addWidget(self.btn_sale_view)
+        btn_layout.addWidget(self.btn_sale_amend)
         btn_layout.addWidget(self.btn_sale_delete)
         btn_layout.addWidget(self.btn_sale_print)
         btn_layout.addStretch()
+        btn_layout.addWidget(self.chk_sales_archive)
         
         sales_group_layout.addLayout(btn_layout)
         sales_layout.addWidget(sales_group)
-        
-        self.tabs.addTab(sales_tab, "المبيعات")
+
+    def _create_reports_tab(self):
+        reports_layout = QVBoxLayout(self.reports_tab)
+        
+        # Filters
+        filters_group = ModernGroupBox("خيارات التقرير")
+        filters_layout = QHBoxLayout(filters_group)
+        filters_layout.addWidget(QLabel("الفترة (أيام، 0 = الكل):"))
+        self.rep_days = QSpinBox()
+        self.rep_days.setRange(0, 3650)
+        self.rep_days.setValue(30)
+        filters_layout.addWidget(self.rep_days)
+        filters_layout.addWidget(QLabel("الترتيب حسب:"))
+        self.rep_metric = ModernComboBox()
+        self.rep_metric.addItem("الإيرادات", "revenue")
+        self.rep_metric.addItem("الربح", "profit")
+        self.rep_metric.addItem("الكمية", "units")
+        filters_layout.addWidget(self.rep_metric)
+        filters_layout.addWidget(QLabel("عدد الأصناف:"))
+        self.rep_top_n = QSpinBox()
+        self.rep_top_n.setRange(5, 500)
+        self.rep_top_n.setValue(20)
+        filters_layout.addWidget(self.rep_top_n)
+        filters_layout.addWidget(QLabel("راكد منذ (أيام):"))
+        self.rep_dead_days = QSpinBox()
+        self.rep_dead_days.setRange(1, 3650)
+        self.rep_dead_days.setValue(30)
+        filters_layout.addWidget(self.rep_dead_days)
+        self.btn_rep_refresh = ModernButton("تحديث")
+        filters_layout.addWidget(self.btn_rep_refresh)
+        filters_layout.addStretch()
+        reports_layout.addWidget(filters_group)
+        
+        # One sub-tab per report
+        self.rep_tabs = ModernTabWidget()
+        
+        self.tbl_rep_top = ModernTable(0, 5)
+        self.tbl_rep_top.setHorizontalHeaderLabels(["الصنف", "الباركود", "الكمية", "الإيرادات", "الربح"])
+        self.tbl_rep_top.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.rep_tabs.addTab(self.tbl_rep_top, "الأكثر مبيعًا")
+        
+        self.tbl_rep_dead = ModernTable(0, 5)
+        self.tbl_rep_dead.setHorizontalHeaderLabels(["الصنف", "الباركود", "المخزون", "آخر بيع", "قيمة المخزون"])
+        self.tbl_rep_dead.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.rep_tabs.addTab(self.tbl_rep_dead, "المخزون الراكد")
+        
+        self.tbl_rep_reorder = ModernTable(0, 6)
+        self.tbl_rep_reorder.setHorizontalHeaderLabels(
+            ["الصنف", "الباركود", "المخزون", "المبيعات اليومية", "أيام التغطية", "الكمية المقترحة"])
+        self.tbl_rep_reorder.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.rep_tabs.addTab(self.tbl_rep_reorder, "إعادة الطلب")
+        
+        self.tbl_rep_margin = ModernTable(0, 6)
+        self.tbl_rep_margin.setHorizontalHeaderLabels(["الفئة", "الكمية", "الإيرادات", "التكلفة", "الربح", "هامش الربح"])
+        self.tbl_rep_margin.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.rep_tabs.addTab(self.tbl_rep_margin, "الربح حسب الفئة")
+        
+        # Weekday x hour grid; cell text is the number of bills, shade is revenue
+        self.tbl_rep_heatmap = ModernTable(7, 24)
+        self.tbl_rep_heatmap.setHorizontalHeaderLabels([str(h) for h in range(24)])
+        self.tbl_rep_heatmap.setVerticalHeaderLabels(
+            ["الأحد", "الإثنين", "الثلاثاء", "الأربعاء", "الخميس", "الجمعة", "السبت"])
+        self.tbl_rep_heatmap.verticalHeader().setVisible(True)
+        self.tbl_rep_heatmap.setAlternatingRowColors(False)
+        self.tbl_rep_heatmap.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.tbl_rep_heatmap.verticalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.rep_tabs.addTab(self.tbl_rep_heatmap, "المبيعات حسب الساعة")
+        
+        reports_layout.addWidget(self.rep_tabs)
 
     def _create_settings_tab(self):
-        settings_tab = QWidget()
-        settings_layout = QVBoxLayout(settings_tab)
+        settings_layout = QVBoxLayout(self.settings_tab)
         
         settings_group = ModernGroupBox("إعدادات المتجر")
         settings_group_layout = QGridLayout(settings_group)
@@ -707,14 +760,29 @@ class MainUI(QMainWindow):
         self.sett_currency.setMaxLength(5)
         settings_group_layout.addWidget(self.sett_currency, 3, 1)
         
+        # Theme (applied as soon as it is picked)
+        settings_group_layout.addWidget(QLabel("المظهر:"), 4, 0)
+        self.sett_theme = ModernComboBox()
+        for theme, title in THEME_NAMES.items():
+            self.sett_theme.addItem(title, theme)
+        settings_group_layout.addWidget(self.sett_theme, 4, 1)
+        
         # Save button
         self.btn_settings_save = ModernButton("حفظ الإعدادات")
-        settings_group_layout.addWidget(self.btn_settings_save, 4, 0, 1, 2)
+        settings_group_layout.addWidget(self.btn_settings_save, 5, 0, 1, 2)
         
         settings_layout.addWidget(settings_group)
-        settings_layout.addStretch()
         
-        self.tabs.addTab(settings_tab, "الإعدادات")
+        # Performance / diagnostics
+        perf_group = ModernGroupBox("أداء قاعدة البيانات")
+        perf_layout = QHBoxLayout(perf_group)
+        self.btn_settings_perf = ModernButton("عرض إحصاءات الاستعلامات")
+        self.btn_settings_perf_reset = ModernButton("تصفير الإحصاءات")
+        perf_layout.addWidget(self.btn_settings_perf)
+        perf_layout.addWidget(self.btn_settings_perf_reset)
+        perf_layout.addStretch()
+        settings_layout.addWidget(perf_group)
+        settings_layout.addStretch()
 
     def set_preview_image(self, path):
         if path and os.path.exists(path):
@@ -733,7 +801,9 @@ class MainUI(QMainWindow):
 if __name__ == "__main__":
     import sys
     from PyQt5.QtWidgets import QApplication
+    import qss
     app = QApplication(sys.argv)
+    qss.apply_theme(app, qss.DEFAULT_THEME)
     window = MainUI()
     window.show()
     sys.exit(app.exec_())
\ No newline at end of file